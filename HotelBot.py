@@ -1,1251 +1,4188 @@
 import telebot
-from telebot import types, async_telebot
-from datetime import datetime
+from telebot import types, async_telebot, asyncio_helper
+from datetime import datetime, date, timedelta
+import abc
+import bisect
+import copy
+import csv
 import functools
+import gzip
+import heapq
+import itertools
 import json
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import signal
+import struct
+import tempfile
+import sys
+import threading
 import random
+import sqlite3
+import time
 import asyncio
+import weakref
+import zlib
 import aiohttp
-from collections.abc import Callable
-from telebot.types import Message, CallbackQuery
+from collections import OrderedDict, Counter, deque
+from collections.abc import Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from telebot.types import Message, CallbackQuery, InlineQuery
 
 
-class HotelBot:
+class CityIndex:
     """
-    Телеграм-бот, работающий с HotelAPI для поиска отелей.
-
-    Args:
-      telegram_token (str): токен телеграм-бота.
-      api_key (str): ключ для HotelAPI.
+    Локальный префиксный индекс городов, которые бот уже находил через https://hotels4.p.rapidapi.com/locations/v3/search.
+    Хранит отсортированный массив пар (название, gaiaId), поиск по префиксу выполняется двоичным поиском.
     """
 
-    # ---------------------------------------------[__init__]---------------------------------------------<Begin>
-
-    def __init__(self, telegram_token: str, api_key: str) -> None:
-        self.__bot = async_telebot.AsyncTeleBot(telegram_token)
-        self.__api_key = api_key
-        self.__data = dict()
-        self.__history = dict()
-        self.__last_keyboard_id = dict()
-        self.__next_message_handler_data = dict()
-        self.__bestdeal_settings = dict()
-        self.__main_settings = dict()
+    def __init__(self) -> None:
+        self.__keys = []
+        self.__cities = dict()
+        self.__searched = set()
 
-        # Handlers
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Метод, приводящий название к виду, в котором оно хранится в индексе.
 
-        @self.__bot.message_handler(func=lambda message: message.chat.id in self.__next_message_handler_data.keys())
-        async def _next_step_handler(message: Message) -> None:
-            await self.__next_step_handler(message)
+        :param:
+          text (str): название.
+        """
+        return ' '.join(text.lower().replace('ё', 'е').split())
 
-        @self.__bot.message_handler(commands=['start', 'help'])
-        async def _start(message: Message) -> None:
-            await self.__start(message)
+    def add(self, gaia_id: str, display_name: str, *names: str) -> None:
+        """
+        Метод, добавляющий город в индекс.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'ec_no')
-        async def _callback_ec_no(call: CallbackQuery) -> None:
-            await self.__callback_ec_no(call)
+        :param:
+          gaia_id (str): id города.
+          display_name (str): название для вывода.
+          names (list): дополнительные названия, по которым город ищется.
+        """
+        self.__cities[gaia_id] = display_name
+        for name in (display_name,) + names:
+            key = (self.normalize(name), gaia_id)
+            i = bisect.bisect_left(self.__keys, key)
+            if i == len(self.__keys) or self.__keys[i] != key:
+                self.__keys.insert(i, key)
+
+    def search(self, prefix: str, limit: int) -> list:
+        """
+        Метод, возвращающий до limit городов, одно из названий которых начинается с prefix.
 
-        @self.__bot.message_handler(commands=['reg'])
-        async def _reg(message: Message) -> None:
-            await self.__reg(message)
+        :param:
+          prefix (str): начало названия.
+          limit (int): максимальное количество городов.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'checkIn')
-        async def _callback_checkIn(call: CallbackQuery) -> None:
-            await self.__callback_checkIn(call)
+        :return:
+          cities (list[tuple]): пары (gaiaId, название для вывода).
+        """
+        prefix = self.normalize(prefix)
+        cities = dict()
+        i = bisect.bisect_left(self.__keys, (prefix,))
+        while i < len(self.__keys) and len(cities) < limit and self.__keys[i][0].startswith(prefix):
+            cities[self.__keys[i][1]] = self.__cities[self.__keys[i][1]]
+            i += 1
+        return list(cities.items())
+
+    def find(self, name: str) -> list:
+        """
+        Метод, возвращающий города, одно из названий которых совпадает с name.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'checkOut')
-        async def _callback_checkOut(call: CallbackQuery) -> None:
-            await self.__callback_checkOut(call)
+        :param:
+          name (str): название.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('room'))
-        async def _callback_room(call: CallbackQuery) -> None:
-            await self.__callback_room(call)
+        :return:
+          cities (list[tuple]): пары (gaiaId, название для вывода).
+        """
+        name = self.normalize(name)
+        cities = []
+        i = bisect.bisect_left(self.__keys, (name,))
+        while i < len(self.__keys) and self.__keys[i][0] == name:
+            cities.append((self.__keys[i][1], self.__cities[self.__keys[i][1]]))
+            i += 1
+        return cities
+
+    def dump(self) -> dict:
+        """
+        Метод, возвращающий содержимое индекса для load.
+        """
+        names = dict()
+        for name, gaia_id in self.__keys:
+            names.setdefault(gaia_id, []).append(name)
+        return {'cities': [[gaia_id, display_name, *names[gaia_id]] for gaia_id, display_name in self.__cities.items()],
+                'searched': list(self.__searched)}
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'add_room')
-        async def _callback_add_room(call: CallbackQuery) -> None:
-            await self.__callback_add_room(call)
+    def load(self, dump: dict) -> None:
+        """
+        Метод, добавляющий в индекс содержимое другого индекса (результат dump).
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'reset')
-        async def _callback_reset(call: CallbackQuery) -> None:
-            await self.__callback_reset(call)
+        :param:
+          dump (dict): содержимое индекса.
+        """
+        for city in dump['cities']:
+            self.add(*city)
+        self.__searched.update(dump['searched'])
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'exit_reg')
-        async def _callback_exit_reg(call: CallbackQuery) -> None:
-            await self.__callback_exit_reg(call)
+    def mark_searched(self, query: str) -> None:
+        """
+        Метод, запоминающий, что запрос query уже отправлялся в API.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('adult'))
-        async def _callback_adult(call: CallbackQuery) -> None:
-            await self.__callback_adult(call)
+        :param:
+          query (str): запрос.
+        """
+        self.__searched.add(self.normalize(query))
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('child'))
-        async def _callback_child(call: CallbackQuery) -> None:
-            await self.__callback_child(call)
+    def searched(self, query: str) -> bool:
+        """
+        Метод, проверяющий, отправлялся ли запрос query в API.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('remove_child'))
-        async def _callback_remove_child(call: CallbackQuery) -> None:
-            await self.__callback_remove_child(call)
+        :param:
+          query (str): запрос.
+        """
+        return self.normalize(query) in self.__searched
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('add_child'))
-        async def _callback_add_child(call: CallbackQuery) -> None:
-            await self.__callback_add_child(call)
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('remove_room'))
-        async def _callback_remove_room(call: CallbackQuery) -> None:
-            await self.__callback_remove_room(call)
+class PhotoCache:
+    """
+    Ограниченный по размеру (LRU) кэш file_id фотографий, уже отправленных в Telegram, сохраняемый в файл.
+    Повторная отправка по file_id не требует от Telegram заново скачивать фото по ссылке.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'exit_room')
-        async def _callback_exit_room(call: CallbackQuery) -> None:
-            await self.__callback_exit_room(call)
+    Args:
+      path (str): путь к файлу кэша. Если None, кэш не сохраняется.
+      size (int): максимальное количество фото в кэше.
+    """
 
-        @self.__bot.message_handler(commands=['lowprice', 'highprice', 'bestdeal'])
-        async def _main_commands(message: Message) -> None:
-            await self.__main_commands(message)
+    def __init__(self, path: str, size: int) -> None:
+        self.__path = path
+        self.__size = size
+        self.__file_ids = OrderedDict()
+        self.__changed = False
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('bestdeal_menu'))
-        async def _callback_bestdeal_menu(call: CallbackQuery) -> None:
-            await self.__callback_bestdeal_menu(call)
+        if path is None:
+            return
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('bestdeal_filters'))
-        async def _callback_bestdeal_filters(call: CallbackQuery) -> None:
-            await self.__callback_bestdeal_filters(call)
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.__file_ids.update(json.load(file)[-size:])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            print(err)
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'bestdeal_change_sort')
-        async def _callback_bestdeal_change_sort(call: CallbackQuery) -> None:
-            await self.__callback_bestdeal_change_sort(call)
+    def get(self, url: str, default: str = None) -> str:
+        """
+        Метод, возвращающий file_id фото по ссылке url.
 
-        @self.__bot.callback_query_handler(
-            func=lambda call: call.data.startswith('main_city') or call.data == 'bestdeal_exit')
-        async def _callback_main_city(call: CallbackQuery) -> None:
-            await self.__callback_main_city(call)
+        :param:
+          url (str): ссылка на фото.
+          default (str): значение, если фото нет в кэше.
+        """
+        file_id = self.__file_ids.get(url)
+        if file_id is None:
+            return default
+        self.__file_ids.move_to_end(url)
+        return file_id
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'photo_yes')
-        async def _callback_photo_yes(call: CallbackQuery) -> None:
-            await self.__callback_photo_yes(call)
+    def set(self, url: str, file_id: str) -> None:
+        """
+        Метод, запоминающий file_id фото по ссылке url.
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'photo_no')
-        async def _callback_photo_no(call: CallbackQuery) -> None:
-            await self.__callback_photo_no(call)
+        :param:
+          url (str): ссылка на фото.
+          file_id (str): file_id фото в Telegram.
+        """
+        if self.__file_ids.get(url) == file_id:
+            return
+        self.__file_ids[url] = file_id
+        self.__file_ids.move_to_end(url)
+        if len(self.__file_ids) > self.__size:
+            self.__file_ids.popitem(last=False)
+        self.__changed = True
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data == 'result_error')
-        async def _callback_result_error(call: CallbackQuery) -> None:
-            await self.__callback_result_error(call)
+    def discard(self, url: str) -> None:
+        """
+        Метод, удаляющий фото с ссылкой url из кэша.
 
-        @self.__bot.message_handler(commands=['history'])
-        async def _get_history(message: Message) -> None:
-            await self.__get_history(message)
+        :param:
+          url (str): ссылка на фото.
+        """
+        if self.__file_ids.pop(url, None) is not None:
+            self.__changed = True
 
-        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('h_photo'))
-        async def _callback_h_photo(message: Message) -> None:
-            await self.__callback_h_photo(message)
+    def items(self) -> list:
+        """
+        Метод, возвращающий содержимое кэша (пары ссылка, file_id).
+        """
+        return list(self.__file_ids.items())
 
-    # ---------------------------------------------[__init__]---------------------------------------------<End>
+    def snapshot(self) -> list:
+        """
+        Метод, возвращающий содержимое кэша для write, если оно изменилось с прошлого вызова, иначе None.
+        """
+        if self.__path is None or not self.__changed:
+            return None
+        self.__changed = False
+        return list(self.__file_ids.items())
 
-    def __register_next_step_handler(self, message: Message, func: Callable, *args, **kwargs) -> None:
+    def write(self, items: list) -> None:
         """
-        Метод, реализующий telebot.TeleBot.register_next_step_handler для async_telebot.AsyncTeleBot.
+        Метод, записывающий содержимое кэша (результат snapshot) в файл. Может выполняться вне потока бота.
 
         :param:
-          message (Message): сообщение.
-          func (Callable): регистрируемая функция.
-          args (list), kwargs (dict): аргументы func.
+          items (list): содержимое кэша.
         """
-        self.__next_message_handler_data[message.chat.id] = [func, args, kwargs]
+        with open(self.__path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(items, file)
+        os.replace(self.__path + '.tmp', self.__path)
 
-    async def __next_step_handler(self, message: Message) -> None:
+
+class ResponseCache(abc.ABC):
+    """
+    Асинхронный кэш ответов API с временем жизни записей. Хранилище выбирается по адресу (см. open); кэши в Redis
+    и SQLite могут использовать несколько процессов и копий бота. Значения в них хранятся в формате pack (JSON):
+    запись в общем хранилище не должна позволять выполнить код в боте, как pickle.
+    """
+
+    # Размер (байт), начиная с которого сериализованное значение сжимается.
+    COMPRESS_BYTES = 1024
+    # Байт формата: JSON и JSON, сжатый zlib. Значения других форматов (pickle прежних версий) считаются промахом.
+    JSON = b'\x02'
+    JSON_ZLIB = b'\x03'
+
+    @staticmethod
+    def open(url: str, size: int) -> 'ResponseCache':
         """
-        Метод, вызывающий зарегистрированную через __register_next_step_handler метод func.
+        Метод, создающий кэш по адресу url: None - в памяти процесса, 'sqlite:///путь' - в файле SQLite,
+        'redis://хост:порт/база' - в Redis.
 
         :param:
-          message (Message): сообщение.
+          url (str): адрес кэша.
+          size (int): максимальное количество записей кэша в памяти.
         """
-        func, args, kwargs = self.__next_message_handler_data.pop(message.chat.id)
-        await func(message, *args, **kwargs)
-
-    def __clear_step_handler_by_chat_id(self, chat_id: int) -> None:
+        if url is None:
+            return MemoryCache(size)
+        if url.startswith('sqlite:///'):
+            return SQLiteCache(url[len('sqlite:///'):])
+        if url.startswith('redis://'):
+            address, _, db = url[len('redis://'):].partition('/')
+            host, _, port = address.partition(':')
+            return RedisCache(host or 'localhost', int(port or 6379), int(db or 0))
+        raise ValueError(f'Неизвестный адрес кэша: {url}')
+
+    @staticmethod
+    def pack(value) -> bytes:
         """
-        Метод, реализующий telebot.TeleBot.clear_step_handler_by_chat_id для async_telebot.AsyncTeleBot.
+        Метод, сериализующий значение (ответ API): байт формата (JSON, JSON_ZLIB) и данные.
 
         :param:
-          chat_id (int): id чата.
+          value (Any): значение.
         """
-        try:
-            self.__next_message_handler_data.pop(chat_id)
-        except:
-            pass
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+        if len(data) >= ResponseCache.COMPRESS_BYTES:
+            return ResponseCache.JSON_ZLIB + zlib.compress(data)
+        return ResponseCache.JSON + data
 
-    def __callback_func(func: Callable) -> Callable:
+    @staticmethod
+    def unpack(data: bytes):
+        """
+        Метод, восстанавливающий значение, сериализованное pack. Для данных другого формата или поврежденных
+        возвращает None (промах кэша).
 
-        functools.wraps(func)
+        :param:
+          data (bytes): данные.
+        """
+        try:
+            if data[:1] == ResponseCache.JSON_ZLIB:
+                return json.loads(zlib.decompress(data[1:]))
+            if data[:1] == ResponseCache.JSON:
+                return json.loads(data[1:])
+        except (ValueError, zlib.error) as err:
+            print(err)
+        return None
 
-        async def wrapped_func(self, call: CallbackQuery) -> None:
-            self.__last_keyboard_id[call.message.chat.id] = None
+    async def get(self, key: str):
+        """
+        Метод, возвращающий значение по ключу key или None, если его нет или оно устарело.
 
-            try:
-                await self.__bot.delete_message(call.message.chat.id, call.message.id)
-                await func(self, call)
-            except Exception as err:
-                print(err)
-                await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
+        :param:
+          key (str): ключ.
+        """
+        return (await self.get_many([key]))[0]
 
-        wrapped_func.__name__ = func.__name__
-        wrapped_func.__doc__ = func.__doc__
-        return wrapped_func
+    async def set(self, key: str, value, ttl: float) -> None:
+        """
+        Метод, записывающий значение value по ключу key на ttl секунд.
 
-    def __command_func(func: Callable) -> Callable:
+        :param:
+          key (str): ключ.
+          value (Any): значение.
+          ttl (float): время жизни (сек).
+        """
+        await self.set_many([(key, value)], ttl)
 
-        functools.wraps(func)
+    @abc.abstractmethod
+    async def get_many(self, keys: list) -> list:
+        """
+        Метод, возвращающий значения по ключам keys (None для отсутствующих).
 
-        async def wrapped_func(self, message: Message) -> None:
-            try:
-                if self.__last_keyboard_id[message.chat.id] != None:
-                    await self.__bot.delete_message(message.chat.id, self.__last_keyboard_id[message.chat.id])
-            except:
-                pass
+        :param:
+          keys (list): ключи.
+        """
 
-            try:
-                if self.__history[message.chat.id][-1:].get('hotels') == None:
-                    self.__history[message.chat.id].pop(len(self.__history[message.chat.id]) - 1)
-            except:
-                pass
+    @abc.abstractmethod
+    async def set_many(self, items: list, ttl: float) -> None:
+        """
+        Метод, записывающий значения items (ключ, значение) на ttl секунд.
 
-            try:
-                await func(self, message)
-            except Exception as err:
-                print(err)
-                await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+        :param:
+          items (list): записи.
+          ttl (float): время жизни (сек).
+        """
 
-        wrapped_func.__name__ = func.__name__
-        wrapped_func.__doc__ = func.__doc__
-        return wrapped_func
+    async def close(self) -> None:
+        """
+        Метод, закрывающий соединение с хранилищем.
+        """
 
-    async def __start(self, message: Message) -> None:
+    def items(self) -> list:
         """
-        Метод, отвечающий командам (start, help).
+        Метод, возвращающий записи для снимка (см. MemoryCache.items). Внешние хранилища сохраняют записи сами.
+        """
+        return []
 
-        :param:
-          message (Message): сообщение.
+    def load(self, key: str, expires: float, value) -> bool:
         """
-        await self.__bot.send_message(message.chat.id,
-                                      "Вы можете ввести следующие комманды:\n\n/start или /help для получения помощи по командам.\n\n/reg для регистрации своих данных. Для использования основных команд (lowprice и т.д.) вам потребуется как минимум заполнить даты заселения и выселения.\n\n/lowprice для поиска самых дешевых отелей в желаемом городе.\n\n/highprice для поиска самых дорогих отелей в желаемом городе.\n\n/bestdeal для поиска самых дешевых и\\или самых близких к центру отелей в желаемом городе. Доступно 3 вида сортировки: по цене, по расстоянию, по цене и расстоянию.\n\n/history для вывода истории ваших поисков.")
+        Метод, добавляющий запись из снимка (см. MemoryCache.load).
+        """
+        return False
 
-    # -----------------------------------(errorContinue)-----------------------------------<Begin>
 
-    async def __errorContinue(self, chat_id: int, call_data: str) -> None:
+class MemoryCache(ResponseCache):
+    """
+    Кэш ответов API в памяти с ограничением размера (LRU) и временем жизни записей.
+    Значения хранятся без сериализации.
+
+    Args:
+      size (int): максимальное количество записей.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.__size = size
+        self.__items = OrderedDict()
+
+    async def get_many(self, keys: list) -> list:
+        now = time.time()
+        values = []
+        for key in keys:
+            item = self.__items.get(key)
+            if item is not None and item[0] < now:
+                del self.__items[key]
+                item = None
+            if item is not None:
+                self.__items.move_to_end(key)
+            values.append(item and item[1])
+        return values
+
+    async def set_many(self, items: list, ttl: float) -> None:
+        for key, value in items:
+            self.__items[key] = (time.time() + ttl, value)
+            self.__items.move_to_end(key)
+            if len(self.__items) > self.__size:
+                self.__items.popitem(last=False)
+
+    def items(self) -> list:
         """
-        Метод, который при возникновении ошибки во время ввода возвращает бота на предыдущий шаг с вызовом call_data или прерывает последовательность действий.
+        Метод, возвращающий неустаревшие записи (ключ, время устаревания, значение), начиная с последних использованных.
+        """
+        now = time.time()
+        return [(key, expires, value) for key, (expires, value) in reversed(self.__items.items()) if expires > now]
+
+    def load(self, key: str, expires: float, value) -> bool:
+        """
+        Метод, добавляющий запись из items как менее используемую, чем уже имеющиеся.
 
         :param:
-          chat_id (int): id чата.
-          call_data (str): название вызова.
+          key (str): ключ.
+          expires (float): время устаревания.
+          value (Any): значение.
+
+        :return:
+          loaded (bool): добавлена ли запись (не устарела, есть место и ключа еще нет).
         """
-        ec_keyboard = types.InlineKeyboardMarkup()
+        if expires <= time.time() or key in self.__items or len(self.__items) >= self.__size:
+            return False
+        self.__items[key] = (expires, value)
+        self.__items.move_to_end(key, last=False)
+        return True
 
-        # Button: call_data
-        ec_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data=call_data))
-        # Button: ec_no
-        ec_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='ec_no'))
 
-        self.__last_keyboard_id[chat_id] = (
-            await self.__bot.send_message(chat_id, "Ввести снова?", reply_markup=ec_keyboard)).id
+class SQLiteCache(ResponseCache):
+    """
+    Кэш ответов API в файле SQLite (для нескольких процессов на одном сервере). Запросы к базе выполняются
+    в отдельном потоке, устаревшие записи удаляются каждые PURGE_INTERVAL записей.
 
-    # Callback: ec_no
-    async def __callback_ec_no(self, call: CallbackQuery) -> None:
-        """
-        Метод, отвечающий кнопке ec_no.
+    Args:
+      path (str): путь к файлу базы.
+    """
 
-        :param:
-          call (CallbackQuery): вызов.
+    # Через сколько записей удаляются устаревшие записи и сколько ключей запрашивается одним запросом.
+    PURGE_INTERVAL = 1000
+    BATCH = 500
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+        self.__db = None
+        self.__writes = 0
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-cache')
+
+    async def __call(self, func: Callable, *args):
         """
-        self.__last_keyboard_id[call.message.chat.id] = None
+        Метод, выполняющий func(*args) в потоке базы.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
 
+    async def get_many(self, keys: list) -> list:
         try:
-            self.__main_settings.pop(call.message.chat.id)
-        except:
-            pass
+            return await self.__call(self.__get_many, keys)
+        except sqlite3.Error as err:
+            print(err)
+            return [None] * len(keys)
 
+    async def set_many(self, items: list, ttl: float) -> None:
+        items = [(key, time.time() + ttl, self.pack(value)) for key, value in items]
         try:
-            await self.__bot.delete_message(call.message.chat.id, call.message.id)
-        except Exception as err:
+            await self.__call(self.__set_many, items)
+        except sqlite3.Error as err:
             print(err)
-            await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
 
-    # -----------------------------------(errorContinue)-----------------------------------<End>
+    async def close(self) -> None:
+        await self.__call(self.__close)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__db is None:
+            self.__db = sqlite3.connect(self.__path, timeout=10)
+            self.__db.execute('PRAGMA journal_mode=WAL')
+            self.__db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value BLOB)')
+        return self.__db
+
+    def __get_many(self, keys: list) -> list:
+        found = dict()
+        now = time.time()
+        for i in range(0, len(keys), self.BATCH):
+            batch = keys[i:i + self.BATCH]
+            found.update((key, value) for key, value in self.__connect().execute(
+                f"SELECT key, value FROM cache WHERE expires > ? AND key IN ({','.join('?' * len(batch))})",
+                [now] + batch))
+        return [self.unpack(found[key]) if key in found else None for key in keys]
+
+    def __set_many(self, items: list) -> None:
+        with self.__connect() as db:
+            db.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', items)
+            self.__writes += len(items)
+            if self.__writes >= self.PURGE_INTERVAL:
+                self.__writes = 0
+                db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+    def __close(self) -> None:
+        if self.__db is not None:
+            self.__db.close()
+            self.__db = None
+
+
+class RedisCache(ResponseCache):
+    """
+    Кэш ответов API в Redis (общий для копий бота на разных серверах). Минимальный клиент протокола RESP
+    на asyncio: одно соединение, команды пакета отправляются вместе. При ошибке соединение открывается заново,
+    а запрос считается промахом кэша.
 
-    # ---------------------------------------------[/reg]---------------------------------------------<Begin>
+    Args:
+      host (str): хост Redis.
+      port (int): порт Redis.
+      db (int): номер базы.
+      prefix (str): префикс ключей.
+    """
 
-    # -----------------------------------(reg_menu)-----------------------------------<Begin>
+    def __init__(self, host: str, port: int, db: int = 0, prefix: str = 'hotelbot:') -> None:
+        self.__host = host
+        self.__port = port
+        self.__db = db
+        self.__prefix = prefix
+        self.__reader = None
+        self.__writer = None
+        self.__lock = asyncio.Lock()
 
-    @__command_func
-    async def __reg(self, message: Message) -> None:
-        """
-        Метод, открывающий меню регистрации.
+    async def get_many(self, keys: list) -> list:
+        try:
+            values = (await self.__execute(['MGET'] + [self.__prefix + key for key in keys]))[0]
+        except (OSError, EOFError, RuntimeError) as err:
+            print(err)
+            return [None] * len(keys)
+        return [None if value is None else self.unpack(value) for value in values]
+
+    async def set_many(self, items: list, ttl: float) -> None:
+        try:
+            await self.__execute(*[['SET', self.__prefix + key, self.pack(value), 'PX', int(ttl * 1000)]
+                                   for key, value in items])
+        except (OSError, EOFError, RuntimeError) as err:
+            print(err)
+
+    async def close(self) -> None:
+        async with self.__lock:
+            self.__disconnect()
+
+    async def __execute(self, *commands) -> list:
+        """
+        Метод, отправляющий команды одним пакетом и возвращающий их ответы.
 
         :param:
-          message (Message): сообщение.
+          commands (tuple): команды (списки аргументов).
         """
-        self.__data[message.chat.id] = self.__data.get(message.chat.id,
-                                                       {'in': None, 'out': None, 'rooms': [[1, []]], 'count': 1})
-        reg_keyboard = types.InlineKeyboardMarkup()
+        count = len(commands)
+        async with self.__lock:
+            try:
+                if self.__writer is None:
+                    self.__reader, self.__writer = await asyncio.open_connection(self.__host, self.__port)
+                    if self.__db:
+                        commands = (['SELECT', self.__db],) + commands
+                self.__writer.write(b''.join(map(self.__encode, commands)))
+                await self.__writer.drain()
+                replies = [await self.__read() for _ in commands]
+            except BaseException:
+                # После ошибки или отмены ответы в соединении не соответствуют командам.
+                self.__disconnect()
+                raise
+        return replies[len(replies) - count:]
+
+    def __disconnect(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+        self.__reader = self.__writer = None
+
+    @staticmethod
+    def __encode(command: list) -> bytes:
+        """
+        Метод, кодирующий команду в формате RESP.
+        """
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
 
-        # Button: checkIn, checkOut
-        reg_keyboard.row(types.InlineKeyboardButton(text='Въезд: ' + (
-            str(self.__data[message.chat.id]['in']) if self.__data[message.chat.id]['in'] else 'Неопределенно'),
-                                                    callback_data='checkIn'), types.InlineKeyboardButton(
-            text='Выезд: ' + (
-                str(self.__data[message.chat.id]['out']) if self.__data[message.chat.id]['out'] else 'Неопределенно'),
-            callback_data='checkOut'))
-        # Button: room[0..n]
-        row = []
-        for i, room in enumerate(self.__data[message.chat.id]['rooms']):
-            if len(row) == 2:
-                reg_keyboard.row(*row)
-                row.clear()
-            row.append(types.InlineKeyboardButton(text=f"Комната {i + 1}: {room[0]} взр, {len(room[1])} дет",
-                                                  callback_data=f'room{i}'))
-        reg_keyboard.row(*row)
-        # Button: add_room
-        if len(self.__data[message.chat.id]['rooms']) < 8 and self.__data[message.chat.id]['count'] < 20:
-            reg_keyboard.row(
-                types.InlineKeyboardButton(text='Добавить комнату (максимум 8 комнат)', callback_data='add_room'))
-        # Button: reset
-        reg_keyboard.row(types.InlineKeyboardButton(text='Сбросить информацию', callback_data='reset'))
-        # Button: exit_reg
-        reg_keyboard.row(types.InlineKeyboardButton(text='Готово', callback_data='exit_reg'))
+    async def __read(self):
+        """
+        Метод, читающий один ответ RESP.
+        """
+        line = await self.__reader.readuntil(b'\r\n')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            raise RuntimeError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            return None if int(data) < 0 else (await self.__reader.readexactly(int(data) + 2))[:-2]
+        if kind == b'*':
+            return None if int(data) < 0 else [await self.__read() for _ in range(int(data))]
+        raise RuntimeError(f'Неизвестный ответ Redis: {line!r}')
+
+
+class Quota:
+    """
+    Учет запросов к API за текущие сутки.
 
-        self.__last_keyboard_id[message.chat.id] = (await self.__bot.send_message(message.chat.id, (
-            'Достигнут максимум людей в комнатах.\n' if self.__data[message.chat.id][
-                                                            'count'] >= 20 else '') + "Ваша текущая информация:",
-                                                                                  reply_markup=reg_keyboard)).id
+    Args:
+      limit (int): максимальное количество запросов в сутки или None, если ограничения нет.
+    """
 
-        # Callback: checkIn
+    def __init__(self, limit: int) -> None:
+        self.__limit = limit
+        self.__day = date.today()
+        self.__used = 0
 
-    @__callback_func
-    async def __callback_checkIn(self, call: CallbackQuery) -> None:
+    def __today(self) -> None:
         """
-        Метод, отвечающий кнопке checkIn.
+        Метод, обнуляющий счетчик в начале новых суток.
+        """
+        if self.__day != date.today():
+            self.__day = date.today()
+            self.__used = 0
+
+    def spend(self, calls: int = 1) -> None:
+        """
+        Метод, учитывающий calls запросов.
 
         :param:
-          call (CallbackQuery): вызов.
+          calls (int): количество запросов.
         """
-        message = await self.__bot.send_message(call.message.chat.id, 'Введите дату заселения (dd.mm.yyyy):')
-        self.__register_next_step_handler(message, self.__checkIn)
+        self.__today()
+        self.__used += calls
 
-    # Method: checkIn
-    async def __checkIn(self, message: Message) -> None:
+    def used(self) -> int:
         """
-        Метод, выполняющий проверку и запись даты заселения.
+        Метод, возвращающий количество запросов за текущие сутки.
+        """
+        self.__today()
+        return self.__used
 
-        :param:
-          message (Message): сообщение.
+    def remaining(self) -> float:
         """
-        try:
-            result = datetime.strptime(message.text, '%d.%m.%Y').date()
-            if datetime.today().date() > result:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nДата заселения должна быть больше или равна сегодняшней дате.')
-            elif self.__data[message.chat.id]['out'] and self.__data[message.chat.id]['out'] < result:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна дате заселения.')
-            else:
-                self.__data[message.chat.id]['in'] = result
-        except ValueError:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
-        await self.__reg(message)
+        Метод, возвращающий количество оставшихся на текущие сутки запросов.
+        """
+        self.__today()
+        return float('inf') if self.__limit is None else max(0, self.__limit - self.__used)
 
-    # Callback: checkOut
-    @__callback_func
-    async def __callback_checkOut(self, call: CallbackQuery) -> None:
+
+class HistoryLog:
+    """
+    Хранилище истории поисков на диске. Для каждого чата ведется журнал {chat_id}.jsonl, в который записи только
+    дописываются, и индекс {chat_id}.idx с концом каждой записи в журнале (8 байт на запись).
+    Записи читаются через mmap по индексу, поэтому чтение страницы не зависит от размера истории.
+    Все операции с файлами выполняются по очереди в отдельном потоке и не блокируют бота.
+
+    Args:
+      path (str): папка с журналами.
+      keep (int): сколько последних записей чата оставлять при сжатии, None - хранить всю историю.
+    """
+
+    def __init__(self, path: str, keep: int) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.__path = path
+        self.__keep = keep
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+
+    def __files(self, chat_id: int) -> tuple:
         """
-        Метод, отвечающий кнопке checkOut.
+        Метод, возвращающий пути к журналу и индексу чата.
+        """
+        return os.path.join(self.__path, f'{chat_id}.jsonl'), os.path.join(self.__path, f'{chat_id}.idx')
 
-        :param:
-          call (CallbackQuery): вызов.
+    async def __call(self, func: Callable, *args):
         """
-        message = await self.__bot.send_message(call.message.chat.id, 'Введите дату выселения (dd.mm.yyyy):')
-        self.__register_next_step_handler(message, self.__checkOut)
+        Метод, выполняющий func в потоке хранилища.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
 
-    # Method: checkOut
-    async def __checkOut(self, message: Message) -> None:
+    async def append(self, chat_id: int, entry: dict) -> None:
         """
-        Метод, выполняющий проверку и запись даты выселения.
+        Метод, дописывающий запись entry в историю чата.
 
         :param:
-          message (Message): сообщение.
+          chat_id (int): id чата.
+          entry (dict): запись.
         """
-        try:
-            result = datetime.strptime(message.text, '%d.%m.%Y').date()
-            if datetime.today().date() > result:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна сегодняшней дате.')
-            elif self.__data[message.chat.id]['in'] and self.__data[message.chat.id]['in'] > result:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна дате заселения.')
-            else:
-                self.__data[message.chat.id]['out'] = result
-        except ValueError:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
-        await self.__reg(message)
+        await self.__call(self.__append, chat_id, json.dumps(entry, ensure_ascii=False, default=str).encode() + b'\n')
 
-    # Callback: room[0..n]
-    @__callback_func
-    async def __callback_room(self, call: CallbackQuery) -> None:
+    async def count(self, chat_id: int) -> int:
         """
-        Метод, отвечающий кнопке room[0..n].
+        Метод, возвращающий количество записей в истории чата.
 
         :param:
-          call (CallbackQuery): вызов.
+          chat_id (int): id чата.
         """
-        await self.__reg_room(call.message, int(call.data[4:]))
+        return await self.__call(self.__count, chat_id)
 
-    # Callback: add_room
-    @__callback_func
-    async def __callback_add_room(self, call: CallbackQuery) -> None:
+    async def page(self, chat_id: int, start: int, stop: int) -> list:
         """
-        Метод, отвечающий кнопке add_room.
+        Метод, возвращающий записи истории чата с индексами от start до stop (от старых к новым).
 
         :param:
-          call (CallbackQuery): вызов.
+          chat_id (int): id чата.
+          start (int): индекс первой записи.
+          stop (int): индекс после последней записи.
         """
-        if self.__data[call.message.chat.id]['count'] >= 20:
-            await self.__bot.send_message(call.message.chat.id,
-                                          '\U00002620 Ошибка.\U00002620 \nВ команте должен быть минимум 1 человек.\nЛюдей должно быть суммарно не больше 20.')
-        else:
-            self.__data[call.message.chat.id]['rooms'].append([1, []])
-            self.__data[call.message.chat.id]['count'] += 1
-        await self.__reg(call.message)
+        return await self.__call(self.__page, chat_id, start, stop)
 
-    # Callback: reset
-    @__callback_func
-    async def __callback_reset(self, call: CallbackQuery) -> None:
+    async def export(self, chat_id: int, path: str, fmt: str) -> int:
         """
-        Метод, отвечающий кнопке reset.
+        Метод, записывающий всю историю чата в файл path: csv - строка на каждый отель поиска, json - массив записей.
+        Записи читаются из журнала и пишутся в файл по одной, без загрузки всей истории в память.
 
         :param:
-          call (CallbackQuery): вызов.
+          chat_id (int): id чата.
+          path (str): путь к файлу.
+          fmt (str): формат (csv, json).
+
+        :return:
+          count (int): количество записанных поисков.
         """
-        self.__data[call.message.chat.id] = {'in': None, 'out': None, 'rooms': [[1, []]], 'count': 1}
-        await self.__reg(call.message)
+        return await self.__call(self.__export, chat_id, path, fmt)
 
-    # Callback: exit_reg
-    async def __callback_exit_reg(self, call: CallbackQuery) -> None:
+    async def compact(self, chats: Callable = None) -> None:
         """
-        Метод, отвечающий кнопке exit_reg.
+        Метод, сжимающий журналы чатов до keep последних записей (если keep задан).
 
         :param:
-          call (CallbackQuery): вызов.
+          chats (Callable): фильтр id чатов, журналы которых нужно сжать. По умолчанию - все чаты.
         """
-        self.__last_keyboard_id[call.message.chat.id] = None
+        await self.__call(self.__compact, chats)
 
+    def __count(self, chat_id: int) -> int:
+        """
+        Синхронная часть count.
+        """
         try:
-            await self.__bot.delete_message(call.message.chat.id, call.message.id)
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
-
-    # -----------------------------------(reg_menu)-----------------------------------<End>
-
-    # -----------------------------------(reg_room_menu)-----------------------------------<Begin>
+            return os.path.getsize(self.__files(chat_id)[1]) // 8
+        except FileNotFoundError:
+            return 0
 
-    async def __reg_room(self, message: Message, n: int) -> None:
+    def __append(self, chat_id: int, line: bytes) -> None:
         """
-        Метод, открывающий меню регистрации комнаты.
+        Синхронная часть append.
+        """
+        log_path, idx_path = self.__files(chat_id)
+        count = self.__count(chat_id)
+        with open(idx_path, 'ab+') as idx, open(log_path, 'ab+') as log:
+            if count:
+                idx.seek((count - 1) * 8)
+                end = struct.unpack('<Q', idx.read(8))[0]
+            else:
+                end = 0
+            # Отбрасываем остаток записи, которая не попала в индекс (например, при падении бота).
+            log.truncate(end)
+            log.write(line)
+            idx.truncate(count * 8)
+            idx.write(struct.pack('<Q', end + len(line)))
+
+    def __page(self, chat_id: int, start: int, stop: int) -> list:
+        """
+        Синхронная часть page.
+        """
+        log_path, idx_path = self.__files(chat_id)
+        start, stop = max(start, 0), min(stop, self.__count(chat_id))
+        if start >= stop:
+            return []
+
+        with open(idx_path, 'rb') as idx, mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ) as idx_map:
+            ends = struct.unpack(f'<{stop - start}Q', idx_map[start * 8:stop * 8])
+            begin = struct.unpack('<Q', idx_map[(start - 1) * 8:start * 8])[0] if start else 0
+        with open(log_path, 'rb') as log, mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            entries = []
+            for end in ends:
+                entries.append(json.loads(log_map[begin:end]))
+                begin = end
+        return entries
+
+    def __export(self, chat_id: int, path: str, fmt: str) -> int:
+        """
+        Синхронная часть export.
+        """
+        log_path, _ = self.__files(chat_id)
+        count = self.__count(chat_id)
 
-        :param:
-          message (Message): сообщение.
-          n (int): индекс комнаты.
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            if fmt == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(['command', 'time', 'name', 'price', 'dist', 'address', 'photoes'])
+            else:
+                file.write('[')
+            if count:
+                with open(log_path, 'rb') as log:
+                    for i, line in enumerate(itertools.islice(log, count)):
+                        if fmt == 'csv':
+                            entry = json.loads(line)
+                            for hotel in entry['hotels']:
+                                writer.writerow([entry['command'], entry['time'], hotel['name'], hotel['price'],
+                                                 hotel['dist'], hotel['address'], ' '.join(hotel['photoes'])])
+                        else:
+                            # Записи журнала уже в JSON: копируются без разбора.
+                            file.write((',\n' if i else '\n') + line.decode().rstrip('\n'))
+            if fmt != 'csv':
+                file.write('\n]\n')
+        return count
+
+    def __compact(self, chats: Callable) -> None:
         """
-        room_keyboard = types.InlineKeyboardMarkup()
+        Синхронная часть compact.
+        """
+        if self.__keep is None:
+            return
+        for name in os.listdir(self.__path):
+            if not name.endswith('.idx'):
+                continue
+            chat_id = int(name[:-4])
+            if chats and not chats(chat_id):
+                continue
+            count = self.__count(chat_id)
+            if count <= self.__keep:
+                continue
+
+            log_path, idx_path = self.__files(chat_id)
+            with open(idx_path, 'rb') as idx, mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ) as idx_map:
+                ends = struct.unpack(f'<{self.__keep + 1}Q', idx_map[(count - self.__keep - 1) * 8:count * 8])
+            with open(log_path, 'rb') as log, open(log_path + '.tmp', 'wb') as new_log:
+                log.seek(ends[0])
+                new_log.write(log.read(ends[-1] - ends[0]))
+            with open(idx_path + '.tmp', 'wb') as new_idx:
+                new_idx.write(struct.pack(f'<{self.__keep}Q', *(end - ends[0] for end in ends[1:])))
+            os.replace(log_path + '.tmp', log_path)
+            os.replace(idx_path + '.tmp', idx_path)
+
+
+class StackSampler:
+    """
+    Профилировщик, который из отдельного потока периодически снимает стек профилируемого потока (цикла событий бота)
+    и считает одинаковые стеки. Результат записывается в формате collapsed stacks ("кадр;кадр;... количество"),
+    который читают flamegraph.pl, speedscope и другие инструменты. Первым кадром каждого стека записывается обработчик
+    бота (внешний метод HotelBot в стеке), "idle", если цикл событий ждет событий, или "other".
 
-        # Button: adult[n]
-        room_keyboard.row(types.InlineKeyboardButton(text=f"Взрослых: {self.__data[message.chat.id]['rooms'][n][0]}.",
-                                                     callback_data=f'adult{n}'))
-        # Button: child[0..n]_[0..m]
-        row = []
-        for i, age in enumerate(self.__data[message.chat.id]['rooms'][n][1]):
-            if len(row) == 2:
-                room_keyboard.row(*row)
-                row.clear()
-            row.append(types.InlineKeyboardButton(text=f"Ребенок: {age if age > 0 else '< 1'} лет",
-                                                  callback_data=f'child{n}_{i}'))
-        room_keyboard.row(*row)
-        # Button: add_child[n]
-        if len(self.__data[message.chat.id]['rooms'][n][1]) < 6 and self.__data[message.chat.id]['count'] < 20:
-            room_keyboard.row(
-                types.InlineKeyboardButton(text="Добавить ребенка (максимум 6)", callback_data=f'add_child{n}'))
-        # Button: remove_room[n]
-        if len(self.__data[message.chat.id]['rooms']) > 1:
-            room_keyboard.row(types.InlineKeyboardButton(text="Удалить комнату", callback_data=f'remove_room{n}'))
-        # Button: exit_room
-        room_keyboard.row(types.InlineKeyboardButton(text="Назад", callback_data='exit_room'))
+    Args:
+      thread_id (int): id профилируемого потока.
+      interval (float): период (сек) снятия стека.
+    """
 
-        self.__last_keyboard_id[message.chat.id] = (await self.__bot.send_message(message.chat.id,
-                                                                                  f"Количетсво людей во всех комнатах {self.__data[message.chat.id]['count']} (максимум 20)\nКомната {n + 1}: {self.__data[message.chat.id]['rooms'][n][0]} взрослых, {len(self.__data[message.chat.id]['rooms'][n][1])} детей.",
-                                                                                  reply_markup=room_keyboard)).id
+    # Методы HotelBot, которые выполняют работу бота целиком или только передают сообщение обработчику шага
+    # (имена кадров не искажаются, поэтому без _HotelBot), и поэтому не считаются обработчиками.
+    RUNNERS = {'__init__', '__run', '__supervise', '__work', '__profile', '__next_step_handler'}
 
-    # Callback: adult[n]
-    @__callback_func
-    async def __callback_adult(self, call: CallbackQuery) -> None:
-        """
-        Метод, отвечающий кнопке adult[n].
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.__thread_id = thread_id
+        self.__interval = interval
+        self.__stacks = Counter()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample, name='StackSampler', daemon=True)
 
-        :param:
-          call (CallbackQuery): вызов.
+    def start(self) -> None:
+        """
+        Метод, запускающий снятие стеков.
         """
-        message = await self.__bot.send_message(call.message.chat.id, 'Введите количество взрослых:')
-        self.__register_next_step_handler(message, self.__set_adult, int(call.data[5:]))
+        self.__thread.start()
 
-    # Method: adult[n]
-    async def __set_adult(self, message: Message, n: int) -> None:
+    def stop(self) -> int:
         """
-        Метод, выполняющий проверку и запись количества взрослых в комнате n.
+        Метод, останавливающий снятие стеков.
 
-        :param:
-          message (Message): сообщение.
-          n (int): индекс комнаты.
+        :return:
+          samples (int): количество снятых стеков.
         """
-        try:
-            result = int(message.text)
-            if result < 1:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nТребуется минимум 1 взрослый в комнате.')
-            elif self.__data[message.chat.id]['count'] + result - self.__data[message.chat.id]['rooms'][n][0] > 20:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nЛюдей должно быть суммарно не больше 20.')
-            else:
-                self.__data[message.chat.id]['count'] += result - self.__data[message.chat.id]['rooms'][n][0]
-                self.__data[message.chat.id]['rooms'][n][0] = result
-        except ValueError:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
-        await self.__reg_room(message, n)
+        self.__stop.set()
+        self.__thread.join()
+        return sum(self.__stacks.values())
 
-    # Callback: child[n]_[0..m]
-    @__callback_func
-    async def __callback_child(self, call: CallbackQuery) -> None:
+    def write(self, path: str) -> None:
         """
-        Метод, отвечающий кнопке child[n]_[0..m].
+        Метод, записывающий снятые стеки в файл path.
 
         :param:
-          call (CallbackQuery): вызов.
+          path (str): путь к файлу.
         """
-        n, m = map(int, call.data[5:].split('_'))
-        child_keyboard = types.InlineKeyboardMarkup()
-
-        # Button: remove_child[n]_[m]
-        child_keyboard.row(
-            types.InlineKeyboardButton(text='Убрать выбранного ребенка.', callback_data=f"remove_child{n}_{m}"))
-
-        message = await self.__bot.send_message(call.message.chat.id,
-                                                'Введите возраст ребенка (от 0 до 17) в чат или уберите его, нажав на кнопку:',
-                                                reply_markup=child_keyboard)
-        self.__register_next_step_handler(message, self.__set_child, n, m, message)
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.__stacks.most_common():
+                file.write(f'{stack} {count}\n')
 
-    # Callback: remove_child[n]_[m]
-    @__callback_func
-    async def __callback_remove_child(self, call: CallbackQuery) -> None:
+    @staticmethod
+    def handler(frames: list) -> str:
         """
-        Метод, отвечающий кнопке remove_child[n]_[m].
+        Метод, определяющий, к какому обработчику относится стек.
 
         :param:
-          call (CallbackQuery): вызов.
-        """
-        n, m = map(int, call.data[12:].split('_'))
-        self.__data[call.message.chat.id]['rooms'][n][1].pop(m)
-        self.__data[call.message.chat.id]['count'] -= 1
-        self.__clear_step_handler_by_chat_id(call.message.chat.id)
-        await self.__reg_room(call.message, n)
+          frames (list): кадры стека от внешнего к текущему.
 
-    # Method: child[n]_[0..m]
-    async def __set_child(self, message: Message, n: int, m: int, msg: Message) -> None:
+        :return:
+          handler (str): имя обработчика, "idle" или "other".
         """
-        Метод, выполняющий проверку и запись возраста ребенка m из комнаты n.
-
+        for frame in frames:
+            name = frame.f_code.co_name
+            if frame.f_code.co_filename == __file__ and name.startswith('__') and name not in StackSampler.RUNNERS:
+                return name
+        if frames and os.path.basename(frames[-1].f_code.co_filename) == 'selectors.py':
+            return 'idle'
+        return 'other'
+
+    def __sample(self) -> None:
+        """
+        Метод потока профилировщика.
+        """
+        while not self.__stop.wait(self.__interval):
+            frame = sys._current_frames().get(self.__thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            if not frames:
+                continue
+            frames.reverse()
+            names = [f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})'
+                     for frame in frames]
+            self.__stacks[';'.join([self.handler(frames)] + names)] += 1
+            del frames
+
+
+class LoopMonitor:
+    """
+    Монитор задержки цикла событий: задача в цикле событий засыпает на interval секунд и измеряет, на сколько позже
+    она проснулась. Если цикл не отвечает дольше threshold секунд, поток-наблюдатель снимает стек цикла событий
+    и определяет обработчик (см. StackSampler.handler) и id чата, а после окончания блокировки она записывается в журнал.
+
+    Args:
+      interval (float): период (сек) измерения задержки.
+      threshold (float): задержка (сек), начиная с которой блокировка записывается в журнал.
+      samples (int): по скольким последним измерениям считаются перцентили.
+    """
+
+    def __init__(self, interval: float, threshold: float, samples: int) -> None:
+        self.__interval = interval
+        self.__threshold = threshold
+        self.__lags = deque(maxlen=samples)
+        self.__thread_id = None
+        self.__beat = time.monotonic()
+        self.__stall = None
+        self.__stop = threading.Event()
+        self.stalls = 0
+
+    async def run(self) -> None:
+        """
+        Метод, измеряющий задержку цикла событий, пока задача не будет отменена.
+        """
+        self.__thread_id = threading.get_ident()
+        self.__stop.clear()
+        threading.Thread(target=self.__watch, name='LoopMonitor', daemon=True).start()
+        try:
+            while True:
+                beat = self.__beat = time.monotonic()
+                await asyncio.sleep(self.__interval)
+                lag = max(0.0, time.monotonic() - beat - self.__interval)
+                self.__lags.append(lag)
+                if lag >= self.__threshold:
+                    self.stalls += 1
+                    _, handler, chat_id = self.__stall if self.__stall and self.__stall[0] == beat else (
+                        None, 'other', None)
+                    print(f'Цикл событий заблокирован на {lag:.3f} сек. Обработчик: {handler}, чат: {chat_id}.')
+        finally:
+            self.__stop.set()
+
+    def percentiles(self) -> dict:
+        """
+        Метод, возвращающий перцентили задержки цикла событий (сек) по последним измерениям.
+
+        :return:
+          percentiles (dict): {0.5: ..., 0.95: ..., 0.99: ..., 1: ...}.
+        """
+        lags = sorted(self.__lags)
+        return {q: lags[min(len(lags) - 1, int(q * len(lags)))] if lags else 0.0 for q in (0.5, 0.95, 0.99, 1)}
+
+    @staticmethod
+    def chat_id(frames: list) -> int:
+        """
+        Метод, ищущий id чата в локальных переменных кадров стека (chat_id, message, call, query).
+
+        :param:
+          frames (list): кадры стека от внешнего к текущему.
+
+        :return:
+          chat_id (int): id чата или None.
+        """
+        for frame in reversed(frames):
+            local = frame.f_locals
+            try:
+                if isinstance(local.get('chat_id'), int):
+                    return local['chat_id']
+                if isinstance(local.get('message'), Message):
+                    return local['message'].chat.id
+                if isinstance(local.get('call'), CallbackQuery):
+                    return local['call'].message.chat.id
+                if isinstance(local.get('query'), InlineQuery):
+                    return local['query'].from_user.id
+            except AttributeError:
+                pass
+        return None
+
+    def __watch(self) -> None:
+        """
+        Метод потока-наблюдателя.
+        """
+        while not self.__stop.wait(self.__threshold / 4):
+            beat = self.__beat
+            if time.monotonic() - beat < self.__interval + self.__threshold or (
+                    self.__stall and self.__stall[0] == beat):
+                continue
+            frame = sys._current_frames().get(self.__thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            self.__stall = (beat, StackSampler.handler(frames), self.chat_id(frames))
+            del frames
+
+
+class GeoIndex:
+    """
+    Пространственный индекс отелей для поиска ближайших: координаты отелей из ответов API раскладываются по сетке
+    ячеек CELL x CELL градусов, поэтому поиск просматривает только ячейки вокруг точки, а не все отели.
+    Цены зависят от дат и комнат поиска, поэтому хранятся отдельно по ключу поиска и устаревают через ttl секунд.
+    Для каждого ключа поиска запоминаются и круги, покрытые запросами к API по координатам (cover): в них известны
+    все отели, а вне их могут быть отели, которых нет в индексе.
+
+    Args:
+      ttl (float): время жизни (сек) цен.
+    """
+
+    # Размер ячейки сетки (градусов широты и долготы) и длина градуса широты (км).
+    CELL = 0.05
+    DEGREE = 111.2
+
+    def __init__(self, ttl: float) -> None:
+        self.__ttl = ttl
+        self.__points = dict()
+        self.__cells = dict()
+        self.__prices = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__points)
+
+    @staticmethod
+    def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """
+        Метод, возвращающий расстояние (км) между двумя точками по поверхности Земли.
+        """
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+    def __cell(self, lat: float, lon: float) -> tuple:
+        return math.floor(lat / self.CELL), math.floor(lon / self.CELL)
+
+    def __around(self, lat: float, lon: float, radius: float) -> list:
+        """
+        Метод, возвращающий ячейки, в которых могут быть точки на расстоянии до radius км от точки.
+        """
+        dlat = radius / self.DEGREE
+        dlon = radius / (self.DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        (lat_min, lon_min), (lat_max, lon_max) = self.__cell(lat - dlat, lon - dlon), self.__cell(lat + dlat,
+                                                                                                  lon + dlon)
+        return [(i, j) for i in range(lat_min, lat_max + 1) for j in range(lon_min, lon_max + 1)]
+
+    def __search(self, key: str):
+        """
+        Метод, возвращающий (время, цены, покрытые круги) поиска key или None, если их нет или они устарели.
+        """
+        search = self.__prices.get(key)
+        if search is None or search[0] < time.time() - self.__ttl:
+            return None
+        return search
+
+    def add(self, hotel_id: str, lat: float, lon: float) -> None:
+        """
+        Метод, добавляющий или перемещающий отель.
+
+        :param:
+          hotel_id (str): id отеля.
+          lat (float): широта.
+          lon (float): долгота.
+        """
+        cell = self.__cell(lat, lon)
+        old = self.__points.get(hotel_id)
+        if old is not None:
+            if old[2] == cell:
+                self.__points[hotel_id] = (lat, lon, cell)
+                return
+            self.__cells[old[2]].discard(hotel_id)
+        self.__points[hotel_id] = (lat, lon, cell)
+        self.__cells.setdefault(cell, set()).add(hotel_id)
+
+    def add_prices(self, key: str, hotels: dict) -> None:
+        """
+        Метод, добавляющий цены отелей для поиска key.
+
+        :param:
+          key (str): ключ поиска (даты и комнаты).
+          hotels (dict): (название, цена) по id отеля.
+        """
+        now = time.time()
+        prices = self.__prices.pop(key, None)
+        if prices is None or prices[0] < now - self.__ttl:
+            prices = (now, dict(), [])
+        else:
+            prices = (now, prices[1], prices[2])
+        prices[1].update(hotels)
+        self.__prices[key] = prices
+        # Цены хранятся в порядке обновления: устаревшие удаляются с начала.
+        while next(iter(self.__prices.values()))[0] < now - self.__ttl:
+            self.__prices.popitem(last=False)
+
+    def nearest(self, lat: float, lon: float, key: str, count: int, radius: float) -> list:
+        """
+        Метод, возвращающий до count ближайших к точке отелей в радиусе radius км, для которых есть цены поиска key.
+
+        :param:
+          lat (float): широта.
+          lon (float): долгота.
+          key (str): ключ поиска (даты и комнаты).
+          count (int): количество отелей.
+          radius (float): радиус (км).
+
+        :return:
+          hotels (list): (расстояние (км), id, название, цена) от ближних к дальним.
+        """
+        search = self.__search(key)
+        if search is None:
+            return []
+        prices = search[1]
+
+        found = []
+        for cell in self.__around(lat, lon, radius):
+            for hotel_id in self.__cells.get(cell, ()):
+                if hotel_id in prices:
+                    point = self.__points[hotel_id]
+                    dist = self.distance(lat, lon, point[0], point[1])
+                    if dist <= radius:
+                        found.append((dist, hotel_id) + tuple(prices[hotel_id]))
+        return heapq.nsmallest(count, found)
+
+    def cover(self, key: str, lat: float, lon: float, radius: float) -> None:
+        """
+        Метод, отмечающий, что для поиска key известны все отели на расстоянии до radius км от точки (ответ API
+        по координатам).
+
+        :param:
+          key (str): ключ поиска (даты и комнаты).
+          lat (float): широта.
+          lon (float): долгота.
+          radius (float): радиус (км).
+        """
+        self.add_prices(key, {})
+        covered, now = self.__prices[key][2], time.time()
+        covered[:] = [disc for disc in covered if disc[0] >= now - self.__ttl]
+        covered.append((now, lat, lon, radius))
+
+    def covered(self, lat: float, lon: float, key: str, radius: float) -> bool:
+        """
+        Метод, проверяющий, что для поиска key известны все отели на расстоянии до radius км от точки: этот круг
+        лежит внутри круга, покрытого запросом к API по координатам не раньше ttl секунд назад.
+
+        :param:
+          lat (float): широта.
+          lon (float): долгота.
+          key (str): ключ поиска (даты и комнаты).
+          radius (float): радиус (км).
+        """
+        search = self.__search(key)
+        if search is None:
+            return False
+        expired = time.time() - self.__ttl
+        return any(added >= expired and self.distance(center_lat, center_lon, lat, lon) + radius <= covered
+                   for added, center_lat, center_lon, covered in search[2])
+
+
+class HotelAPI:
+    """
+    Клиент HotelAPI (hotels4.p.rapidapi.com), который могут использовать несколько ботов одного процесса:
+    пул соединений, кэш ответов, учет квоты, выполняющиеся запросы и пул потоков обработки ответов у них общие.
+
+    Args:
+      api_key (str): ключ для HotelAPI или список ключей, которые используются по очереди.
+      daily_quota (int): ограничение количества запросов к API в сутки на один ключ (None - без ограничения).
+      cache (str): адрес кэша ответов API (см. ResponseCache.open).
+    """
+
+    # Время жизни (сек) ответов API в кэше по адресу запроса и максимальное количество ответов в кэше.
+    CACHE_TTL = {
+        "https://hotels4.p.rapidapi.com/locations/v3/search": 7 * 24 * 3600,
+        "https://hotels4.p.rapidapi.com/properties/v2/list": 15 * 60,
+        "https://hotels4.p.rapidapi.com/properties/v2/detail": 24 * 3600
+    }
+    CACHE_SIZE = 5000
+    # Максимальное количество одновременных соединений с API.
+    CONNECTIONS = 100
+    # Количество потоков для разбора больших ответов API и размер ответа (байт), начиная с которого он разбирается
+    # в этих потоках, а не в цикле событий.
+    OFFLOAD_WORKERS = 1
+    OFFLOAD_BYTES = 64 * 1024
+
+    def __init__(self, api_key, daily_quota: int = None, cache: str = None) -> None:
+        keys = [api_key] if isinstance(api_key, str) else list(api_key)
+        self.__keys = itertools.cycle(keys)
+        self.__inflight = dict()
+        self.__session = None
+        self.__cpu = ThreadPoolExecutor(max_workers=self.OFFLOAD_WORKERS, thread_name_prefix='offload')
+        self.quota = Quota(daily_quota and daily_quota * len(keys))
+        self.cache = ResponseCache.open(cache, self.CACHE_SIZE)
+        # Бот, который сохраняет кэш ответов в своем снимке (первый из использующих клиент).
+        self.owner = None
+
+    async def request(self, method: str, url: str, ttl: float = None, refresh: bool = False, **kwargs) -> dict:
+        """
+        Метод, выполняющий запрос к HotelAPI. Успешные ответы кэшируются на CACHE_TTL[url] секунд.
+        Одинаковые запросы, отправленные, пока первый из них еще выполняется, не дублируются, а ждут его ответ.
+        Ответ может быть общим для нескольких вызовов, поэтому изменять его нельзя.
+
+        :param:
+          method (str): HTTP-метод.
+          url (str): ссылка на API.
+          ttl (float): время жизни ответа в кэше вместо CACHE_TTL[url].
+          refresh (bool): не использовать ответ из кэша, а запросить и закэшировать новый.
+          kwargs (dict): аргументы aiohttp.ClientSession.request (json, params).
+
+        :return:
+          response (dict): ответ API.
+        """
+        key = json.dumps([method, url, kwargs], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        response = None if refresh else await self.cache.get(key)
+        if response is not None:
+            return response
+
+        # Запрос выполняется отдельной задачей, общей для всех ожидающих его вызовов: отмена одного вызова не отменяет
+        # запрос для остальных, а ошибка запроса передается всем.
+        flight = self.__inflight.get(key)
+        if flight is None or flight[0].done():
+            flight = self.__inflight[key] = [asyncio.create_task(self.__fetch(method, url, key, ttl, **kwargs)), 0]
+            flight[0].add_done_callback(functools.partial(self.__land, key, flight))
+
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # Ответ больше никому не нужен. Запрос убирается сразу: задача завершится только на следующей итерации
+                # цикла событий, и новый вызов с тем же ключом не должен получить ее отмену.
+                self.__land(key, flight)
+                flight[0].cancel()
+
+    def __land(self, key: str, flight: list, *args) -> None:
+        """
+        Метод, убирающий завершенный или отмененный запрос flight из выполняющихся, если его еще не заменил новый.
+
+        :param:
+          key (str): ключ ответа в кэше.
+          flight (list): задача запроса и количество ожидающих ее вызовов.
+        """
+        if self.__inflight.get(key) is flight:
+            del self.__inflight[key]
+
+    async def __fetch(self, method: str, url: str, key: str, ttl: float = None, **kwargs) -> dict:
+        """
+        Метод, отправляющий запрос request в HotelAPI и кэширующий успешный ответ.
+
+        :param:
+          method (str): HTTP-метод.
+          url (str): ссылка на API.
+          key (str): ключ ответа в кэше.
+          ttl (float): время жизни ответа в кэше вместо CACHE_TTL[url].
+          kwargs (dict): аргументы aiohttp.ClientSession.request (json, params).
+
+        :return:
+          response (dict): ответ API.
+        """
+        headers = {"X-RapidAPI-Key": next(self.__keys), "X-RapidAPI-Host": "hotels4.p.rapidapi.com"}
+        if 'json' in kwargs:
+            headers['content-type'] = 'application/json'
+
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.CONNECTIONS))
+        self.quota.spend()
+        async with self.__session.request(method, url, headers=headers, **kwargs) as answer:
+            text = await answer.text()
+        response = await self.offload(len(text) >= self.OFFLOAD_BYTES, json.loads, text)
+
+        if url in self.CACHE_TTL and not response.get('errors') and (
+                response.get('data') is not None or 'sr' in response):
+            await self.cache.set(key, response, ttl or self.CACHE_TTL[url])
+
+        return response
+
+    async def offload(self, heavy: bool, func: Callable, *args, **kwargs):
+        """
+        Метод, выполняющий func(*args, **kwargs) в пуле потоков обработки ответов, если данные большие (heavy),
+        чтобы не задерживать цикл событий, или сразу, если маленькие.
+
+        :param:
+          heavy (bool): выполнять в пуле потоков (OFFLOAD_BYTES).
+          func (Callable): функция.
+          args (tuple): позиционные аргументы func.
+          kwargs (dict): именованные аргументы func.
+
+        :return:
+          result: результат func.
+        """
+        if not heavy:
+            return func(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.__cpu, functools.partial(func, *args, **kwargs))
+
+    async def close(self) -> None:
+        """
+        Метод, закрывающий соединения с API и кэш ответов.
+        """
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+        await self.cache.close()
+
+
+class HotelBot:
+    """
+    Телеграм-бот, работающий с HotelAPI для поиска отелей.
+
+    Args:
+      telegram_token (str): токен телеграм-бота.
+      api_key (str): ключ для HotelAPI или список ключей, которые используются по очереди.
+      photo_cache (str): путь к файлу кэша file_id фотографий.
+      history (str): папка с журналами истории поисков.
+      snapshot (str): путь к файлу снимка кэшей и состояния чатов, который пишется при остановке и читается при запуске.
+      edit_keyboards (bool): изменять сообщение с нажатой кнопкой вместо его удаления и отправки нового.
+      daily_quota (int): ограничение количества запросов к API в сутки на один ключ (None - без ограничения).
+      prewarm_budget (int): сколько запросов к API может потратить одно фоновое обновление кэша популярных поисков
+        (0 - обновление выключено).
+      admins (list): id пользователей, которым доступны служебные команды (/profile).
+      metrics (str): путь к файлу метрик в текстовом формате Prometheus (задержка цикла событий, запросы к API),
+        None - не записывать. В режиме супервизора каждый обработчик пишет свой файл с номером перед расширением.
+      cache (str): адрес кэша ответов API (см. ResponseCache.open): None - в памяти процесса (сохраняется в снимке),
+        'sqlite:///путь' или 'redis://хост:порт/база' - общий для процессов-обработчиков и копий бота.
+      api (HotelAPI): клиент API, общий с другими ботами процесса (см. HotelBotHost), вместо api_key, daily_quota
+        и cache. Кэш ответов сохраняет в снимке, а цикл событий измеряет (LoopMonitor, общий для метрик всех ботов)
+        и профилирует при запуске (PROFILE_ENV) только первый из использующих его ботов.
+      history_keep (int): сколько последних поисков чата оставлять в истории; более старые удаляются при запуске
+        и каждые HISTORY_COMPACT_INTERVAL секунд. None (по умолчанию) - история хранится полностью.
+
+    Бот может работать в одном процессе (start()) или в нескольких (start(workers)): тогда процесс-супервизор получает
+    обновления и распределяет их по процессам-обработчикам по id чата, а общие кэши (города, file_id фотографий)
+    хранит у себя и рассылает изменения всем обработчикам. Несколько ботов с разными токенами можно запустить
+    в одном процессе с общим HotelAPI (см. HotelBotHost).
+    """
+
+    # Количество отелей (максимум для поиска), которые заранее загружаются после выбора города.
+    PREFETCH_HOTELS = 5
+    # Количество первых отелей, для которых заранее загружаются детали.
+    PREFETCH_DETAILS = 3
+    # Время (сек), через которое неиспользованная предварительная загрузка удаляется (как список отелей в кэше).
+    PREFETCH_TTL = 15 * 60
+    # Количество отелей, которое запрашивается для lowprice, сколько отелей выводит кнопка "Показать еще"
+    # и сколько (сек) хранятся уже найденные, но не выведенные отели поиска.
+    CURSOR_HOTELS = 25
+    MORE_HOTELS = 5
+    CURSOR_TTL = 15 * 60
+    # Задержка (сек) перед запросом к API из inline-режима. Если за это время пользователь дописал запрос, старый не отправляется.
+    INLINE_DEBOUNCE = 0.6
+    # Максимальное количество городов в ответе inline-режима.
+    INLINE_RESULTS = 20
+    # Максимальное количество file_id фотографий в кэше.
+    PHOTO_CACHE_SIZE = 10000
+    # Период (сек) сохранения кэша file_id фотографий в файл.
+    PHOTO_CACHE_SAVE_INTERVAL = 300
+    # Количество поисков на одной странице /history.
+    HISTORY_PAGE = 5
+    # Максимальная длина сообщения Telegram.
+    MESSAGE_LIMIT = 4096
+    # Максимальная длина подписи к фото и количество фото в одной группе Telegram.
+    CAPTION_LIMIT = 1024
+    MEDIA_GROUP_LIMIT = 10
+    # Период (сек) сжатия истории, если задано history_keep.
+    HISTORY_COMPACT_INTERVAL = 6 * 3600
+    # Период (сек) проверки процессов-обработчиков супервизором и таймаут (сек) long polling супервизора.
+    WORKER_CHECK_INTERVAL = 1
+    POLLING_TIMEOUT = 20
+    # Максимальное количество страниц списка отелей, которые bestdeal (сортировки 1 и 2) запрашивает одновременно.
+    BESTDEAL_PAGES = 4
+    # Версия формата снимка, количество ответов API в одной части снимка и максимальное время (сек) загрузки снимка.
+    SNAPSHOT_VERSION = 1
+    SNAPSHOT_CHUNK = 500
+    SNAPSHOT_LOAD_TIMEOUT = 5
+    # Сколько последних поисков учитывается при выборе популярных, в какие часы (местное время) и как часто (сек)
+    # обновляется их кэш, на сколько (сек) кэшируются обновленные страницы и для скольких отелей обновляются детали.
+    PREWARM_SEARCHES = 1000
+    PREWARM_HOURS = range(3, 6)
+    PREWARM_INTERVAL = 3600
+    PREWARM_TTL = 18 * 3600
+    PREWARM_DETAILS = 3
+    # Период (сек) проверки подписок /watch, изменение цены (доля), о котором сообщается, и максимум подписок чата.
+    WATCH_INTERVAL = 3 * 3600
+    WATCH_THRESHOLD = 0.05
+    WATCH_LIMIT = 5
+    # Сколько ближайших отелей выводится по отправленной геопозиции, в каком радиусе (км) они ищутся
+    # и сколько (сек) хранятся цены отелей для поиска рядом.
+    NEAR_HOTELS = 5
+    NEAR_RADIUS = 10
+    NEAR_TTL = 15 * 60
+    # Максимальное количество дат заезда и ночей /flexdates, сколько дат запрашивается одновременно
+    # и сколько самых дешевых дат (с самым дешевым отелем на каждую) выводится.
+    FLEX_DATES = 31
+    FLEX_NIGHTS = 30
+    FLEX_CONCURRENCY = 4
+    FLEX_RESULTS = 10
+    # Переменная окружения с длительностью (сек) профилирования при запуске, период (сек) снятия стеков,
+    # максимальная длительность (сек) профилирования и папка с результатами профилирования.
+    PROFILE_ENV = 'HOTELBOT_PROFILE'
+    PROFILE_INTERVAL = 0.005
+    PROFILE_MAX = 600
+    PROFILE_DIR = 'profiles'
+    # Период (сек) измерения задержки цикла событий, задержка (сек), после которой блокировка цикла записывается
+    # в журнал, количество последних измерений для перцентилей и период (сек) записи файла метрик.
+    LAG_INTERVAL = 0.1
+    LAG_THRESHOLD = 0.2
+    LAG_SAMPLES = 3000
+    METRICS_INTERVAL = 15
+    # Время (сек), в течение которого повторное нажатие той же кнопки и повтор той же команды игнорируются,
+    # и максимальное количество одновременно выполняющихся поисков одного чата.
+    CALLBACK_DEBOUNCE = 2
+    COMMAND_DEBOUNCE = 1
+    CHAT_SEARCHES = 1
+    # Переходы диалогов: (состояние чата, событие) -> состояние, в котором чат ждет следующее сообщение
+    # (None - не ждет). Состояние '*' - любое, если для текущего состояния перехода нет; если нет и его, состояние
+    # не меняется. Событие answer - ответ на вопрос шага.
+    STEP_TRANSITIONS = {('*', 'checkIn'): 'checkIn', ('*', 'checkOut'): 'checkOut', ('*', 'adult'): 'adult',
+                        ('*', 'child'): 'child', ('child', 'remove_child'): None,
+                        ('*', 'main_command'): 'main_city', ('*', 'main_city'): 'main_hotels',
+                        ('*', 'bestdeal_filters'): 'bestdeal_filters', ('*', 'photo_yes'): 'main_photo',
+                        ('*', 'answer'): None}
+
+    # ---------------------------------------------[__init__]---------------------------------------------<Begin>
+
+    def __init__(self, telegram_token: str, api_key: str, photo_cache: str = 'photo_cache.json',
+                 history: str = 'history', snapshot: str = 'snapshot.bin', edit_keyboards: bool = False,
+                 daily_quota: int = None, prewarm_budget: int = 0, admins: list = (),
+                 metrics: str = None, cache: str = None, api: HotelAPI = None, history_keep: int = None) -> None:
+        self.__bot = async_telebot.AsyncTeleBot(telegram_token)
+        self.__telegram_token = telegram_token
+        self.__api_key = api_key
+        self.__history_path = history
+        self.__snapshot_path = snapshot
+        self.__cache_url = cache
+        self.__own_api = api is None
+        self.__api = api or HotelAPI(api_key, daily_quota, cache)
+        if self.__api.owner is None:
+            self.__api.owner = self
+        self.__recent_actions = OrderedDict()
+        self.__search_tasks = dict()
+        self.__cursors = OrderedDict()
+        self.__cursor_ids = itertools.count(1)
+        self.__edit_keyboards = edit_keyboards
+        self.__edit_target = dict()
+        self.__rendered = dict()
+        self.__daily_quota = daily_quota
+        self.__prewarm_budget = prewarm_budget
+        self.__recent_searches = deque(maxlen=self.PREWARM_SEARCHES)
+        self.__watches = dict()
+        self.__admins = set(admins)
+        self.__profiling = False
+        self.__metrics_path = metrics
+        # Цикл событий у ботов с общим HotelAPI один, поэтому и его измерение общее: его выполняет владелец клиента.
+        self.__monitor = LoopMonitor(self.LAG_INTERVAL, self.LAG_THRESHOLD, self.LAG_SAMPLES) \
+            if self.__api.owner is self else self.__api.owner.__monitor
+        self.__events = None
+        self.__shard = None
+        self.__data = dict()
+        self.__history_keep = history_keep
+        self.__history = HistoryLog(history, history_keep)
+        self.__last_keyboard_id = dict()
+        self.__steps = dict()
+        self.__bestdeal_settings = dict()
+        self.__main_settings = dict()
+        self.__prefetch = dict()
+        self.__cities = CityIndex()
+        self.__geo = GeoIndex(self.NEAR_TTL)
+        self.__inline_queries = dict()
+        self.__photos = PhotoCache(photo_cache, self.PHOTO_CACHE_SIZE)
+        # Шаги диалогов: состояние чата, ожидающего ответ, -> метод, который обрабатывает следующее сообщение.
+        self.__step_handlers = {'checkIn': self.__checkIn, 'checkOut': self.__checkOut, 'adult': self.__set_adult,
+                                'child': self.__set_child, 'main_city': self.__main_city,
+                                'bestdeal_filters': self.__bestdeal_filters, 'main_hotels': self.__main_hotels,
+                                'main_photo': self.__main_photo}
+
+        # Handlers
+
+        @self.__bot.message_handler(func=lambda message: message.chat.id in self.__steps)
+        async def _next_step_handler(message: Message) -> None:
+            await self.__next_step_handler(message)
+
+        @self.__bot.message_handler(commands=['start', 'help'])
+        async def _start(message: Message) -> None:
+            await self.__start(message)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'ec_no')
+        async def _callback_ec_no(call: CallbackQuery) -> None:
+            await self.__callback_ec_no(call)
+
+        @self.__bot.message_handler(commands=['reg'])
+        async def _reg(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__reg(message)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'checkIn')
+        async def _callback_checkIn(call: CallbackQuery) -> None:
+            await self.__callback_checkIn(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'checkOut')
+        async def _callback_checkOut(call: CallbackQuery) -> None:
+            await self.__callback_checkOut(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('room'))
+        async def _callback_room(call: CallbackQuery) -> None:
+            await self.__callback_room(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'add_room')
+        async def _callback_add_room(call: CallbackQuery) -> None:
+            await self.__callback_add_room(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'reset')
+        async def _callback_reset(call: CallbackQuery) -> None:
+            await self.__callback_reset(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'exit_reg')
+        async def _callback_exit_reg(call: CallbackQuery) -> None:
+            await self.__callback_exit_reg(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('adult'))
+        async def _callback_adult(call: CallbackQuery) -> None:
+            await self.__callback_adult(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('child'))
+        async def _callback_child(call: CallbackQuery) -> None:
+            await self.__callback_child(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('remove_child'))
+        async def _callback_remove_child(call: CallbackQuery) -> None:
+            await self.__callback_remove_child(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('add_child'))
+        async def _callback_add_child(call: CallbackQuery) -> None:
+            await self.__callback_add_child(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('remove_room'))
+        async def _callback_remove_room(call: CallbackQuery) -> None:
+            await self.__callback_remove_room(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'exit_room')
+        async def _callback_exit_room(call: CallbackQuery) -> None:
+            await self.__callback_exit_room(call)
+
+        @self.__bot.message_handler(commands=['flexdates'])
+        async def _flexdates(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__flexdates(message)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('flex_city'))
+        async def _callback_flex_city(call: CallbackQuery) -> None:
+            await self.__callback_flex_city(call)
+
+        @self.__bot.message_handler(commands=['lowprice', 'highprice', 'bestdeal'])
+        async def _main_commands(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__main_commands(message)
+
+        @self.__bot.inline_handler(func=lambda query: True)
+        async def _inline_city(query: InlineQuery) -> None:
+            await self.__inline_city(query)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('bestdeal_menu'))
+        async def _callback_bestdeal_menu(call: CallbackQuery) -> None:
+            await self.__callback_bestdeal_menu(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('bestdeal_filters'))
+        async def _callback_bestdeal_filters(call: CallbackQuery) -> None:
+            await self.__callback_bestdeal_filters(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'bestdeal_change_sort')
+        async def _callback_bestdeal_change_sort(call: CallbackQuery) -> None:
+            await self.__callback_bestdeal_change_sort(call)
+
+        @self.__bot.callback_query_handler(
+            func=lambda call: call.data.startswith('main_city') or call.data == 'bestdeal_exit')
+        async def _callback_main_city(call: CallbackQuery) -> None:
+            await self.__callback_main_city(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'photo_yes')
+        async def _callback_photo_yes(call: CallbackQuery) -> None:
+            await self.__callback_photo_yes(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'photo_no')
+        async def _callback_photo_no(call: CallbackQuery) -> None:
+            await self.__callback_photo_no(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('more_'))
+        async def _callback_more(call: CallbackQuery) -> None:
+            await self.__callback_more(call)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data == 'result_error')
+        async def _callback_result_error(call: CallbackQuery) -> None:
+            await self.__callback_result_error(call)
+
+        @self.__bot.message_handler(content_types=['location'])
+        async def _near(message: Message) -> None:
+            await self.__near(message)
+
+        @self.__bot.message_handler(commands=['history'])
+        async def _get_history(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__get_history(message)
+
+        @self.__bot.message_handler(commands=['watch'])
+        async def _watch(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__watch(message)
+
+        @self.__bot.message_handler(commands=['unwatch'])
+        async def _unwatch(message: Message) -> None:
+            if not self.__repeated_command(message):
+                await self.__unwatch(message)
+
+        @self.__bot.message_handler(commands=['profile'])
+        async def _profile_command(message: Message) -> None:
+            await self.__profile_command(message)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('h_photo'))
+        async def _callback_h_photo(message: Message) -> None:
+            await self.__callback_h_photo(message)
+
+        @self.__bot.callback_query_handler(func=lambda call: call.data.startswith('h_page'))
+        async def _callback_h_page(call: CallbackQuery) -> None:
+            await self.__callback_h_page(call)
+
+    # ---------------------------------------------[__init__]---------------------------------------------<End>
+
+    def __transition(self, chat_id: int, event: str, *args) -> None:
+        """
+        Метод, переводящий чат по событию event в состояние из STEP_TRANSITIONS: следующее сообщение чата обработает
+        метод __step_handlers[состояние] с аргументами args. Состояние чата - кортеж (state, *args) из простых
+        значений, поэтому оно сохраняется в снимке и не зависит от процесса.
+
+        :param:
+          chat_id (int): id чата.
+          event (str): событие (нажатая кнопка, команда, answer).
+          args (tuple): аргументы метода (str, int, float).
+        """
+        key = (self.__steps.get(chat_id, (None,))[0], event)
+        if key not in self.STEP_TRANSITIONS:
+            key = ('*', event)
+            if key not in self.STEP_TRANSITIONS:
+                return
+        state = self.STEP_TRANSITIONS[key]
+        if state is None:
+            self.__steps.pop(chat_id, None)
+        else:
+            self.__steps[chat_id] = (state, *args)
+
+    async def __next_step_handler(self, message: Message) -> None:
+        """
+        Метод, обрабатывающий сообщение чата в состоянии, заданном через __transition.
+
+        :param:
+          message (Message): сообщение.
+        """
+        state, *args = self.__steps[message.chat.id]
+        self.__transition(message.chat.id, 'answer')
+        await self.__step_handlers[state](message, *args)
+
+    def __repeated(self, key: tuple, window: float) -> bool:
+        """
+        Метод, проверяющий, было ли действие key (нажатие кнопки, команда) за последние window секунд,
+        и запоминающий его.
+
+        :param:
+          key (tuple): действие.
+          window (float): время (сек).
+
+        :return:
+          repeated (bool): действие повторное и его нужно пропустить.
+        """
+        now = time.monotonic()
+        # Действия хранятся в порядке времени: устаревшие удаляются с начала.
+        while self.__recent_actions and next(iter(self.__recent_actions.values())) < now - max(
+                self.CALLBACK_DEBOUNCE, self.COMMAND_DEBOUNCE):
+            self.__recent_actions.popitem(last=False)
+
+        if now - self.__recent_actions.get(key, -math.inf) < window:
+            return True
+        self.__recent_actions[key] = now
+        self.__recent_actions.move_to_end(key)
+        return False
+
+    def __repeated_command(self, message: Message) -> bool:
+        """
+        Метод, проверяющий, что пользователь уже отправил ту же команду (повторная отправка). Проверяются только
+        команды, полученные от Telegram, а не вызовы методов команд самим ботом (например, __reg после нажатия кнопки).
+
+        :param:
+          message (Message): сообщение.
+        """
+        return self.__repeated(('command', message.chat.id, message.text), self.COMMAND_DEBOUNCE)
+
+    def __repeated_call(self, call: CallbackQuery) -> bool:
+        """
+        Метод, проверяющий, что кнопка уже нажималась на этом же сообщении в том же виде (двойное нажатие).
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        return self.__repeated(('call', call.message.chat.id, call.message.id, call.message.edit_date, call.data),
+                               self.CALLBACK_DEBOUNCE)
+
+    def __callback_func(func: Callable) -> Callable:
+
+        functools.wraps(func)
+
+        async def wrapped_func(self, call: CallbackQuery) -> None:
+            if self.__repeated_call(call):
+                return
+
+            self.__last_keyboard_id[call.message.chat.id] = None
+
+            try:
+                if self.__edit_keyboards:
+                    # Сообщение с нажатой кнопкой изменит __show, а если func его не использовала - удаляем.
+                    self.__edit_target[call.message.chat.id] = call.message.id
+                    try:
+                        await func(self, call)
+                    finally:
+                        if self.__edit_target.pop(call.message.chat.id, None) is not None:
+                            await self.__bot.delete_message(call.message.chat.id, call.message.id)
+                else:
+                    await self.__bot.delete_message(call.message.chat.id, call.message.id)
+                    await func(self, call)
+            except Exception as err:
+                print(err)
+                await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+        wrapped_func.__name__ = func.__name__
+        wrapped_func.__doc__ = func.__doc__
+        return wrapped_func
+
+    def __command_func(func: Callable) -> Callable:
+
+        functools.wraps(func)
+
+        async def wrapped_func(self, message: Message) -> None:
+            try:
+                if self.__last_keyboard_id[message.chat.id] != None:
+                    await self.__bot.delete_message(message.chat.id, self.__last_keyboard_id[message.chat.id])
+            except:
+                pass
+
+            self.__cancel_prefetch(message.chat.id)
+
+            try:
+                await func(self, message)
+            except Exception as err:
+                print(err)
+                await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+        wrapped_func.__name__ = func.__name__
+        wrapped_func.__doc__ = func.__doc__
+        return wrapped_func
+
+    async def __show(self, chat_id: int, text: str, reply_markup: types.InlineKeyboardMarkup = None) -> int:
+        """
+        Метод, выводящий сообщение text с клавиатурой reply_markup. Если включен edit_keyboards и сообщение выводится
+        в ответ на нажатие кнопки, изменяет сообщение с этой кнопкой, а если оно уже выглядит так же - ничего не делает.
+
+        :param:
+          chat_id (int): id чата.
+          text (str): текст сообщения.
+          reply_markup (InlineKeyboardMarkup): клавиатура.
+
+        :return:
+          message_id (int): id выведенного сообщения.
+        """
+        markup = reply_markup.to_json() if reply_markup else None
+        message_id = self.__edit_target.pop(chat_id, None)
+
+        if message_id is None:
+            message_id = (await self.__bot.send_message(chat_id, text, reply_markup=reply_markup)).id
+        elif self.__rendered.get(chat_id) == (message_id, text, markup):
+            return message_id
+        elif self.__rendered.get(chat_id, ())[:2] == (message_id, text):
+            await self.__bot.edit_message_reply_markup(chat_id, message_id, reply_markup=reply_markup)
+        else:
+            await self.__bot.edit_message_text(text, chat_id, message_id, reply_markup=reply_markup)
+
+        if self.__edit_keyboards:
+            self.__rendered[chat_id] = (message_id, text, markup)
+
+        return message_id
+
+    async def __start(self, message: Message) -> None:
+        """
+        Метод, отвечающий командам (start, help).
+
+        :param:
+          message (Message): сообщение.
+        """
+        await self.__bot.send_message(message.chat.id,
+                                      "Вы можете ввести следующие комманды:\n\n/start или /help для получения помощи по командам.\n\n/reg для регистрации своих данных. Для использования основных команд (lowprice и т.д.) вам потребуется как минимум заполнить даты заселения и выселения.\n\n/lowprice для поиска самых дешевых отелей в желаемом городе.\n\n/highprice для поиска самых дорогих отелей в желаемом городе.\n\n/bestdeal для поиска самых дешевых и\\или самых близких к центру отелей в желаемом городе. Доступно 3 вида сортировки: по цене, по расстоянию, по цене и расстоянию.\n\n/history для вывода истории ваших поисков, /history export [csv|json] для выгрузки всей истории одним файлом.\n\n/flexdates ДД.ММ.ГГГГ ДД.ММ.ГГГГ N для поиска самых дешевых отелей на N ночей с заездом в любой день между двумя датами.\n\n/watch для подписки на изменение цен последнего поиска, /unwatch для отмены всех подписок.\n\nОтправьте геопозицию, чтобы найти ближайшие к ней отели на ваши даты.\n\nГород можно не вводить полностью: наберите в поле ввода имя бота и начало названия города, затем выберите город из подсказок.")
+
+    # -----------------------------------(errorContinue)-----------------------------------<Begin>
+
+    async def __errorContinue(self, chat_id: int, call_data: str) -> None:
+        """
+        Метод, который при возникновении ошибки во время ввода возвращает бота на предыдущий шаг с вызовом call_data или прерывает последовательность действий.
+
+        :param:
+          chat_id (int): id чата.
+          call_data (str): название вызова.
+        """
+        ec_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: call_data
+        ec_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data=call_data))
+        # Button: ec_no
+        ec_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='ec_no'))
+
+        self.__last_keyboard_id[chat_id] = (
+            await self.__bot.send_message(chat_id, "Ввести снова?", reply_markup=ec_keyboard)).id
+
+    # Callback: ec_no
+    async def __callback_ec_no(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке ec_no.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        if self.__repeated_call(call):
+            return
+
+        self.__last_keyboard_id[call.message.chat.id] = None
+        self.__cancel_prefetch(call.message.chat.id)
+        self.__cancel_search(call.message.chat.id)
+
+        try:
+            self.__main_settings.pop(call.message.chat.id)
+        except:
+            pass
+
+        try:
+            await self.__bot.delete_message(call.message.chat.id, call.message.id)
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+    # -----------------------------------(errorContinue)-----------------------------------<End>
+
+    # ---------------------------------------------[/reg]---------------------------------------------<Begin>
+
+    # -----------------------------------(reg_menu)-----------------------------------<Begin>
+
+    @__command_func
+    async def __reg(self, message: Message) -> None:
+        """
+        Метод, открывающий меню регистрации.
+
+        :param:
+          message (Message): сообщение.
+        """
+        self.__data[message.chat.id] = self.__data.get(message.chat.id,
+                                                       {'in': None, 'out': None, 'rooms': [[1, []]], 'count': 1})
+        reg_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: checkIn, checkOut
+        reg_keyboard.row(types.InlineKeyboardButton(text='Въезд: ' + (
+            str(self.__data[message.chat.id]['in']) if self.__data[message.chat.id]['in'] else 'Неопределенно'),
+                                                    callback_data='checkIn'), types.InlineKeyboardButton(
+            text='Выезд: ' + (
+                str(self.__data[message.chat.id]['out']) if self.__data[message.chat.id]['out'] else 'Неопределенно'),
+            callback_data='checkOut'))
+        # Button: room[0..n]
+        row = []
+        for i, room in enumerate(self.__data[message.chat.id]['rooms']):
+            if len(row) == 2:
+                reg_keyboard.row(*row)
+                row.clear()
+            row.append(types.InlineKeyboardButton(text=f"Комната {i + 1}: {room[0]} взр, {len(room[1])} дет",
+                                                  callback_data=f'room{i}'))
+        reg_keyboard.row(*row)
+        # Button: add_room
+        if len(self.__data[message.chat.id]['rooms']) < 8 and self.__data[message.chat.id]['count'] < 20:
+            reg_keyboard.row(
+                types.InlineKeyboardButton(text='Добавить комнату (максимум 8 комнат)', callback_data='add_room'))
+        # Button: reset
+        reg_keyboard.row(types.InlineKeyboardButton(text='Сбросить информацию', callback_data='reset'))
+        # Button: exit_reg
+        reg_keyboard.row(types.InlineKeyboardButton(text='Готово', callback_data='exit_reg'))
+
+        self.__last_keyboard_id[message.chat.id] = await self.__show(message.chat.id, (
+            'Достигнут максимум людей в комнатах.\n' if self.__data[message.chat.id][
+                                                            'count'] >= 20 else '') + "Ваша текущая информация:",
+                                                                     reg_keyboard)
+
+        # Callback: checkIn
+
+    @__callback_func
+    async def __callback_checkIn(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке checkIn.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__show(call.message.chat.id, 'Введите дату заселения (dd.mm.yyyy):')
+        self.__transition(call.message.chat.id, 'checkIn')
+
+    # Method: checkIn
+    async def __checkIn(self, message: Message) -> None:
+        """
+        Метод, выполняющий проверку и запись даты заселения.
+
+        :param:
+          message (Message): сообщение.
+        """
+        try:
+            result = datetime.strptime(message.text, '%d.%m.%Y').date()
+            if datetime.today().date() > result:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nДата заселения должна быть больше или равна сегодняшней дате.')
+            elif self.__data[message.chat.id]['out'] and self.__data[message.chat.id]['out'] < result:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна дате заселения.')
+            else:
+                self.__data[message.chat.id]['in'] = result
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+        await self.__reg(message)
+
+    # Callback: checkOut
+    @__callback_func
+    async def __callback_checkOut(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке checkOut.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__show(call.message.chat.id, 'Введите дату выселения (dd.mm.yyyy):')
+        self.__transition(call.message.chat.id, 'checkOut')
+
+    # Method: checkOut
+    async def __checkOut(self, message: Message) -> None:
+        """
+        Метод, выполняющий проверку и запись даты выселения.
+
+        :param:
+          message (Message): сообщение.
+        """
+        try:
+            result = datetime.strptime(message.text, '%d.%m.%Y').date()
+            if datetime.today().date() > result:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна сегодняшней дате.')
+            elif self.__data[message.chat.id]['in'] and self.__data[message.chat.id]['in'] > result:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nДата выселения должна быть больше или равна дате заселения.')
+            else:
+                self.__data[message.chat.id]['out'] = result
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+        await self.__reg(message)
+
+    # Callback: room[0..n]
+    @__callback_func
+    async def __callback_room(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке room[0..n].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__reg_room(call.message, int(call.data[4:]))
+
+    # Callback: add_room
+    @__callback_func
+    async def __callback_add_room(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке add_room.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        if self.__data[call.message.chat.id]['count'] >= 20:
+            await self.__bot.send_message(call.message.chat.id,
+                                          '\U00002620 Ошибка.\U00002620 \nВ команте должен быть минимум 1 человек.\nЛюдей должно быть суммарно не больше 20.')
+        else:
+            self.__data[call.message.chat.id]['rooms'].append([1, []])
+            self.__data[call.message.chat.id]['count'] += 1
+        await self.__reg(call.message)
+
+    # Callback: reset
+    @__callback_func
+    async def __callback_reset(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке reset.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        self.__data[call.message.chat.id] = {'in': None, 'out': None, 'rooms': [[1, []]], 'count': 1}
+        await self.__reg(call.message)
+
+    # Callback: exit_reg
+    async def __callback_exit_reg(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке exit_reg.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        if self.__repeated_call(call):
+            return
+
+        self.__last_keyboard_id[call.message.chat.id] = None
+
+        try:
+            await self.__bot.delete_message(call.message.chat.id, call.message.id)
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(call.message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+    # -----------------------------------(reg_menu)-----------------------------------<End>
+
+    # -----------------------------------(reg_room_menu)-----------------------------------<Begin>
+
+    async def __reg_room(self, message: Message, n: int) -> None:
+        """
+        Метод, открывающий меню регистрации комнаты.
+
+        :param:
+          message (Message): сообщение.
+          n (int): индекс комнаты.
+        """
+        room_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: adult[n]
+        room_keyboard.row(types.InlineKeyboardButton(text=f"Взрослых: {self.__data[message.chat.id]['rooms'][n][0]}.",
+                                                     callback_data=f'adult{n}'))
+        # Button: child[0..n]_[0..m]
+        row = []
+        for i, age in enumerate(self.__data[message.chat.id]['rooms'][n][1]):
+            if len(row) == 2:
+                room_keyboard.row(*row)
+                row.clear()
+            row.append(types.InlineKeyboardButton(text=f"Ребенок: {age if age > 0 else '< 1'} лет",
+                                                  callback_data=f'child{n}_{i}'))
+        room_keyboard.row(*row)
+        # Button: add_child[n]
+        if len(self.__data[message.chat.id]['rooms'][n][1]) < 6 and self.__data[message.chat.id]['count'] < 20:
+            room_keyboard.row(
+                types.InlineKeyboardButton(text="Добавить ребенка (максимум 6)", callback_data=f'add_child{n}'))
+        # Button: remove_room[n]
+        if len(self.__data[message.chat.id]['rooms']) > 1:
+            room_keyboard.row(types.InlineKeyboardButton(text="Удалить комнату", callback_data=f'remove_room{n}'))
+        # Button: exit_room
+        room_keyboard.row(types.InlineKeyboardButton(text="Назад", callback_data='exit_room'))
+
+        self.__last_keyboard_id[message.chat.id] = await self.__show(message.chat.id,
+                                                                     f"Количетсво людей во всех комнатах {self.__data[message.chat.id]['count']} (максимум 20)\nКомната {n + 1}: {self.__data[message.chat.id]['rooms'][n][0]} взрослых, {len(self.__data[message.chat.id]['rooms'][n][1])} детей.",
+                                                                     room_keyboard)
+
+    # Callback: adult[n]
+    @__callback_func
+    async def __callback_adult(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке adult[n].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__show(call.message.chat.id, 'Введите количество взрослых:')
+        self.__transition(call.message.chat.id, 'adult', int(call.data[5:]))
+
+    # Method: adult[n]
+    async def __set_adult(self, message: Message, n: int) -> None:
+        """
+        Метод, выполняющий проверку и запись количества взрослых в комнате n.
+
+        :param:
+          message (Message): сообщение.
+          n (int): индекс комнаты.
+        """
+        try:
+            result = int(message.text)
+            if result < 1:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nТребуется минимум 1 взрослый в комнате.')
+            elif self.__data[message.chat.id]['count'] + result - self.__data[message.chat.id]['rooms'][n][0] > 20:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nЛюдей должно быть суммарно не больше 20.')
+            else:
+                self.__data[message.chat.id]['count'] += result - self.__data[message.chat.id]['rooms'][n][0]
+                self.__data[message.chat.id]['rooms'][n][0] = result
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+        await self.__reg_room(message, n)
+
+    # Callback: child[n]_[0..m]
+    @__callback_func
+    async def __callback_child(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке child[n]_[0..m].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        n, m = map(int, call.data[5:].split('_'))
+        child_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: remove_child[n]_[m]
+        child_keyboard.row(
+            types.InlineKeyboardButton(text='Убрать выбранного ребенка.', callback_data=f"remove_child{n}_{m}"))
+
+        msg_id = await self.__show(call.message.chat.id,
+                                   'Введите возраст ребенка (от 0 до 17) в чат или уберите его, нажав на кнопку:',
+                                   child_keyboard)
+        self.__transition(call.message.chat.id, 'child', n, m, msg_id)
+
+    # Callback: remove_child[n]_[m]
+    @__callback_func
+    async def __callback_remove_child(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке remove_child[n]_[m].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        n, m = map(int, call.data[12:].split('_'))
+        self.__data[call.message.chat.id]['rooms'][n][1].pop(m)
+        self.__data[call.message.chat.id]['count'] -= 1
+        self.__transition(call.message.chat.id, 'remove_child')
+        await self.__reg_room(call.message, n)
+
+    # Method: child[n]_[0..m]
+    async def __set_child(self, message: Message, n: int, m: int, msg_id: int) -> None:
+        """
+        Метод, выполняющий проверку и запись возраста ребенка m из комнаты n.
+
+        :param:
+          message (Message): сообщение.
+          n (int): индекс комнаты.
+          m (int): индекс ребенка.
+          msg_id (int): id предыдущего сообщения. Требуется для удаления клавиатуры.
+        """
+        await self.__bot.edit_message_reply_markup(chat_id=message.chat.id, message_id=msg_id, reply_markup=None)
+        try:
+            result = int(message.text)
+            if result < 0 or result > 17:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nВозраст ребенка должен быть от 0 до 17.')
+            else:
+                self.__data[message.chat.id]['rooms'][n][1][m] = result
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+        await self.__reg_room(message, n)
+
+    # Callback: add_child[n]
+    @__callback_func
+    async def __callback_add_child(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке add_child[n].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        n = int(call.data[9:])
+        self.__data[call.message.chat.id]['rooms'][n][1].append(0)
+        self.__data[call.message.chat.id]['count'] += 1
+        await self.__reg_room(call.message, n)
+
+    # Callback: remove_room[n]
+    @__callback_func
+    async def __callback_remove_room(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке remove_room[n].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        n = int(call.data[11:])
+        self.__data[call.message.chat.id]['count'] -= self.__data[call.message.chat.id]['rooms'][n][0] + len(
+            self.__data[call.message.chat.id]['rooms'][n][1])
+        self.__data[call.message.chat.id]['rooms'].pop(n)
+        await self.__reg(call.message)
+
+    # Callback: exit_room
+    @__callback_func
+    async def __callback_exit_room(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке exit_reg.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__reg(call.message)
+
+    # -----------------------------------(reg_room_menu)-----------------------------------<End>
+
+    # ---------------------------------------------[/reg]---------------------------------------------<End>
+
+    # ---------------------------------------------[main]---------------------------------------------<Begin>
+
+    @__command_func
+    async def __main_commands(self, message: Message) -> None:
+        """
+        Метод, отвечающий основным командам (lowprice, highprice, bestdeal) бота.
+
+        :param:
+          message (Message): сообщение.
+        """
+        self.__cancel_search(message.chat.id)
+
+        try:
+            if self.__data[message.chat.id]['in'] == None or self.__data[message.chat.id]['out'] == None:
+                raise Exception
+
+            msg = await self.__bot.send_message(message.chat.id, 'Введите название города:')
+            self.__main_settings[message.chat.id] = {'mode': message.text[1:], 'history': {
+                'command': message.text, 'time': str(datetime.fromtimestamp(message.date))}}
+            self.__transition(msg.chat.id, 'main_command')
+        except:
+            await self.__bot.send_message(message.chat.id,
+                                          '\U00002620 Ошибка.\U00002620 \nПройдите регистрацию своей информации (/reg).')
+
+    async def __main_city(self, message: Message) -> None:
+        """
+        Метод, который ищет города с названием message.text сначала в локальном индексе городов, затем в https://hotels4.p.rapidapi.com/locations/v3/search.
+
+        :param:
+          message (Message): сообщение.
+        """
+        try:
+            cities = self.__cities.find(message.text) or await self.__search_cities(message.text)
+
+            if len(cities) == 0:
+
+                await self.__bot.send_message(message.chat.id, f"Город '{message.text}' не найден.")
+            else:
+                city_keyboard = types.InlineKeyboardMarkup()
+
+                # Button: bestdeal_menu[gaiaId], flex_city[gaiaId], main_city[gaiaId]
+                prefix = {'bestdeal': 'bestdeal_menu', 'flexdates': 'flex_city'}.get(
+                    self.__main_settings[message.chat.id]['mode'], 'main_city')
+                for gaia_id, display_name in cities:
+                    city_keyboard.row(types.InlineKeyboardButton(text=display_name, callback_data=prefix + f"{gaia_id}"))
+
+                self.__last_keyboard_id[message.chat.id] = (
+                    await self.__bot.send_message(message.chat.id, "Выберите город из списка найденных:",
+                                                  reply_markup=city_keyboard)).id
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \n')
+
+    async def __search_cities(self, query: str) -> list:
+        """
+        Метод, который ищет города по запросу query в https://hotels4.p.rapidapi.com/locations/v3/search и добавляет их в локальный индекс.
+
+        :param:
+          query (str): запрос.
+
+        :return:
+          cities (list[tuple]): пары (gaiaId, название для вывода).
+        """
+        response = await self.__api.request("GET", "https://hotels4.p.rapidapi.com/locations/v3/search",
+                                            params={"q": query})
+
+        cities = []
+
+        for obj in response['sr']:
+            if obj['type'] == 'CITY':
+                cities.append((obj['gaiaId'], obj['regionNames']['displayName']))
+                self.__cities.add(obj['gaiaId'], obj['regionNames']['displayName'],
+                                  obj['regionNames'].get('shortName', ''))
+                self.__share('city', obj['gaiaId'], obj['regionNames']['displayName'],
+                             obj['regionNames'].get('shortName', ''))
+
+        self.__cities.mark_searched(query)
+        self.__share('searched', query)
+
+        return cities
+
+    async def __inline_city(self, query: InlineQuery) -> None:
+        """
+        Метод, отвечающий inline-запросам подсказками городов. Подсказки берутся из локального индекса городов,
+        а для запросов, которых еще не было, - еще и из API (запрос отправляется, только если пользователь перестал
+        печатать, INLINE_DEBOUNCE): найденные в индексе по началу названия города дополняются ответом API, например,
+        "Par" после найденного ранее "Paris" находит и "Parma".
+
+        :param:
+          query (InlineQuery): inline-запрос.
+        """
+        try:
+            if len(CityIndex.normalize(query.query)) < 2:
+                await self.__bot.answer_inline_query(query.id, [])
+                return
+
+            cities = self.__cities.search(query.query, self.INLINE_RESULTS)
+
+            if not self.__cities.searched(query.query):
+                self.__inline_queries[query.from_user.id] = query.id
+                await asyncio.sleep(self.INLINE_DEBOUNCE)
+                if self.__inline_queries.get(query.from_user.id) != query.id:
+                    return
+                self.__inline_queries.pop(query.from_user.id)
+
+                try:
+                    remote = await self.__search_cities(query.query)
+                except Exception as err:
+                    print(err)
+                    remote = []
+                # Индекс уже содержит найденные API города; остальные ответы API (не по началу названия) - в конце.
+                cities = dict(self.__cities.search(query.query, self.INLINE_RESULTS))
+                for gaia_id, display_name in remote:
+                    cities.setdefault(gaia_id, display_name)
+                cities = list(cities.items())[:self.INLINE_RESULTS]
+
+            await self.__bot.answer_inline_query(query.id, [
+                types.InlineQueryResultArticle(gaia_id, display_name, types.InputTextMessageContent(display_name))
+                for gaia_id, display_name in cities])
+        except Exception as err:
+            print(err)
+
+    # -----------------------------------(/bestdeal)-----------------------------------<Begin>
+
+    # Callback: bestdeal_menu[gaiaId]
+    @__callback_func
+    async def __callback_bestdeal_menu(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке bestdeal_menu[gaiaId].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        self.__main_settings[call.message.chat.id]['cityId'] = call.data[13:]
+        await self.__bestdeal_menu(call.message.chat.id)
+
+    async def __bestdeal_menu(self, chat_id: int) -> None:
+        """
+        Метод, выполняющийся в случае введения команды bestdeal после выбора города. Открывает меню с настройками bestdeal.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        self.__bestdeal_settings[chat_id] = self.__bestdeal_settings.get(chat_id, {'price': {'min': None, 'max': None},
+                                                                                   'dist': {'min': None, 'max': None},
+                                                                                   'sort': 0})
+
+        bestdeal_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: bestdeal_filters[price]_[min], bestdeal_filters[price]_[max]
+        bestdeal_keyboard.row(
+            types.InlineKeyboardButton(text=f"Мин. цена ($): {self.__bestdeal_settings[chat_id]['price']['min']}",
+                                       callback_data='bestdeal_filtersprice_min'),
+            types.InlineKeyboardButton(text=f"Макс. цена ($): {self.__bestdeal_settings[chat_id]['price']['max']}",
+                                       callback_data='bestdeal_filtersprice_max'))
+        # Button: bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max]
+        bestdeal_keyboard.row(
+            types.InlineKeyboardButton(text=f"Мин. дистанция (км): {self.__bestdeal_settings[chat_id]['dist']['min']}",
+                                       callback_data='bestdeal_filtersdist_min'),
+            types.InlineKeyboardButton(text=f"Макс. дистанция (км): {self.__bestdeal_settings[chat_id]['dist']['max']}",
+                                       callback_data='bestdeal_filtersdist_max'))
+        # Button: bestdeal_change_sort
+        bestdeal_keyboard.row(types.InlineKeyboardButton(
+            text='Сортировка по %sцене и дистанции, %sцене, %sдистанции' % tuple(
+                map(lambda sort: '\U00002705' * (self.__bestdeal_settings[chat_id]['sort'] == sort), (0, 1, 2))),
+            callback_data='bestdeal_change_sort'))
+        # Button: bestdeal_exit
+        bestdeal_keyboard.row(types.InlineKeyboardButton(text='Готово', callback_data='bestdeal_exit'))
+
+        self.__last_keyboard_id[chat_id] = await self.__show(chat_id, 'Ваши текущие настройки bestdeal:',
+                                                             bestdeal_keyboard)
+
+    # Callback: bestdeal_filters[price]_[min], bestdeal_filters[price]_[max], bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max]
+    @__callback_func
+    async def __callback_bestdeal_filters(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопкам bestdeal_filters[price]_[min], bestdeal_filters[price]_[max], bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        p_d, min_max = call.data[16:].split('_')
+        await self.__show(call.message.chat.id,
+                          f"Введите {'минимальную' if min_max == 'min' else 'максимальную'} {'цену' if p_d == 'price' else 'дистанцию'}:")
+        self.__transition(call.message.chat.id, 'bestdeal_filters', p_d, min_max)
+
+    async def __bestdeal_filters(self, message: Message, p_d: str, min_max: str) -> None:
+        """
+        Метод, выполняющий проверку и запись выбранного для настройки фильтра для bestdeal.
+
+        :param:
+          message (Message): сообщение.
+          p_d (str): выбранная настройка из price\dist.
+          min_max (str): выбранная настройка из min\max.
+        """
+        try:
+            min_max = ['min', 'max'] if min_max == 'min' else ['max', 'min']
+            result = float(message.text)
+
+            if result < 0:
+                await self.__bot.send_message(message.chat.id,
+                                              f"\U00002620 Ошибка.\U00002620 \n{'Цена' if p_d == 'price' else 'Дистанция'} не может быть меньше 0.")
+            elif self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] and (
+                    (min_max[1] == 'max' and self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] < result) or (
+                    min_max[1] == 'min' and self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] > result)):
+                await self.__bot.send_message(message.chat.id,
+                                              f"\U00002620 Ошибка.\U00002620 \nМинимальная {'цена' if p_d == 'price' else 'дистанция'} должна быть не больше максимальной.")
+            else:
+                self.__bestdeal_settings[message.chat.id][p_d][min_max[0]] = result
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+        await self.__bestdeal_menu(message.chat.id)
+
+    # Callback: bestdeal_change_sort
+    @__callback_func
+    async def __callback_bestdeal_change_sort(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке bestdeal_change_sort.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        self.__bestdeal_settings[call.message.chat.id]['sort'] = (self.__bestdeal_settings[call.message.chat.id][
+                                                                      'sort'] + 1) % 3
+
+        await self.__bestdeal_menu(call.message.chat.id)
+
+    # -----------------------------------(/bestdeal)-----------------------------------<End>
+
+    # Callback: bestdeal_exit, main_city[gaiaId]
+    @__callback_func
+    async def __callback_main_city(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопкам bestdeal_exit, main_city[gaiaId].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        self.__main_settings[call.message.chat.id]['cityId'] = self.__main_settings[call.message.chat.id].get('cityId',
+                                                                                                              call.data[
+                                                                                                              9:])
+        self.__start_prefetch(call.message.chat.id)
+        await self.__show(call.message.chat.id, 'Введите колчество отелей (максимум 5):')
+        self.__transition(call.message.chat.id, 'main_city', call.data)
+
+    async def __main_hotels(self, message: Message, call_data: str) -> None:
+        """
+        Метод, выполняющий проверку и запись желаемого количества отелей для поиска. Максимум 5.
+
+        :param:
+          message (Message): сообщение.
+          call_data (str): название вызова предыдущего шага.
+        """
+        try:
+            hotels = int(message.text)
+
+            if hotels < 1:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть больше 0.')
+                await self.__errorContinue(message.chat.id, call_data)
+            elif hotels > 5:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не больше 5.')
+                await self.__errorContinue(message.chat.id, call_data)
+            else:
+                self.__main_settings[message.chat.id]['hotels'] = hotels
+                photo_keyboard = types.InlineKeyboardMarkup()
+
+                # Button: photo_yes
+                photo_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data='photo_yes'))
+                # Button: photo_no
+                photo_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='photo_no'))
+
+                self.__last_keyboard_id[message.chat.id] = (
+                    await self.__bot.send_message(message.chat.id, "Показать фотографии отелей?",
+                                                  reply_markup=photo_keyboard)).id
+        except:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
+            await self.__errorContinue(message.chat.id, call_data)
+
+    # Callback: photo_yes
+    @__callback_func
+    async def __callback_photo_yes(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке photo_yes.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__show(call.message.chat.id, 'Введите колчество фотографий (максимум 5):')
+        self.__transition(call.message.chat.id, 'photo_yes', call.data)
+
+    # Callback: photo_no
+    @__callback_func
+    async def __callback_photo_no(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке photo_no.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        self.__main_settings[call.message.chat.id]['photo'] = 0
+        await self.__search(call.message.chat.id)
+
+    async def __main_photo(self, message: Message, call_data: str) -> None:
+        """
+        Метод, выполняющий проверку и запись желаемого количества фотографий отелей для поиска. Максимум 5.
+
+        :param:
+          message (Message): сообщение.
+          call_data (str): название вызова предыдущего шага.
+        """
+        try:
+            photo = int(message.text)
+
+            if photo < 0:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не меньше 0.')
+                await self.__errorContinue(message.chat.id, call_data)
+                return
+            elif photo > 5:
+                await self.__bot.send_message(message.chat.id,
+                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не больше 5.')
+                await self.__errorContinue(message.chat.id, call_data)
+                return
+        except:
+            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
+            await self.__errorContinue(message.chat.id, call_data)
+            return
+
+        self.__main_settings[message.chat.id]['photo'] = photo
+        await self.__search(message.chat.id)
+
+    def __search_params(self, chat_id: int) -> dict:
+        """
+        Метод, собирающий параметры текущего поиска чата, от которых зависит список отелей.
+        Параметры не зависят от дальнейших изменений настроек чата.
+
+        :param:
+          chat_id (int): id чата.
+
+        :return:
+          params (dict): режим, город, даты, комнаты и настройки bestdeal.
+        """
+        return {'mode': self.__main_settings[chat_id]['mode'], 'cityId': self.__main_settings[chat_id]['cityId'],
+                'in': self.__data[chat_id]['in'], 'out': self.__data[chat_id]['out'],
+                'rooms': copy.deepcopy(self.__data[chat_id]['rooms']),
+                'bestdeal': copy.deepcopy(self.__bestdeal_settings[chat_id]) if self.__main_settings[chat_id][
+                                                                                   'mode'] == 'bestdeal' else None}
+
+    def __main_payload(self, params: dict) -> dict:
+        """
+        Метод, собирающий настройки поиска для https://hotels4.p.rapidapi.com/properties/v2/list.
+        Для lowprice всегда запрашивается CURSOR_HOTELS отелей, чтобы поиски с разным количеством отелей
+        использовали один и тот же ответ из кэша, а лишние отели можно было вывести кнопкой "Показать еще".
+
+        :param:
+          params (dict): параметры поиска (__search_params).
+
+        :return:
+          payload (dict): настройки поиска.
+        """
+        payload = dict()
+
+        payload['destination'] = {'regionId': params['cityId']}
+        payload['checkInDate'] = {
+            'day': params['in'].day,
+            'month': params['in'].month,
+            'year': params['in'].year
+        }
+        payload['checkOutDate'] = {
+            "day": params['out'].day,
+            "month": params['out'].month,
+            "year": params['out'].year
+        }
+        payload['rooms'] = []
+        for room in params['rooms']:
+            payload['rooms'].append({
+                'adults': room[0],
+                'children': list(map(lambda age: {'age': age}, room[1]))
+            })
+        payload['resultsStartingIndex'] = 0
+        payload['resultsSize'] = self.CURSOR_HOTELS if params['mode'] == 'lowprice' else 200
+        payload['sort'] = 'PROPERTY_CLASS' if params['mode'] == 'highprice' else 'PRICE_LOW_TO_HIGH'
+        payload['filters'] = {'price': {'min': 1, 'max': 999999}}
+
+        return payload
+
+    async def __list_page(self, payload: dict, refresh: bool = False, ttl: float = None) -> list:
+        """
+        Метод, запрашивающий одну страницу отелей из https://hotels4.p.rapidapi.com/properties/v2/list.
+        Первые страницы поисков пользователей запоминаются для обновления кэша популярных поисков (__prewarm).
+
+        :param:
+          payload (dict): настройки поиска.
+          refresh (bool): не использовать страницу из кэша (фоновые запросы, не учитываются как поиски пользователей).
+          ttl (float): время жизни страницы в кэше вместо CACHE_TTL.
+
+        :return:
+          properties (list): отели страницы.
+        """
+        if not refresh and payload['resultsStartingIndex'] == 0:
+            self.__recent_searches.append(json.dumps(payload, sort_keys=True))
+        response = await self.__api.request("POST", "https://hotels4.p.rapidapi.com/properties/v2/list", ttl, refresh,
+                                            json=payload)
+        properties = response['data']['propertySearch']['properties'] if response['data'] else []
+        self.__index_places(payload, properties)
+        return properties
+
+    async def __main_list(self, params: dict, hotels: int, refresh: bool = False, more: bool = False) -> list:
+        """
+        Метод, возвращающий hotels лучших по выбранному режиму отелей.
+
+        :param:
+          params (dict): параметры поиска (__search_params).
+          hotels (int): количество отелей.
+          refresh (bool): не использовать страницы из кэша.
+          more (bool): вернуть после hotels отелей и остальные подходящие отели из уже загруженных страниц.
+
+        :return:
+          response (list): отели в порядке вывода.
+        """
+        payload = self.__main_payload(params)
+
+        if params['mode'] == 'bestdeal':
+            return await self.__bestdeal_result(params['bestdeal'], payload, hotels, refresh, more)
+
+        response = await self.__list_page(payload, refresh)
+
+        if params['mode'] == 'highprice':
+            response = sorted(response, key=lambda item: item['price']['lead']['amount'])[::-1]
+
+        return response if more else response[:hotels]
+
+    async def __main_result(self, chat_id: int) -> None:
+        """
+        Метод, который ищет подходящие к выбранным настройкам отели в https://hotels4.p.rapidapi.com/properties/v2/list.
+        Если для чата уже запущена предварительная загрузка (__start_prefetch), использует её результат.
+        Остальные найденные отели запоминаются для кнопки "Показать еще" (__more_result).
+
         :param:
-          message (Message): сообщение.
-          n (int): индекс комнаты.
-          m (int): индекс ребенка.
-          msg (Message): предыдущие сообщение. Требуется для удаления клавиатуры.
+          chat_id (int): id чата.
         """
-        await self.__bot.edit_message_reply_markup(chat_id=msg.chat.id, message_id=msg.id, reply_markup=None)
+        # Настройки поиска: новая основная команда заменяет настройки чата, а не изменяет их.
+        settings = self.__main_settings[chat_id]
         try:
-            result = int(message.text)
-            if result < 0 or result > 17:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nВозраст ребенка должен быть от 0 до 17.')
-            else:
-                self.__data[message.chat.id]['rooms'][n][1][m] = result
-        except ValueError:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
+            details = dict()
+            prefetch = self.__prefetch.pop(chat_id, None)
+            try:
+                if prefetch:
+                    response, details = await prefetch
+            except Exception as err:
+                print(err)
+                prefetch = None
+            if not prefetch:
+                response = await self.__main_list(self.__search_params(chat_id), settings['hotels'], more=True)
+
+            if len(response) == 0:
+                await self.__bot.send_message(chat_id, 'Отелей по запросу не найдено.')
+                return
+
+            hotels_log = await self.__send_hotels(chat_id, response[:settings['hotels']], settings['photo'], details)
+            await self.__history.append(chat_id, dict(settings['history'], hotels=hotels_log))
+
+            self.__cursors.pop(chat_id, None)
+            if len(response) > settings['hotels']:
+                self.__cursors[chat_id] = {'id': next(self.__cursor_ids), 'hotels': response[settings['hotels']:],
+                                           'photo': settings['photo'], 'history': settings['history'],
+                                           'expires': time.time() + self.CURSOR_TTL}
+                await self.__more_keyboard(chat_id)
         except Exception as err:
             print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
-        await self.__reg_room(message, n)
+            await self.__result_error(chat_id)
+
+    async def __send_hotels(self, chat_id: int, hotels: list, photo: int, details: dict = None) -> list:
+        """
+        Метод, выводящий отели hotels. Детали всех отелей запрашиваются одновременно, а выводятся отели по порядку.
+
+        :param:
+          chat_id (int): id чата.
+          hotels (list): отели из списка.
+          photo (int): количество фото каждого отеля.
+          details (dict): уже загруженные результаты __hotel_info по id отеля.
+
+        :return:
+          hotels_log (list): выведенные отели для истории.
+        """
+        details = details or dict()
+        infos = await asyncio.gather(*(self.__hotel_detail(hotel['id'], photo, details.get(hotel['id']))
+                                       for hotel in hotels))
+
+        hotels_log = []
+        for hotel, (address, photoes) in zip(hotels, infos):
+            name = hotel['name']
+            price = hotel['price']['lead']['formatted']
+            dist = round(hotel['destinationInfo']['distanceFromDestination']['value'] / 0.621371, 2)
+
+            await self.__bot.send_message(chat_id,
+                                          f"Название: {name}\nЦена: {price}\nДистанция от центра (км): {dist}\nАдрес: {address}")
+
+            if len(photoes):
+                await self.__send_photos(chat_id, photoes)
+
+            hotels_log.append({'name': name, 'price': price, 'dist': dist, 'address': address, 'photoes': photoes})
+
+        return hotels_log
+
+    async def __result_error(self, chat_id: int) -> None:
+        """
+        Метод, предлагающий повторить поиск после ошибки API.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        error_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: result_error
+        error_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data='result_error'))
+        # Button: ec_no
+        error_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='ec_no'))
+
+        self.__last_keyboard_id[chat_id] = (await self.__bot.send_message(chat_id,
+                                                                          '\U00002620 API не отвечает на запрос. \U00002620 \nХотите повторить попытку?',
+                                                                          reply_markup=error_keyboard)).id
+
+    # -----------------------------------(more)-----------------------------------<Begin>
+
+    async def __more_keyboard(self, chat_id: int) -> None:
+        """
+        Метод, выводящий кнопку "Показать еще" для запомненных отелей поиска чата.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        cursor = self.__cursors[chat_id]
+        # Отели хранятся в порядке создания: устаревшие удаляются с начала.
+        self.__cursors.move_to_end(chat_id)
+        while self.__cursors and next(iter(self.__cursors.values()))['expires'] < time.time():
+            self.__cursors.popitem(last=False)
+
+        more_keyboard = types.InlineKeyboardMarkup()
+
+        # Button: more_[id]
+        more_keyboard.row(types.InlineKeyboardButton(
+            text=f"Показать еще {min(self.MORE_HOTELS, len(cursor['hotels']))}", callback_data=f"more_{cursor['id']}"))
+
+        self.__last_keyboard_id[chat_id] = (
+            await self.__bot.send_message(chat_id, f"Найдено еще отелей: {len(cursor['hotels'])}.",
+                                          reply_markup=more_keyboard)).id
+
+    # Callback: more_[id]
+    @__callback_func
+    async def __callback_more(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке more_[id].
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        cursor = self.__cursors.get(call.message.chat.id)
+        if cursor is None or str(cursor['id']) != call.data[5:] or cursor['expires'] < time.time():
+            await self.__bot.send_message(call.message.chat.id, 'Результаты поиска устарели, повторите поиск.')
+            return
+
+        await self.__search(call.message.chat.id, self.__more_result(call.message.chat.id, cursor))
+
+    async def __more_result(self, chat_id: int, cursor: dict) -> None:
+        """
+        Метод, выводящий следующие MORE_HOTELS запомненных отелей поиска без новых запросов списка отелей.
+
+        :param:
+          chat_id (int): id чата.
+          cursor (dict): запомненные отели поиска.
+        """
+        try:
+            hotels_log = await self.__send_hotels(chat_id, cursor['hotels'][:self.MORE_HOTELS], cursor['photo'])
+            await self.__history.append(chat_id, dict(cursor['history'], hotels=hotels_log))
+
+            cursor['hotels'] = cursor['hotels'][self.MORE_HOTELS:]
+            if not cursor['hotels']:
+                if self.__cursors.get(chat_id) is cursor:
+                    del self.__cursors[chat_id]
+            elif self.__cursors.get(chat_id) is cursor:
+                await self.__more_keyboard(chat_id)
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(chat_id, '\U00002620 API не отвечает на запрос. \U00002620')
+
+    # -----------------------------------(more)-----------------------------------<End>
+
+    async def __bestdeal_result(self, settings: dict, payload: dict, hotels_count: int, refresh: bool = False,
+                                more: bool = False) -> list:
+        """
+        Метод, специализированный на поиске отелей для команды bestdeal.
+        Методы сортировки по индексам:
+          0. По цене от меньшего к большему.
+          1. По расстоянию от центра от меньшего к большему.
+          2. По цене и расстоянию. Специальный метод сортировки, который отбирает отели одновременно из двух списков, рассортированных один по цене, другой по расстоянию, выбирая те, которые появились в обоих списках раньше остальных.
+
+        :param:
+          settings (dict): настройки bestdeal.
+          payload (dict): настройки поиска.
+          hotels_count (int): количество отелей.
+          refresh (bool): не использовать страницы из кэша.
+          more (bool): для сортировок 1 и 2 - добавить остальные подходящие отели последней загруженной страницы.
+        """
+
+        async def bestdeal_get_response(sort: str) -> None:
+            """
+            Метод для сортировки [0], запрашивающий следущие отели, начиная с индекса starting_index[sort], для списка sort.
+
+            sort (str): сортировка списка (price\dist).
+            """
+            payload['sort'] = 'PRICE_LOW_TO_HIGH' if sort == 'price' else 'DISTANCE'
+            payload['resultsStartingIndex'] = starting_index[sort]
+            response[sort] = await self.__list_page(payload, refresh)
+            if len(response[sort]) == 0:
+                end[sort] = True
+            else:
+                can_continue[sort] = len(response[sort]) == 200
+                response[sort] = list(filter(
+                    lambda hotel: dist['min'] <= hotel['destinationInfo']['distanceFromDestination']['value'] <= dist[
+                        'max'], response[sort]))
+
+        async def bestdeal_next_hotel(sort: str) -> None:
+            """
+            Метод для сортировки [0], выбирающий следущий в списке sort отель и проверающий, если он появился в обоих списках.
+
+            sort (str): сортировка списка (price\dist).
+            """
+            try:
+                hotel = response[sort].pop(0)
+                if hotel['id'] in hotels_found:
+                    hotels.append(hotel)
+                    if len(hotels) == hotels_count:
+                        return True
+                else:
+                    hotels_found.append(hotel['id'])
+            except:
+                if can_continue[sort]:
+                    starting_index[sort] += 200
+                    await bestdeal_get_response(sort)
+                else:
+                    end[sort] = True
+
+        payload['filters']['price']['min'] = settings['price']['min'] if \
+        settings['price']['min'] else 1
+        payload['filters']['price']['max'] = settings['price']['max'] if \
+        settings['price']['max'] else (
+            999999 if settings['price']['max'] == None else 1)
+        dist = {'min': (settings['dist']['min'] if settings['dist'][
+            'min'] else 0) * 0.621371, 'max': (settings['dist']['max'] if
+                                               settings['dist'][
+                                                   'max'] != None else 999999.0) * 0.621371}
+        hotels = []
+
+        if settings['sort'] in (1, 2):
+            payload['sort'] = 'PRICE_LOW_TO_HIGH' if settings['sort'] == 1 else 'DISTANCE'
+            # Загружаемые страницы по индексу первого отеля. Страницы обрабатываются по порядку, а следующие страницы
+            # запрашиваются заранее, если по уже просмотренным видно, что подходящих отелей на них мало.
+            pages = dict()
+            index = payload['resultsStartingIndex']
+            scanned = 0
+
+            try:
+                while True:
+                    if scanned:
+                        rate = len(hotels) / scanned
+                        ahead = self.BESTDEAL_PAGES if rate == 0 else math.ceil(
+                            (hotels_count - len(hotels)) / (rate * 200))
+                    else:
+                        ahead = 1
+                    for start in range(index, index + min(ahead, self.BESTDEAL_PAGES) * 200, 200):
+                        if start not in pages:
+                            pages[start] = asyncio.create_task(
+                                self.__list_page(dict(payload, resultsStartingIndex=start), refresh))
+
+                    response = await pages.pop(index)
+                    scanned += len(response)
+
+                    for hotel in response:
+                        if settings['sort'] == 2 and hotel['destinationInfo']['distanceFromDestination']['value'] > \
+                                dist['max']:
+                            return hotels
+                        if dist['min'] <= hotel['destinationInfo']['distanceFromDestination']['value'] <= dist['max']:
+                            hotels.append(hotel)
+                            if len(hotels) == hotels_count and not more:
+                                return hotels
+
+                    if len(hotels) >= hotels_count or len(response) < 200:
+                        return hotels
+                    index += 200
+            finally:
+                for task in pages.values():
+                    if task.done() and not task.cancelled():
+                        task.exception()
+                    else:
+                        task.cancel()
+        else:
+            response = dict()
+            end = {'price': False, 'dist': False}
+            can_continue = {'price': False, 'dist': False}
+            starting_index = {'price': 0, 'dist': 0}
+            hotels_found = []
+
+            await bestdeal_get_response('price')
+            await bestdeal_get_response('dist')
+
+            while not end['price'] and not end['dist']:
+                if await bestdeal_next_hotel('price') or await bestdeal_next_hotel('dist'):
+                    break
+
+            if len(hotels) == hotels_count or end['price'] == end['dist']:
+                return hotels
+
+            if end['price']:
+                while not end['dist']:
+                    if await bestdeal_next_hotel('dist'):
+                        break
+            else:
+                while not end['price']:
+                    if await bestdeal_next_hotel('price'):
+                        break
+
+            return hotels
+
+    async def __hotel_info(self, hotel_id: str, refresh: bool = False) -> list:
+        """
+        Метод, запрашивающий детали (адрес и все фото) отеля с id hotel_id из https://hotels4.p.rapidapi.com/properties/v2/detail.
+
+        :param:
+          hotel_id (str): id отеля.
+          refresh (bool): обновить детали в кэше (для __prewarm).
+
+        :return:
+          [address, gallery] (list[Any]): адрес и ссылки на все фото отеля.
+        """
+        response = await self.__api.request("POST", "https://hotels4.p.rapidapi.com/properties/v2/detail",
+                                            refresh=refresh, json={"propertyId": hotel_id})
+
+        coordinates = response['data']['propertyInfo']['summary']['location'].get('coordinates')
+        if coordinates:
+            self.__geo.add(hotel_id, coordinates['latitude'], coordinates['longitude'])
+        address = response['data']['propertyInfo']['summary']['location']['address']['addressLine']
+        gallery = [image['image']['url'] for image in response['data']['propertyInfo']['propertyGallery']['images']]
+
+        return [address, gallery]
+
+    async def __hotel_detail(self, hotel_id: str, photo: int, info: list = None) -> list:
+        """
+        Метод, возвращающий адрес и photo случайных фото отеля с id hotel_id.
+
+        :param:
+          hotel_id (str): id отеля.
+          photo (int): количество фото.
+          info (list): уже загруженный результат __hotel_info, если есть.
+
+        :return:
+          [address, photoes] (list[Any]): адрес и фото отеля.
+        """
+        address, gallery = info if info else await self.__hotel_info(hotel_id)
+
+        return [address, random.sample(gallery, min(int(photo), len(gallery)))]
+
+    # -----------------------------------(prefetch)-----------------------------------<Begin>
+
+    def __start_prefetch(self, chat_id: int) -> None:
+        """
+        Метод, запускающий в фоне загрузку списка отелей и деталей первых из них, пока пользователь отвечает на вопросы
+        о количестве отелей и фотографий. Результат забирает __main_result.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        if chat_id in self.__prefetch:
+            return
+
+        task = asyncio.create_task(self.__prefetch_result(chat_id))
+        # Исключение заберет __main_result, а если до него не дойдет - помечаем как обработанное.
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self.__prefetch[chat_id] = task
+        # Пользователь может не ответить на вопросы: тогда загрузка удаляется через PREFETCH_TTL. Таймер не держит
+        # задачу (и загруженные отели), если ее уже забрал __main_result.
+        asyncio.get_running_loop().call_later(self.PREFETCH_TTL, self.__expire_prefetch, chat_id, weakref.ref(task))
+
+    def __expire_prefetch(self, chat_id: int, task: weakref.ref) -> None:
+        """
+        Метод, удаляющий предварительную загрузку task чата, если она все еще не использована.
+
+        :param:
+          chat_id (int): id чата.
+          task (weakref.ref): задача загрузки.
+        """
+        if task() is not None and self.__prefetch.get(chat_id) is task():
+            self.__cancel_prefetch(chat_id)
+
+    async def __prefetch_result(self, chat_id: int) -> list:
+        """
+        Метод, выполняющий предварительную загрузку для __start_prefetch.
+
+        :param:
+          chat_id (int): id чата.
+
+        :return:
+          [hotels, details] (list[Any]): отели (PREFETCH_HOTELS и остальные загруженные, см. __main_list)
+            и результаты __hotel_info по id отеля.
+        """
+        hotels = await self.__main_list(self.__search_params(chat_id), self.PREFETCH_HOTELS, more=True)
+        infos = await asyncio.gather(*(self.__hotel_info(hotel['id']) for hotel in hotels[:self.PREFETCH_DETAILS]),
+                                     return_exceptions=True)
+
+        return [hotels, {hotel['id']: info for hotel, info in zip(hotels, infos) if not isinstance(info, Exception)}]
+
+    def __cancel_prefetch(self, chat_id: int) -> None:
+        """
+        Метод, отменяющий предварительную загрузку, если пользователь вышел из поиска.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        task = self.__prefetch.pop(chat_id, None)
+        if task:
+            task.cancel()
+
+    # -----------------------------------(prefetch)-----------------------------------<End>
+
+    # -----------------------------------(search)-----------------------------------<Begin>
+
+    async def __search(self, chat_id: int, search: Coroutine = None) -> None:
+        """
+        Метод, выполняющий поиск (по умолчанию __main_result) отдельной задачей чата, чтобы его можно было отменить
+        (__cancel_search). Одновременно у чата может выполняться не больше CHAT_SEARCHES поисков.
+
+        :param:
+          chat_id (int): id чата.
+          search (Coroutine): поиск.
+        """
+        search = search or self.__main_result(chat_id)
+        if len(self.__search_tasks.get(chat_id, ())) >= self.CHAT_SEARCHES:
+            search.close()
+            await self.__bot.send_message(chat_id, 'Поиск уже выполняется, дождитесь результатов.')
+            return
+
+        task = asyncio.create_task(search)
+        self.__search_tasks.setdefault(chat_id, set()).add(task)
+        try:
+            await task
+        except asyncio.CancelledError:
+            # Отменен сам поиск, а не обработчик.
+            if not task.cancelled():
+                raise
+        finally:
+            self.__search_tasks[chat_id].discard(task)
+            if not self.__search_tasks[chat_id]:
+                del self.__search_tasks[chat_id]
+
+    def __cancel_search(self, chat_id: int) -> None:
+        """
+        Метод, отменяющий выполняющиеся поиски чата вместе с их запросами к API, которые больше никто не ждет.
+
+        :param:
+          chat_id (int): id чата.
+        """
+        for task in self.__search_tasks.get(chat_id, ()):
+            task.cancel()
+
+    # -----------------------------------(search)-----------------------------------<End>
+
+    # -----------------------------------(prewarm)-----------------------------------<Begin>
+
+    async def __prewarm(self) -> None:
+        """
+        Метод, обновляющий в кэше первые страницы самых частых из последних PREWARM_SEARCHES поисков
+        (город, даты, комнаты, режим) и детали их первых PREWARM_DETAILS отелей. Тратит не больше prewarm_budget
+        запросов и не больше половины оставшейся на сутки квоты.
+        """
+        budget = min(self.__prewarm_budget, self.__api.quota.remaining() // 2)
+        refreshed = 0
+
+        for key, _ in Counter(self.__recent_searches).most_common():
+            if budget < 1:
+                break
+            payload = json.loads(key)
+            if date(**payload['checkInDate']) < date.today():
+                continue
+
+            properties = await self.__list_page(payload, True, self.PREWARM_TTL)
+            budget -= 1
+            refreshed += 1
+            if payload['sort'] == 'PROPERTY_CLASS':
+                properties = sorted(properties, key=lambda item: item['price']['lead']['amount'])[::-1]
+
+            for hotel in properties[:int(min(self.PREWARM_DETAILS, budget))]:
+                await self.__hotel_info(hotel['id'], True)
+                budget -= 1
+
+        print(f'Кэш обновлен для {refreshed} популярных поисков, запросов к API за сутки: {self.__api.quota.used()}.')
+
+    async def __prewarm_periodically(self) -> None:
+        """
+        Метод, запускающий __prewarm раз в PREWARM_INTERVAL секунд в часы PREWARM_HOURS.
+        """
+        while self.__prewarm_budget:
+            await asyncio.sleep(self.PREWARM_INTERVAL)
+            if datetime.now().hour in self.PREWARM_HOURS:
+                try:
+                    await self.__prewarm()
+                except Exception as err:
+                    print(err)
+
+    # -----------------------------------(prewarm)-----------------------------------<End>
+
+    # Callback: result_error
+    @__callback_func
+    async def __callback_result_error(self, call: CallbackQuery) -> None:
+        """
+        Метод, отвечающий кнопке result_error.
+
+        :param:
+          call (CallbackQuery): вызов.
+        """
+        await self.__search(call.message.chat.id)
 
-    # Callback: add_child[n]
-    @__callback_func
-    async def __callback_add_child(self, call: CallbackQuery) -> None:
+    # ---------------------------------------------[main]---------------------------------------------<End>
+
+    # ---------------------------------------------[/flexdates]---------------------------------------------<Begin>
+
+    @__command_func
+    async def __flexdates(self, message: Message) -> None:
         """
-        Метод, отвечающий кнопке add_child[n].
+        Метод, отвечающий команде /flexdates [с] [по] [ночей]: запоминает окно дат заезда и длительность
+        и спрашивает город.
 
         :param:
-          call (CallbackQuery): вызов.
+          message (Message): сообщение.
         """
-        n = int(call.data[9:])
-        self.__data[call.message.chat.id]['rooms'][n][1].append(0)
-        self.__data[call.message.chat.id]['count'] += 1
-        await self.__reg_room(call.message, n)
+        self.__cancel_search(message.chat.id)
+        try:
+            _, start, stop, nights = message.text.split()
+            start = datetime.strptime(start, '%d.%m.%Y').date()
+            stop = datetime.strptime(stop, '%d.%m.%Y').date()
+            nights = int(nights)
+            if not (date.today() <= start <= stop and (stop - start).days < self.FLEX_DATES and
+                    0 < nights <= self.FLEX_NIGHTS):
+                raise ValueError
+        except ValueError:
+            await self.__bot.send_message(message.chat.id,
+                                          f'Использование: /flexdates ДД.ММ.ГГГГ ДД.ММ.ГГГГ N\nДаты заезда - не раньше сегодняшней, не больше {self.FLEX_DATES} дней, ночей - от 1 до {self.FLEX_NIGHTS}.')
+            return
 
-    # Callback: remove_room[n]
+        msg = await self.__bot.send_message(message.chat.id, 'Введите название города:')
+        self.__main_settings[message.chat.id] = {'mode': 'flexdates', 'flex': (start, stop, nights)}
+        self.__transition(msg.chat.id, 'main_command')
+
+    # Callback: flex_city[gaiaId]
     @__callback_func
-    async def __callback_remove_room(self, call: CallbackQuery) -> None:
+    async def __callback_flex_city(self, call: CallbackQuery) -> None:
         """
-        Метод, отвечающий кнопке remove_room[n].
+        Метод, отвечающий кнопкам flex_city[gaiaId].
 
         :param:
           call (CallbackQuery): вызов.
         """
-        n = int(call.data[11:])
-        self.__data[call.message.chat.id]['count'] -= self.__data[call.message.chat.id]['rooms'][n][0] + len(
-            self.__data[call.message.chat.id]['rooms'][n][1])
-        self.__data[call.message.chat.id]['rooms'].pop(n)
-        await self.__reg(call.message)
+        start, stop, nights = self.__main_settings[call.message.chat.id]['flex']
+        await self.__bot.send_message(call.message.chat.id, 'Ищу самые дешевые даты...')
+        await self.__search(call.message.chat.id, self.__flex_result(call.message.chat.id, call.data[9:], start, stop,
+                                                                     nights))
 
-    # Callback: exit_room
-    @__callback_func
-    async def __callback_exit_room(self, call: CallbackQuery) -> None:
+    async def __flex_result(self, chat_id: int, city_id: str, start: date, stop: date, nights: int) -> None:
         """
-        Метод, отвечающий кнопке exit_reg.
+        Метод, запрашивающий список отелей для каждой даты заезда от start до stop одновременно (не больше
+        FLEX_CONCURRENCY запросов сразу и не больше оставшейся квоты) и выводящий одним сообщением FLEX_RESULTS
+        самых дешевых дат с самым дешевым отелем на каждую. Страницы берутся из кэша, если есть.
 
         :param:
-          call (CallbackQuery): вызов.
+          chat_id (int): id чата.
+          city_id (str): id города.
+          start (date): первая дата заезда.
+          stop (date): последняя дата заезда.
+          nights (int): количество ночей.
         """
-        await self.__reg(call.message)
+        rooms = self.__data.get(chat_id, {}).get('rooms', [[1, []]])
+        semaphore = asyncio.Semaphore(self.FLEX_CONCURRENCY)
+        budget = self.__api.quota.remaining()
+        spent = self.__api.quota.used()
+        pending = 0
+        skipped = 0
+
+        async def check_in(day: date) -> list:
+            nonlocal pending, skipped
+            async with semaphore:
+                # Выполняющиеся запросы считаются потраченными, пока не станет известно, взяты ли они из кэша.
+                if self.__api.quota.used() - spent + pending >= budget:
+                    skipped += 1
+                    return []
+                payload = self.__main_payload({'mode': 'lowprice', 'cityId': city_id, 'in': day,
+                                               'out': day + timedelta(days=nights), 'rooms': rooms})
+                pending += 1
+                try:
+                    hotels = await self.__list_page(payload)
+                finally:
+                    pending -= 1
+                return [min(((hotel['price']['lead']['amount'], day, hotel['name'], hotel['price']['lead']['formatted'])
+                             for hotel in hotels), key=lambda option: option[0])] if hotels else []
 
-    # -----------------------------------(reg_room_menu)-----------------------------------<End>
+        try:
+            days = [start + timedelta(days=i) for i in range((stop - start).days + 1)]
+            pages = await asyncio.gather(*(check_in(day) for day in days), return_exceptions=True)
+            options = heapq.nsmallest(self.FLEX_RESULTS, itertools.chain.from_iterable(
+                page for page in pages if not isinstance(page, Exception)), key=lambda option: option[:2])
+            failed = sum(isinstance(page, Exception) for page in pages) + skipped
+
+            if not options:
+                await self.__bot.send_message(chat_id, 'Отелей на эти даты не найдено.')
+                return
 
-    # ---------------------------------------------[/reg]---------------------------------------------<End>
+            text = f'Самые дешевые даты на {nights} ноч.:\n\n' + '\n\n'.join(
+                f"{day:%d.%m.%Y} - {day + timedelta(days=nights):%d.%m.%Y}\nНазвание: {name}\nЦена: {price}"
+                for _, day, name, price in options)
+            if failed:
+                text += f'\n\nНе удалось проверить дат: {failed}.'
+            await self.__bot.send_message(chat_id, text[:self.MESSAGE_LIMIT])
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(chat_id, '\U00002620 API не отвечает на запрос. \U00002620')
 
-    # ---------------------------------------------[main]---------------------------------------------<Begin>
+    # ---------------------------------------------[/flexdates]---------------------------------------------<End>
+
+    # ---------------------------------------------[/watch]---------------------------------------------<Begin>
 
     @__command_func
-    async def __main_commands(self, message: Message) -> None:
+    async def __watch(self, message: Message) -> None:
         """
-        Метод, отвечающий основным командам (lowprice, highprice, bestdeal) бота.
+        Метод, отвечающий команде watch. Подписывает чат на изменение цен последнего выполненного поиска.
+        Одинаковые подписки разных чатов объединяются и проверяются одним поиском.
 
         :param:
           message (Message): сообщение.
         """
-        try:
-            if self.__data[message.chat.id]['in'] == None or self.__data[message.chat.id]['out'] == None:
-                raise Exception
+        settings = self.__main_settings.get(message.chat.id, dict())
+        if 'cityId' not in settings or 'hotels' not in settings:
+            await self.__bot.send_message(message.chat.id,
+                                          '\U00002620 Ошибка.\U00002620 \nСначала выполните поиск (/lowprice, /highprice или /bestdeal).')
+            return
 
-            msg = await self.__bot.send_message(message.chat.id, 'Введите название города:')
-            self.__history[message.chat.id] = self.__history.get(message.chat.id, []) + [
-                {'command': message.text, 'time': datetime.fromtimestamp(message.date)}]
-            self.__main_settings[message.chat.id] = {'mode': message.text[1:]}
-            self.__register_next_step_handler(msg, self.__main_city)
-        except:
+        params = self.__search_params(message.chat.id)
+        key = json.dumps([params, settings['hotels']], sort_keys=True, default=str)
+        if key not in self.__watches and sum(
+                message.chat.id in watch['chats'] for watch in self.__watches.values()) >= self.WATCH_LIMIT:
             await self.__bot.send_message(message.chat.id,
-                                          '\U00002620 Ошибка.\U00002620 \nПройдите регистрацию своей информации (/reg).')
+                                          f'\U00002620 Ошибка.\U00002620 \nМожно иметь не больше {self.WATCH_LIMIT} подписок (/unwatch для отмены).')
+            return
 
-    async def __main_city(self, message: Message) -> None:
+        prices = self.__watch_prices(await self.__main_list(params, settings['hotels']))
+        watch = self.__watches.setdefault(key, {'params': params, 'hotels': settings['hotels'], 'chats': dict(),
+                                                'title': f"{settings['history']['command']} {params['in']:%d.%m.%Y} - {params['out']:%d.%m.%Y}"})
+        watch['chats'][message.chat.id] = prices
+
+        await self.__bot.send_message(message.chat.id,
+                                      f"Подписка на {watch['title']} оформлена. Бот сообщит, если цены изменятся больше чем на {self.WATCH_THRESHOLD:.0%}.")
+
+    @__command_func
+    async def __unwatch(self, message: Message) -> None:
         """
-        Метод, который ищет города с названием message.text в https://hotels4.p.rapidapi.com/locations/v3/search.
+        Метод, отвечающий команде unwatch. Отменяет все подписки чата.
 
         :param:
           message (Message): сообщение.
         """
-        try:
-            url = "https://hotels4.p.rapidapi.com/locations/v3/search"
-            querystring = {"q": message.text}
-            headers = {"X-RapidAPI-Key": self.__api_key, "X-RapidAPI-Host": "hotels4.p.rapidapi.com"}
-
-            async with aiohttp.ClientSession() as session:
-                response = await session.request("GET", url, headers=headers, params=querystring)
-            text = await response.text()
-
-            cities = []
-            json.loads(text)['sr']
-
-            for obj in json.loads(text)['sr']:
-                if obj['type'] == 'CITY':
-                    cities.append(obj)
-
-            if len(cities) == 0:
+        count = 0
+        for key, watch in list(self.__watches.items()):
+            if watch['chats'].pop(message.chat.id, None) is not None:
+                count += 1
+            if not watch['chats']:
+                self.__watches.pop(key)
 
-                await self.__bot.send_message(message.chat.id, f"Город '{message.text}' не найден.")
-            else:
-                city_keyboard = types.InlineKeyboardMarkup()
+        await self.__bot.send_message(message.chat.id, f'Отменено подписок: {count}.')
 
-                # Button: bestdeal_menu[gaiaId], main_city[gaiaId]
-                for city in cities:
-                    city_keyboard.row(types.InlineKeyboardButton(text=city['regionNames']['displayName'],
-                                                                 callback_data=(('bestdeal_menu' if
-                                                                                 self.__main_settings[message.chat.id][
-                                                                                     'mode'] == 'bestdeal' else 'main_city') + f"{city['gaiaId']}")))
+    @staticmethod
+    def __watch_prices(hotels: list) -> dict:
+        """
+        Метод, возвращающий цены отелей для сравнения в подписках.
 
-                self.__last_keyboard_id[message.chat.id] = (
-                    await self.__bot.send_message(message.chat.id, "Выберите город из списка найденных:",
-                                                  reply_markup=city_keyboard)).id
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \n')
+        :param:
+          hotels (list): отели.
 
-    # -----------------------------------(/bestdeal)-----------------------------------<Begin>
+        :return:
+          prices (dict): [название, цена, цена для вывода] по id отеля.
+        """
+        return {hotel['id']: [hotel['name'], hotel['price']['lead']['amount'], hotel['price']['lead']['formatted']]
+                for hotel in hotels}
 
-    # Callback: bestdeal_menu[gaiaId]
-    @__callback_func
-    async def __callback_bestdeal_menu(self, call: CallbackQuery) -> None:
+    def __watch_changed(self, old: dict, new: dict) -> bool:
         """
-        Метод, отвечающий кнопке bestdeal_menu[gaiaId].
+        Метод, проверяющий, изменился ли результат подписки: поменялись отели или цена одного из них изменилась
+        больше чем на WATCH_THRESHOLD.
 
         :param:
-          call (CallbackQuery): вызов.
+          old (dict): цены, о которых чат уже знает (__watch_prices).
+          new (dict): новые цены (__watch_prices).
         """
-        self.__main_settings[call.message.chat.id]['cityId'] = call.data[13:]
-        await self.__bestdeal_menu(call.message.chat.id)
+        return old.keys() != new.keys() or any(
+            abs(new[hotel_id][1] - old[hotel_id][1]) > self.WATCH_THRESHOLD * old[hotel_id][1] for hotel_id in new)
 
-    async def __bestdeal_menu(self, chat_id: int) -> None:
+    async def __poll_watches(self) -> None:
         """
-        Метод, выполняющийся в случае введения команды bestdeal после выбора города. Открывает меню с настройками bestdeal.
-
-        :param:
-          chat_id (int): id чата.
+        Метод, проверяющий все подписки: по одному поиску на группу одинаковых подписок. Подписчики, для которых
+        результат изменился, получают сообщение. Подписки с прошедшей датой заселения удаляются.
         """
-        self.__bestdeal_settings[chat_id] = self.__bestdeal_settings.get(chat_id, {'price': {'min': None, 'max': None},
-                                                                                   'dist': {'min': None, 'max': None},
-                                                                                   'sort': 0})
+        for key, watch in list(self.__watches.items()):
+            if watch['params']['in'] < date.today():
+                self.__watches.pop(key)
+                for chat_id in watch['chats']:
+                    try:
+                        await self.__bot.send_message(chat_id, f"Подписка на {watch['title']} завершена.")
+                    except Exception as err:
+                        print(err)
+                continue
+            if self.__api.quota.remaining() < 1:
+                break
 
-        bestdeal_keyboard = types.InlineKeyboardMarkup()
+            try:
+                prices = self.__watch_prices(await self.__main_list(watch['params'], watch['hotels'], True))
+            except Exception as err:
+                print(err)
+                continue
 
-        # Button: bestdeal_filters[price]_[min], bestdeal_filters[price]_[max]
-        bestdeal_keyboard.row(
-            types.InlineKeyboardButton(text=f"Мин. цена ($): {self.__bestdeal_settings[chat_id]['price']['min']}",
-                                       callback_data='bestdeal_filtersprice_min'),
-            types.InlineKeyboardButton(text=f"Макс. цена ($): {self.__bestdeal_settings[chat_id]['price']['max']}",
-                                       callback_data='bestdeal_filtersprice_max'))
-        # Button: bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max]
-        bestdeal_keyboard.row(
-            types.InlineKeyboardButton(text=f"Мин. дистанция (км): {self.__bestdeal_settings[chat_id]['dist']['min']}",
-                                       callback_data='bestdeal_filtersdist_min'),
-            types.InlineKeyboardButton(text=f"Макс. дистанция (км): {self.__bestdeal_settings[chat_id]['dist']['max']}",
-                                       callback_data='bestdeal_filtersdist_max'))
-        # Button: bestdeal_change_sort
-        bestdeal_keyboard.row(types.InlineKeyboardButton(
-            text='Сортировка по %sцене и дистанции, %sцене, %sдистанции' % tuple(
-                map(lambda sort: '\U00002705' * (self.__bestdeal_settings[chat_id]['sort'] == sort), (0, 1, 2))),
-            callback_data='bestdeal_change_sort'))
-        # Button: bestdeal_exit
-        bestdeal_keyboard.row(types.InlineKeyboardButton(text='Готово', callback_data='bestdeal_exit'))
+            for chat_id, old in list(watch['chats'].items()):
+                if not self.__watch_changed(old, prices):
+                    continue
+                watch['chats'][chat_id] = prices
+                text = '\n\n'.join(
+                    f"Название: {name}\nЦена: {(old[hotel_id][2] + ' -> ') if hotel_id in old else ''}{formatted}"
+                    for hotel_id, (name, amount, formatted) in prices.items())
+                try:
+                    await self.__bot.send_message(chat_id, f"Цены по подписке {watch['title']} изменились:\n\n" + (
+                        text or 'Отелей по запросу не найдено.'))
+                except Exception as err:
+                    print(err)
+
+    async def __poll_watches_periodically(self) -> None:
+        """
+        Метод, запускающий __poll_watches раз в WATCH_INTERVAL секунд.
+        """
+        while True:
+            await asyncio.sleep(self.WATCH_INTERVAL)
+            try:
+                await self.__poll_watches()
+            except Exception as err:
+                print(err)
 
-        self.__last_keyboard_id[chat_id] = (await self.__bot.send_message(chat_id, 'Ваши текущие настройки bestdeal:',
-                                                                          reply_markup=bestdeal_keyboard)).id
+    # ---------------------------------------------[/watch]---------------------------------------------<End>
 
-    # Callback: bestdeal_filters[price]_[min], bestdeal_filters[price]_[max], bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max]
-    @__callback_func
-    async def __callback_bestdeal_filters(self, call: CallbackQuery) -> None:
+    # ---------------------------------------------[near]---------------------------------------------<Begin>
+
+    @staticmethod
+    def __geo_key(payload: dict) -> str:
         """
-        Метод, отвечающий кнопкам bestdeal_filters[price]_[min], bestdeal_filters[price]_[max], bestdeal_filters[dist]_[min], bestdeal_filters[dist]_[max].
+        Метод, возвращающий ключ цен поиска в GeoIndex: даты и комнаты.
 
         :param:
-          call (CallbackQuery): вызов.
+          payload (dict): настройки поиска (__main_payload).
         """
-        p_d, min_max = call.data[16:].split('_')
-        message = await self.__bot.send_message(call.message.chat.id,
-                                                f"Введите {'минимальную' if min_max == 'min' else 'максимальную'} {'цену' if p_d == 'price' else 'дистанцию'}:")
-        self.__register_next_step_handler(message, self.__bestdeal_filters, p_d, min_max)
+        return json.dumps([payload['checkInDate'], payload['checkOutDate'], payload['rooms']], sort_keys=True)
 
-    async def __bestdeal_filters(self, message: Message, p_d: str, min_max: str) -> None:
+    def __index_places(self, payload: dict, properties: list) -> None:
         """
-        Метод, выполняющий проверку и запись выбранного для настройки фильтра для bestdeal.
+        Метод, добавляющий координаты и цены отелей страницы списка в GeoIndex.
 
         :param:
-          message (Message): сообщение.
-          p_d (str): выбранная настройка из price\dist.
-          min_max (str): выбранная настройка из min\max.
+          payload (dict): настройки поиска.
+          properties (list): отели страницы.
         """
-        try:
-            min_max = ['min', 'max'] if min_max == 'min' else ['max', 'min']
-            result = float(message.text)
+        prices = dict()
+        for hotel in properties:
+            try:
+                coordinates = hotel['mapMarker']['latLong']
+                self.__geo.add(hotel['id'], coordinates['latitude'], coordinates['longitude'])
+                prices[hotel['id']] = (hotel['name'], hotel['price']['lead']['formatted'])
+            except (KeyError, TypeError):
+                continue
+        if prices:
+            self.__geo.add_prices(self.__geo_key(payload), prices)
 
-            if result < 0:
-                await self.__bot.send_message(message.chat.id,
-                                              f"\U00002620 Ошибка.\U00002620 \n{'Цена' if p_d == 'price' else 'Дистанция'} не может быть меньше 0.")
-            elif self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] and (
-                    (min_max[1] == 'max' and self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] < result) or (
-                    min_max[1] == 'min' and self.__bestdeal_settings[message.chat.id][p_d][min_max[1]] > result)):
-                await self.__bot.send_message(message.chat.id,
-                                              f"\U00002620 Ошибка.\U00002620 \nМинимальная {'цена' if p_d == 'price' else 'дистанция'} должна быть не больше максимальной.")
-            else:
-                self.__bestdeal_settings[message.chat.id][p_d][min_max[0]] = result
-        except ValueError:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nНеправильный формат даты.')
-        except Exception as err:
-            print(err)
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+    def __location_func(func: Callable) -> Callable:
 
-        await self.__bestdeal_menu(message.chat.id)
+        functools.wraps(func)
 
-    # Callback: bestdeal_change_sort
-    @__callback_func
-    async def __callback_bestdeal_change_sort(self, call: CallbackQuery) -> None:
+        async def wrapped_func(self, message: Message) -> None:
+            # Геопозиция не прерывает диалог и предварительную загрузку: клавиатура и __prefetch чата не меняются.
+            location = (round(message.location.latitude, 4), round(message.location.longitude, 4))
+            if self.__repeated(('location', message.chat.id) + location, self.COMMAND_DEBOUNCE):
+                return
+
+            try:
+                await func(self, message)
+            except Exception as err:
+                print(err)
+                await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620')
+
+        wrapped_func.__name__ = func.__name__
+        wrapped_func.__doc__ = func.__doc__
+        return wrapped_func
+
+    async def __near_page(self, payload: dict, key: str, center: tuple) -> None:
         """
-        Метод, отвечающий кнопке bestdeal_change_sort.
+        Метод, запрашивающий у API отели по координатам и отмечающий в GeoIndex покрытый ответом круг: ответ
+        отсортирован по расстоянию, поэтому полная страница покрывает круг до самого дальнего отеля в ней,
+        а неполная - круг NEAR_RADIUS.
 
         :param:
-          call (CallbackQuery): вызов.
+          payload (dict): настройки поиска с координатами.
+          key (str): ключ цен поиска в GeoIndex.
+          center (tuple): (широта, долгота) запроса.
         """
-        self.__bestdeal_settings[call.message.chat.id]['sort'] = (self.__bestdeal_settings[call.message.chat.id][
-                                                                      'sort'] + 1) % 3
-
-        await self.__bestdeal_menu(call.message.chat.id)
-
-    # -----------------------------------(/bestdeal)-----------------------------------<End>
+        properties = await self.__list_page(payload)
+        radius = self.NEAR_RADIUS
+        if len(properties) >= payload['resultsSize']:
+            radius = 0
+            for hotel in properties:
+                try:
+                    coordinates = hotel['mapMarker']['latLong']
+                    radius = max(radius, self.__geo.distance(center[0], center[1], coordinates['latitude'],
+                                                             coordinates['longitude']))
+                except (KeyError, TypeError):
+                    continue
+            radius = min(radius, self.NEAR_RADIUS)
+        self.__geo.cover(key, center[0], center[1], radius)
 
-    # Callback: bestdeal_exit, main_city[gaiaId]
-    @__callback_func
-    async def __callback_main_city(self, call: CallbackQuery) -> None:
+    @__location_func
+    async def __near(self, message: Message) -> None:
         """
-        Метод, отвечающий кнопкам bestdeal_exit, main_city[gaiaId].
+        Метод, отвечающий на отправленную геопозицию ближайшими отелями на даты и комнаты из /reg.
+        Отели ищутся в GeoIndex, если круг до NEAR_HOTELS-го ближайшего отеля (или NEAR_RADIUS км, если отелей
+        меньше) лежит в круге, покрытом запросом по координатам с ценами на эти даты, иначе запрашиваются у API.
 
         :param:
-          call (CallbackQuery): вызов.
+          message (Message): сообщение.
         """
-        self.__main_settings[call.message.chat.id]['cityId'] = self.__main_settings[call.message.chat.id].get('cityId',
-                                                                                                              call.data[
-                                                                                                              9:])
-        msg = await self.__bot.send_message(call.message.chat.id, 'Введите колчество отелей (максимум 5):')
-        self.__register_next_step_handler(msg, self.__main_hotels, call.data)
+        chat_id = message.chat.id
+        if self.__data.get(chat_id, {}).get('in') is None or self.__data[chat_id]['out'] is None:
+            await self.__bot.send_message(chat_id, '\U00002620 Ошибка.\U00002620 \nПройдите регистрацию своей информации (/reg).')
+            return
 
-    async def __main_hotels(self, message: Message, call_data: str) -> None:
+        lat, lon = message.location.latitude, message.location.longitude
+        payload = self.__main_payload({'mode': 'near', 'cityId': None, 'in': self.__data[chat_id]['in'],
+                                       'out': self.__data[chat_id]['out'], 'rooms': self.__data[chat_id]['rooms']})
+        key = self.__geo_key(payload)
+
+        hotels = self.__geo.nearest(lat, lon, key, self.NEAR_HOTELS, self.NEAR_RADIUS)
+        reach = hotels[-1][0] if len(hotels) == self.NEAR_HOTELS else self.NEAR_RADIUS
+        if not self.__geo.covered(lat, lon, key, reach):
+            # Координаты не округляются: соседние геопозиции обслуживает GeoIndex по кругу, покрытому этим ответом.
+            payload['destination'] = {'coordinates': {'latitude': lat, 'longitude': lon}}
+            payload['sort'] = 'DISTANCE'
+            try:
+                await self.__near_page(payload, key, (lat, lon))
+            except Exception as err:
+                print(err)
+            hotels = self.__geo.nearest(lat, lon, key, self.NEAR_HOTELS, self.NEAR_RADIUS)
+
+        if not hotels:
+            await self.__bot.send_message(chat_id, f'В радиусе {self.NEAR_RADIUS} км отелей не найдено.')
+            return
+
+        await self.__bot.send_message(chat_id, '\n\n'.join(
+            f'Название: {name}\nЦена: {price}\nРасстояние (км): {dist:.2f}' for dist, _, name, price in hotels))
+
+    # ---------------------------------------------[near]---------------------------------------------<End>
+
+    # ---------------------------------------------[/history]---------------------------------------------<Begin>
+
+    @__command_func
+    async def __get_history(self, message: Message) -> None:
         """
-        Метод, выполняющий проверку и запись желаемого количества отелей для поиска. Максимум 5.
+        Метод, отвечающий основной команде history бота. /history export [csv|json] отправляет всю историю одним файлом.
 
         :param:
           message (Message): сообщение.
-          call_data (str): название вызова предыдущего шага.
         """
-        try:
-            hotels = int(message.text)
+        if await self.__history.count(message.chat.id) == 0:
+            await self.__bot.send_message(message.chat.id, 'История пуста.')
+            return
 
-            if hotels < 1:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть больше 0.')
-                await self.__errorContinue(message.chat.id, call_data)
-            elif hotels > 5:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не больше 5.')
-                await self.__errorContinue(message.chat.id, call_data)
-            else:
-                self.__main_settings[message.chat.id]['hotels'] = hotels
-                photo_keyboard = types.InlineKeyboardMarkup()
+        args = message.text.split()[1:]
+        if args[:1] == ['export']:
+            fmt = args[1].lower() if len(args) > 1 else 'csv'
+            if fmt not in ('csv', 'json'):
+                await self.__bot.send_message(message.chat.id, 'Использование: /history export [csv|json]')
+                return
+            await self.__history_export(message.chat.id, fmt)
+            return
 
-                # Button: photo_yes
-                photo_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data='photo_yes'))
-                # Button: photo_no
-                photo_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='photo_no'))
+        history_keyboard = types.InlineKeyboardMarkup()
 
-                self.__last_keyboard_id[message.chat.id] = (
-                    await self.__bot.send_message(message.chat.id, "Показать фотографии отелей?",
-                                                  reply_markup=photo_keyboard)).id
-        except:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
-            await self.__errorContinue(message.chat.id, call_data)
+        # Button: h_photo_yes
+        history_keyboard.row(types.InlineKeyboardButton(text='Да.', callback_data='h_photo_yes'))
+        # Button: h_photo_no
+        history_keyboard.row(types.InlineKeyboardButton(text='Нет.', callback_data='h_photo_no'))
 
-    # Callback: photo_yes
+        await self.__bot.send_message(message.chat.id, 'С фотографиями?', reply_markup=history_keyboard)
+
+    # Callback: h_photo_yes, h_photo_no
     @__callback_func
-    async def __callback_photo_yes(self, call: CallbackQuery) -> None:
+    async def __callback_h_photo(self, call: CallbackQuery) -> None:
         """
-        Метод, отвечающий кнопке photo_yes.
+        Метод, отвечающий кнопкам h_photo_yes, h_photo_no.
 
         :param:
           call (CallbackQuery): вызов.
         """
-        msg = await self.__bot.send_message(call.message.chat.id, 'Введите колчество фотографий (максимум 5):')
-        self.__register_next_step_handler(msg, self.__main_photo, call.data)
+        await self.__history_result(call.message.chat.id, call.data == 'h_photo_yes', 0)
 
-    # Callback: photo_no
+    # Callback: h_page[0..1]_[page]
     @__callback_func
-    async def __callback_photo_no(self, call: CallbackQuery) -> None:
+    async def __callback_h_page(self, call: CallbackQuery) -> None:
         """
-        Метод, отвечающий кнопке photo_no.
+        Метод, отвечающий кнопкам h_page[0..1]_[page].
 
         :param:
           call (CallbackQuery): вызов.
         """
-        self.__main_settings[call.message.chat.id]['photo'] = 0
-        await self.__main_result(call.message.chat.id)
+        photo, page = map(int, call.data[6:].split('_'))
+        await self.__history_result(call.message.chat.id, bool(photo), page)
+
+    async def __history_export(self, chat_id: int, fmt: str) -> None:
+        """
+        Метод, отправляющий всю историю поисков одним файлом. Файл пишется во временную папку и удаляется после отправки.
+
+        :param:
+          chat_id (int): id чата.
+          fmt (str): формат файла (csv, json).
+        """
+        fd, path = tempfile.mkstemp(suffix='.' + fmt)
+        os.close(fd)
+        try:
+            await self.__history.export(chat_id, path, fmt)
+            with open(path, 'rb') as file:
+                await self.__bot.send_document(chat_id, file, visible_file_name=f'history.{fmt}')
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(chat_id, '\U00002620 Ошибка.\U00002620 \n')
+        finally:
+            os.remove(path)
 
-    async def __main_photo(self, message: Message, call_data: str) -> None:
+    async def __history_result(self, chat_id: int, photo: bool, page: int) -> None:
         """
-        Метод, выполняющий проверку и запись желаемого количества фотографий отелей для поиска. Максимум 5.
+        Метод, выводящий страницу page истории поисков (0 - последние HISTORY_PAGE поисков).
+        Поиски страницы упаковываются в минимальное количество сообщений, фото - в минимальное количество групп.
 
         :param:
-          message (Message): сообщение.
-          call_data (str): название вызова предыдущего шага.
+          chat_id (int): id чата.
+          photo (bool): выводить ли фото.
+          page (int): номер страницы.
         """
         try:
-            photo = int(message.text)
+            count = await self.__history.count(chat_id)
+            pages = max(1, (count + self.HISTORY_PAGE - 1) // self.HISTORY_PAGE)
+            page = min(max(page, 0), pages - 1)
+
+            texts = []
+            photoes = []
+            captions = []
+            for result in await self.__history.page(chat_id, max(0, count - (page + 1) * self.HISTORY_PAGE),
+                                                    count - page * self.HISTORY_PAGE):
+                texts.append(f"Команда: {result['command']}\nВремя ввода команды: {result['time']}\nОтели:")
+                for hotel in result['hotels']:
+                    texts.append(
+                        f"Название: {hotel['name']}\nЦена: {hotel['price']}\nДистанция от центра (км): {hotel['dist']}\nАдрес: {hotel['address']}")
+
+                    # Подпись с названием отеля - у первого фото отеля; у отеля без фото нет и подписи.
+                    if photo and hotel['photoes']:
+                        photoes.extend(hotel['photoes'])
+                        captions.extend([hotel['name'][:self.CAPTION_LIMIT]] + [None] * (len(hotel['photoes']) - 1))
+
+            text = ''
+            for block in texts:
+                if text and len(text) + 2 + len(block) > self.MESSAGE_LIMIT:
+                    await self.__bot.send_message(chat_id, text)
+                    text = ''
+                text = (text + '\n\n' + block if text else block)[:self.MESSAGE_LIMIT]
+            if text:
+                await self.__bot.send_message(chat_id, text)
+
+            # Группы выравниваются по размеру, чтобы в последней не осталось одно фото (11 фото - группы 6 и 5).
+            if photoes:
+                size = math.ceil(len(photoes) / math.ceil(len(photoes) / self.MEDIA_GROUP_LIMIT))
+                try:
+                    for i in range(0, len(photoes), size):
+                        await self.__send_photos(chat_id, photoes[i:i + size], captions[i:i + size])
+                except Exception as err:
+                    # Клавиатура страниц выводится и без фото, чтобы можно было листать историю дальше.
+                    print(err)
+                    await self.__bot.send_message(chat_id, '\U00002620 Ошибка.\U00002620 \nНе удалось отправить фото.')
+
+            if pages > 1:
+                page_keyboard = types.InlineKeyboardMarkup()
+
+                # Button: h_page[0..1]_[page + 1], h_page[0..1]_[page - 1]
+                buttons = []
+                if page < pages - 1:
+                    buttons.append(types.InlineKeyboardButton(text='\U000025C0 Ранее',
+                                                              callback_data=f'h_page{int(photo)}_{page + 1}'))
+                if page > 0:
+                    buttons.append(types.InlineKeyboardButton(text='Позже \U000025B6',
+                                                              callback_data=f'h_page{int(photo)}_{page - 1}'))
+                page_keyboard.row(*buttons)
+
+                self.__last_keyboard_id[chat_id] = (
+                    await self.__bot.send_message(chat_id, f"Страница {page + 1} из {pages}.",
+                                                  reply_markup=page_keyboard)).id
+        except Exception as err:
+            print(err)
+            await self.__bot.send_message(chat_id, '\U00002620 Ошибка.\U00002620 \n')
 
-            if photo < 0:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не меньше 0.')
-                await self.__errorContinue(message.chat.id, call_data)
-                return
-            elif photo > 5:
-                await self.__bot.send_message(message.chat.id,
-                                              '\U00002620 Ошибка.\U00002620 \nКоличество должно быть не больше 5.')
-                await self.__errorContinue(message.chat.id, call_data)
-                return
-        except:
-            await self.__bot.send_message(message.chat.id, '\U00002620 Ошибка.\U00002620 \nОшибка ввода.')
-            await self.__errorContinue(message.chat.id, call_data)
-            return
+    # ---------------------------------------------[/history]---------------------------------------------<End>
 
-        self.__main_settings[message.chat.id]['photo'] = photo
-        await self.__main_result(message.chat.id)
+    # ---------------------------------------------[photo]---------------------------------------------<Begin>
 
-    async def __main_result(self, chat_id: int) -> None:
+    async def __send_photos(self, chat_id: int, photoes: list, captions: list = None) -> None:
         """
-        Метод, который ищет подходящие к выбранным настройкам отели в https://hotels4.p.rapidapi.com/properties/v2/list.
+        Метод, отправляющий фото группой (одно фото - отдельным сообщением, в группе должно быть от 2 до 10 фото).
+        Уже отправленные ранее фото отправляются по file_id из кэша, а не по ссылке.
 
         :param:
           chat_id (int): id чата.
+          photoes (list): ссылки на фото.
+          captions (list): подписи к фото, если нужны.
         """
-        url = "https://hotels4.p.rapidapi.com/properties/v2/list"
-
-        payload = dict()
-
-        payload['destination'] = {'regionId': self.__main_settings[chat_id]['cityId']}
-        payload['checkInDate'] = {
-            'day': self.__data[chat_id]['in'].day,
-            'month': self.__data[chat_id]['in'].month,
-            'year': self.__data[chat_id]['in'].year
-        }
-        payload['checkOutDate'] = {
-            "day": self.__data[chat_id]['out'].day,
-            "month": self.__data[chat_id]['out'].month,
-            "year": self.__data[chat_id]['out'].year
-        }
-        payload['rooms'] = []
-        for room in self.__data[chat_id]['rooms']:
-            payload['rooms'].append({
-                'adults': room[0],
-                'children': list(map(lambda age: {'age': age}, room[1]))
-            })
-        payload['resultsStartingIndex'] = 0
-        payload['resultsSize'] = self.__main_settings[chat_id]['hotels'] if self.__main_settings[chat_id][
-                                                                                'mode'] == 'lowprice' else 200
-        payload['sort'] = 'PROPERTY_CLASS' if self.__main_settings[chat_id][
-                                                  'mode'] == 'highprice' else 'PRICE_LOW_TO_HIGH'
-        payload['filters'] = {'price': {'min': 1, 'max': 999999}}
+        captions = captions or [None] * len(photoes)
 
-        headers = {
-            "content-type": "application/json",
-            "X-RapidAPI-Key": self.__api_key,
-            "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-        }
+        async def send(media: list) -> list:
+            if len(media) == 1:
+                return [await self.__bot.send_photo(chat_id, media[0].media, caption=media[0].caption)]
+            return await self.__bot.send_media_group(chat_id, media)
 
         try:
-            if self.__main_settings[chat_id]['mode'] == 'bestdeal':
-                response = await self.__bestdeal_result(chat_id, url, payload, headers)
-            else:
-                async with aiohttp.ClientSession() as session:
-                    response = json.loads(
-                        await (await session.request("POST", url, json=payload, headers=headers)).text())
-                    response = response['data']['propertySearch']['properties'] if response['data'] else []
+            messages = await send([telebot.types.InputMediaPhoto(
+                self.__photos.get(url, url), caption) for url, caption in zip(photoes, captions)])
+        except Exception as err:
+            if all(self.__photos.get(url) is None for url in photoes):
+                raise
+            # file_id мог стать недействительным - отправляем по ссылкам.
+            print(err)
+            for url in photoes:
+                self.__photos.discard(url)
+                self.__share('photo_discard', url)
+            messages = await send(list(map(telebot.types.InputMediaPhoto, photoes, captions)))
 
-            if len(response) == 0:
-                await self.__bot.send_message(chat_id, 'Отелей по запросу не найдено.')
-                return
+        for url, message in zip(photoes, messages):
+            if message.photo:
+                self.__photos.set(url, message.photo[-1].file_id)
+                self.__share('photo', url, message.photo[-1].file_id)
 
-            if self.__main_settings[chat_id]['mode'] == 'highprice':
-                response = sorted(response, key=lambda item: item['price']['lead']['amount'])[
-                           -self.__main_settings[chat_id]['hotels']:][::-1]
+    async def __save_photos(self) -> None:
+        """
+        Метод, сохраняющий кэш file_id фотографий в файл, если он изменился. Запись выполняется вне потока бота.
+        """
+        items = self.__photos.snapshot()
+        if items is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.__photos.write, items)
 
-            hotels_log = []
+    async def __save_photos_periodically(self) -> None:
+        """
+        Метод, сохраняющий кэш file_id фотографий в файл раз в PHOTO_CACHE_SAVE_INTERVAL секунд.
+        """
+        while True:
+            await asyncio.sleep(self.PHOTO_CACHE_SAVE_INTERVAL)
+            try:
+                await self.__save_photos()
+            except Exception as err:
+                print(err)
 
-            for hotel in response:
-                name = hotel['name']
-                price = hotel['price']['lead']['formatted']
-                dist = round(hotel['destinationInfo']['distanceFromDestination']['value'] / 0.621371, 2)
-                address, photoes = await self.__hotel_detail(hotel['id'], self.__main_settings[chat_id]['photo'])
+    # ---------------------------------------------[photo]---------------------------------------------<End>
 
-                await self.__bot.send_message(chat_id,
-                                              f"Название: {name}\nЦена: {price}\nДистанция от центра (км): {dist}\nАдрес: {address}")
+    # ---------------------------------------------[/profile]---------------------------------------------<Begin>
 
-                if len(photoes):
-                    await self.__bot.send_media_group(chat_id, list(map(telebot.types.InputMediaPhoto, photoes)))
+    async def __profile_command(self, message: Message) -> None:
+        """
+        Метод, отвечающий администратору на команду /profile [секунды]: профилирует цикл событий бота и отправляет
+        результат файлом. В режиме супервизора профилируется процесс-обработчик чата администратора.
 
-                hotels_log.append({'name': name, 'price': price, 'dist': dist, 'address': address, 'photoes': photoes})
+        :param:
+          message (Message): сообщение.
+        """
+        if message.from_user.id not in self.__admins:
+            return
 
-            self.__history[chat_id][len(self.__history[chat_id]) - 1].update({'hotels': hotels_log})
-        except Exception as err:
-            print(err)
-            error_keyboard = types.InlineKeyboardMarkup()
+        try:
+            seconds = min(float(message.text.split()[1]) if len(message.text.split()) > 1 else 30, self.PROFILE_MAX)
+        except ValueError:
+            await self.__bot.send_message(message.chat.id, 'Использование: /profile [секунды]')
+            return
 
-            # Button: result_error
-            error_keyboard.row(types.InlineKeyboardButton(text='Да', callback_data='result_error'))
-            # Button: ec_no
-            error_keyboard.row(types.InlineKeyboardButton(text='Нет', callback_data='ec_no'))
+        if self.__profiling:
+            await self.__bot.send_message(message.chat.id, 'Профилирование уже выполняется.')
+            return
 
-            self.__last_keyboard_id[chat_id] = (await self.__bot.send_message(chat_id,
-                                                                              '\U00002620 API не отвечает на запрос. \U00002620 \nХотите повторить попытку?',
-                                                                              reply_markup=error_keyboard)).id
+        await self.__bot.send_message(message.chat.id, f'Профилирование {seconds:g} сек.')
+        path = await self.__profile(seconds)
+        with open(path, 'rb') as file:
+            await self.__bot.send_document(message.chat.id, file)
 
-    async def __bestdeal_result(self, chat_id: int, url: str, payload: dict, headers: dict):
+    async def __profile_on_start(self) -> None:
         """
-        Метод, специализированный на поиске отелей для команды bestdeal.
-        Методы сортировки по индексам:
-          0. По цене от меньшего к большему.
-          1. По расстоянию от центра от меньшего к большему.
-          2. По цене и расстоянию. Специальный метод сортировки, который отбирает отели одновременно из двух списков, рассортированных один по цене, другой по расстоянию, выбирая те, которые появились в обоих списках раньше остальных.
-
-        :param:
-          chat_id (int): id чата.
-          url (str): ссылка на API.
-          payload (dict): настройки поиска.
-          headers (dict): ключи для поиска.
+        Метод, профилирующий бота после запуска, если задана переменная окружения PROFILE_ENV (длительность в секундах).
         """
+        if os.environ.get(self.PROFILE_ENV):
+            try:
+                print(f'Профиль записан в {await self.__profile(min(float(os.environ[self.PROFILE_ENV]), self.PROFILE_MAX))}')
+            except Exception as err:
+                print(err)
 
-        async def bestdeal_get_response(sort: str) -> None:
-            """
-            Метод для сортировки [0], запрашивающий следущие отели, начиная с индекса starting_index[sort], для списка sort.
-
-            sort (str): сортировка списка (price\dist).
-            """
-            payload['sort'] = 'PRICE_LOW_TO_HIGH' if sort == 'price' else 'DISTANCE'
-            payload['resultsStartingIndex'] = starting_index[sort]
-            async with aiohttp.ClientSession() as session:
-                response[sort] = json.loads(
-                    await (await session.request("POST", url, json=payload, headers=headers)).text())
-                response[sort] = response[sort]['data']['propertySearch']['properties'] if response[sort][
-                    'data'] else []
-            if len(response[sort]) == 0:
-                end[sort] = True
-            else:
-                can_continue[sort] = len(response[sort]) == 200
-                response[sort] = list(filter(
-                    lambda hotel: dist['min'] <= hotel['destinationInfo']['distanceFromDestination']['value'] <= dist[
-                        'max'], response[sort]))
+    async def __profile(self, seconds: float) -> str:
+        """
+        Метод, снимающий стеки цикла событий в течение seconds секунд (StackSampler).
 
-        async def bestdeal_next_hotel(sort: str) -> None:
-            """
-            Метод для сортировки [0], выбирающий следущий в списке sort отель и проверающий, если он появился в обоих списках.
+        :param:
+          seconds (float): длительность профилирования.
 
-            sort (str): сортировка списка (price\dist).
-            """
-            try:
-                hotel = response[sort].pop(0)
-                if hotel['id'] in hotels_found:
-                    hotels.append(hotel)
-                    if len(hotels) == self.__main_settings[chat_id]['hotels']:
-                        return True
-                else:
-                    hotels_found.append(hotel['id'])
-            except:
-                if can_continue[sort]:
-                    starting_index[sort] += 200
-                    await bestdeal_get_response(sort)
-                else:
-                    end[sort] = True
+        :return:
+          path (str): путь к файлу с результатом в формате collapsed stacks.
+        """
+        self.__profiling = True
+        sampler = StackSampler(threading.get_ident(), self.PROFILE_INTERVAL)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            self.__profiling = False
 
-        payload['filters']['price']['min'] = self.__bestdeal_settings[chat_id]['price']['min'] if \
-        self.__bestdeal_settings[chat_id]['price']['min'] else 1
-        payload['filters']['price']['max'] = self.__bestdeal_settings[chat_id]['price']['max'] if \
-        self.__bestdeal_settings[chat_id]['price']['max'] else (
-            999999 if self.__bestdeal_settings[chat_id]['price']['max'] == None else 1)
-        dist = {'min': (self.__bestdeal_settings[chat_id]['dist']['min'] if self.__bestdeal_settings[chat_id]['dist'][
-            'min'] else 0) * 0.621371, 'max': (self.__bestdeal_settings[chat_id]['dist']['max'] if
-                                               self.__bestdeal_settings[chat_id]['dist'][
-                                                   'max'] != None else 999999.0) * 0.621371}
-        hotels = []
+        os.makedirs(self.PROFILE_DIR, exist_ok=True)
+        path = os.path.join(self.PROFILE_DIR, f'{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.folded')
+        sampler.write(path)
+        return path
 
-        if self.__bestdeal_settings[chat_id]['sort'] == 1:
-            payload['sort'] = 'PRICE_LOW_TO_HIGH' if self.__bestdeal_settings[chat_id]['sort'] == 1 else 'DISTANCE'
-            can_continue = True
+    # ---------------------------------------------[/profile]---------------------------------------------<End>
 
-            while can_continue:
-                async with aiohttp.ClientSession() as session:
-                    response = json.loads(
-                        await (await session.request("POST", url, json=payload, headers=headers)).text())
-                    response = response['data']['propertySearch']['properties'] if response['data'] else []
-                if len(response) == 0:
-                    break
-                can_continue = len(response) == 200
+    # ---------------------------------------------[metrics]---------------------------------------------<Begin>
 
-                for hotel in response:
-                    if dist['min'] <= hotel['destinationInfo']['distanceFromDestination']['value'] <= dist['max']:
-                        hotels.append(hotel)
-                        if len(hotels) == self.__main_settings[chat_id]['hotels']:
-                            break
-                else:
-                    payload['resultsStartingIndex'] += 200
-                    continue
-                break
+    def __write_metrics(self) -> None:
+        """
+        Метод, записывающий метрики в файл metrics (для textfile collector node_exporter).
+        """
+        lags = self.__monitor.percentiles()
+        lines = ['# TYPE hotelbot_loop_lag_seconds summary']
+        lines += [f'hotelbot_loop_lag_seconds{{quantile="{q}"}} {lag:.6f}' for q, lag in lags.items() if q < 1]
+        lines += ['# TYPE hotelbot_loop_lag_max_seconds gauge',
+                  f'hotelbot_loop_lag_max_seconds {lags[1]:.6f}',
+                  '# TYPE hotelbot_loop_stalls_total counter',
+                  f'hotelbot_loop_stalls_total {self.__monitor.stalls}',
+                  '# TYPE hotelbot_api_requests_today gauge',
+                  f'hotelbot_api_requests_today {self.__api.quota.used()}']
+
+        with open(self.__metrics_path + '.tmp', 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(self.__metrics_path + '.tmp', self.__metrics_path)
+
+    async def __write_metrics_periodically(self) -> None:
+        """
+        Метод, записывающий метрики каждые METRICS_INTERVAL секунд.
+        """
+        if not self.__metrics_path:
+            return
+        while True:
+            await asyncio.sleep(self.METRICS_INTERVAL)
+            try:
+                self.__write_metrics()
+            except Exception as err:
+                print(err)
 
-            return hotels
-        elif self.__bestdeal_settings[chat_id]['sort'] == 2:
-            payload['sort'] = 'PRICE_LOW_TO_HIGH' if self.__bestdeal_settings[chat_id]['sort'] == 1 else 'DISTANCE'
-            can_continue = True
-
-            while can_continue:
-                async with aiohttp.ClientSession() as session:
-                    response = json.loads(
-                        await (await session.request("POST", url, json=payload, headers=headers)).text())
-                response = response['data']['propertySearch']['properties'] if response['data'] else []
-                if len(response) == 0:
-                    break
-                can_continue = len(response) == 200
+    # ---------------------------------------------[metrics]---------------------------------------------<End>
 
-                for hotel in response:
-                    if hotel['destinationInfo']['distanceFromDestination']['value'] > dist['max']:
-                        break
-                    if dist['min'] <= hotel['destinationInfo']['distanceFromDestination']['value']:
-                        hotels.append(hotel)
-                        if len(hotels) == self.__main_settings[chat_id]['hotels']:
-                            break
-                else:
-                    payload['resultsStartingIndex'] += 200
-                    continue
-                break
+    async def __compact_history_periodically(self) -> None:
+        """
+        Метод, сжимающий журналы истории раз в HISTORY_COMPACT_INTERVAL секунд, если задано history_keep.
+        Процесс-обработчик сжимает только журналы своих чатов.
+        """
+        if self.__history_keep is None:
+            return
+        chats = None
+        if self.__shard:
+            chats = lambda chat_id: chat_id % self.__shard[1] == self.__shard[0]
 
-            return hotels
-        else:
-            response = dict()
-            end = {'price': False, 'dist': False}
-            can_continue = {'price': False, 'dist': False}
-            starting_index = {'price': 0, 'dist': 0}
-            hotels_found = []
+        while True:
+            try:
+                await self.__history.compact(chats)
+            except Exception as err:
+                print(err)
+            await asyncio.sleep(self.HISTORY_COMPACT_INTERVAL)
 
-            await bestdeal_get_response('price')
-            await bestdeal_get_response('dist')
+    # ---------------------------------------------[snapshot]---------------------------------------------<Begin>
 
-            while not end['price'] and not end['dist']:
-                if await bestdeal_next_hotel('price') or await bestdeal_next_hotel('dist'):
-                    break
+    def __save_snapshot(self) -> None:
+        """
+        Метод, сохраняющий кэши и состояние чатов в файл снимка. Ответы API записываются частями по SNAPSHOT_CHUNK,
+        начиная с последних использованных, чтобы при ограниченном времени загрузки загрузились самые нужные.
+        """
+        if self.__snapshot_path is None:
+            return
 
-            if len(hotels) == self.__main_settings[chat_id]['hotels'] or end['price'] == end['dist']:
-                return hotels
+        responses = self.__api.cache.items() if self.__api.owner is self else []
+        with gzip.open(self.__snapshot_path + '.tmp', 'wb') as file:
+            pickle.dump({'version': self.SNAPSHOT_VERSION, 'time': time.time()}, file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump({'data': self.__data, 'bestdeal_settings': self.__bestdeal_settings,
+                         'main_settings': self.__main_settings, 'last_keyboard_id': self.__last_keyboard_id,
+                         'recent_searches': list(self.__recent_searches), 'watches': self.__watches,
+                         'steps': self.__steps}, file,
+                        pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.__cities.dump(), file, pickle.HIGHEST_PROTOCOL)
+            for i in range(0, len(responses), self.SNAPSHOT_CHUNK):
+                pickle.dump(responses[i:i + self.SNAPSHOT_CHUNK], file, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.__snapshot_path + '.tmp', self.__snapshot_path)
+
+    def __load_snapshot(self) -> None:
+        """
+        Метод, загружающий кэши и состояние чатов из файла снимка. Устаревшие ответы API пропускаются,
+        загрузка ответов прекращается через SNAPSHOT_LOAD_TIMEOUT секунд.
+        """
+        if self.__snapshot_path is None:
+            return
 
-            if end['price']:
-                while not end['dist']:
-                    if await bestdeal_next_hotel('dist'):
+        deadline = time.monotonic() + self.SNAPSHOT_LOAD_TIMEOUT
+        loaded = 0
+        try:
+            with gzip.open(self.__snapshot_path, 'rb') as file:
+                if pickle.load(file).get('version') != self.SNAPSHOT_VERSION:
+                    return
+                session = pickle.load(file)
+                self.__data.update(session['data'])
+                self.__bestdeal_settings.update(session['bestdeal_settings'])
+                self.__main_settings.update(session['main_settings'])
+                self.__last_keyboard_id.update(session['last_keyboard_id'])
+                self.__recent_searches.extend(session.get('recent_searches', []))
+                self.__watches.update(session.get('watches', dict()))
+                self.__steps.update((chat_id, step) for chat_id, step in session.get('steps', dict()).items()
+                                    if step[0] in self.__step_handlers)
+                self.__cities.load(pickle.load(file))
+
+                while time.monotonic() < deadline:
+                    try:
+                        chunk = pickle.load(file)
+                    except EOFError:
                         break
-            else:
-                while not end['price']:
-                    if await bestdeal_next_hotel('price'):
+                    if self.__api.owner is not self:
                         break
+                    for key, expires, value in chunk:
+                        loaded += self.__api.cache.load(key, expires, value)
+        except FileNotFoundError:
+            return
+        except Exception as err:
+            print(err)
 
-            return hotels
+        print(f'Снимок {self.__snapshot_path} загружен, ответов API: {loaded}.')
+
+    # ---------------------------------------------[snapshot]---------------------------------------------<End>
 
-    async def __hotel_detail(self, hotel_id: str, photo: int) -> list:
+    async def __run(self, serve: bool = True) -> None:
         """
-        Метод, запрашивающий детали (адрес и фото) отеля с id hotel_id из https://hotels4.p.rapidapi.com/properties/v2/detail.
+        Метод, выполняющий работу бота: фоновые задачи и получение обновлений.
 
         :param:
-          hotel_id (str): id отеля.
-          photo (int): количество фото.
+          serve (bool): остановить бота по SIGTERM.
+        """
+        self.__load_snapshot()
+        tasks = [asyncio.create_task(self.__save_photos_periodically()),
+                 asyncio.create_task(self.__compact_history_periodically()),
+                 asyncio.create_task(self.__prewarm_periodically()),
+                 asyncio.create_task(self.__poll_watches_periodically()),
+                 asyncio.create_task(self.__write_metrics_periodically())]
+        if self.__api.owner is self:
+            tasks += [asyncio.create_task(self.__profile_on_start()),
+                      asyncio.create_task(self.__monitor.run())]
+        try:
+            polling = self.__bot.polling(none_stop=True)
+            await (_serve(polling) if serve else polling)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.__save_photos()
+            self.__save_snapshot()
+            if self.__own_api:
+                await self.__api.close()
+
+    # ---------------------------------------------[workers]---------------------------------------------<Begin>
+
+    def __share(self, *event) -> None:
+        """
+        Метод, который в процессе-обработчике отправляет супервизору изменение общего кэша.
 
-        :return:
-          [address, photoes] (list[Any]): адрес и фото отеля.
+        :param:
+          event (tuple): изменение (вид, аргументы), см. __apply_shared.
         """
-        url = "https://hotels4.p.rapidapi.com/properties/v2/detail"
+        if self.__events is not None:
+            self.__events.put((self.__shard[0], event))
 
-        payload = {"propertyId": hotel_id}
+    def __apply_shared(self, event: tuple) -> None:
+        """
+        Метод, применяющий изменение общего кэша, полученное от другого процесса.
 
-        headers = {
-            "content-type": "application/json",
-            "X-RapidAPI-Key": self.__api_key,
-            "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
-        }
+        :param:
+          event (tuple): изменение (вид, аргументы).
+        """
+        kind, *args = event
+        if kind == 'city':
+            self.__cities.add(*args)
+        elif kind == 'searched':
+            self.__cities.mark_searched(*args)
+        elif kind == 'photo':
+            self.__photos.set(*args)
+        elif kind == 'photo_discard':
+            self.__photos.discard(*args)
+
+    @staticmethod
+    def __update_chat_id(update: dict) -> int:
+        """
+        Метод, возвращающий id чата (или пользователя) обновления, по которому выбирается процесс-обработчик.
 
-        async with aiohttp.ClientSession() as session:
-            response = json.loads(await (await session.request("POST", url, json=payload, headers=headers)).text())
+        :param:
+          update (dict): обновление Telegram.
+        """
+        for kind in ('message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result'):
+            if update.get(kind):
+                obj = update[kind]
+                chat = obj.get('chat') or (obj.get('message') or {}).get('chat') or obj.get('from') or {}
+                return chat.get('id', 0)
+        return 0
+
+    async def __supervise(self, workers: int) -> None:
+        """
+        Метод, выполняющий работу супервизора: запуск и перезапуск процессов-обработчиков, получение обновлений
+        и их распределение по id чата, хранение общих кэшей.
 
-        address = response['data']['propertyInfo']['summary']['location']['address']['addressLine']
+        :param:
+          workers (int): количество процессов-обработчиков.
+        """
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context('spawn')
+        events = context.Queue()
+        shards = [[None, None] for _ in range(workers)]
+
+        def spawn(shard: int) -> None:
+            # Новая очередь: упавший процесс мог оставить старую заблокированной.
+            shards[shard][0] = context.Queue()
+            shards[shard][0].put(('snapshot', self.__cities.dump(), self.__photos.items()))
+            # Квота и бюджет обновления кэша делятся между обработчиками поровну.
+            options = {'photo_cache': None, 'history': self.__history_path,
+                       'history_keep': self.__history_keep,
+                       'snapshot': self.__snapshot_path and f'{self.__snapshot_path}.{shard}-{workers}',
+                       'edit_keyboards': self.__edit_keyboards,
+                       'daily_quota': self.__daily_quota and self.__daily_quota // workers,
+                       'prewarm_budget': self.__prewarm_budget // workers, 'admins': list(self.__admins),
+                       'metrics': self.__metrics_path and '{0}.{2}{1}'.format(*os.path.splitext(self.__metrics_path), shard),
+                       'cache': self.__cache_url}
+            shards[shard][1] = context.Process(target=_run_worker, name=f'HotelBot-{shard}', daemon=True, args=(
+                self.__telegram_token, self.__api_key, options, shards[shard][0], events, (shard, workers)))
+            shards[shard][1].start()
+
+        async def watch() -> None:
+            while True:
+                await asyncio.sleep(self.WORKER_CHECK_INTERVAL)
+                for shard, (_, process) in enumerate(shards):
+                    if not process.is_alive():
+                        print(f'Обработчик {shard} завершился с кодом {process.exitcode}. Перезапуск.')
+                        spawn(shard)
+
+        async def relay() -> None:
+            while True:
+                item = await loop.run_in_executor(None, events.get)
+                if item is None:
+                    return
+                shard, event = item
+                self.__apply_shared(event)
+                for other, (queue, _) in enumerate(shards):
+                    if other != shard:
+                        queue.put(('shared', event))
+
+        async def poll() -> None:
+            offset = None
+            while True:
+                try:
+                    updates = await asyncio_helper.get_updates(self.__telegram_token, offset,
+                                                               timeout=self.POLLING_TIMEOUT)
+                except Exception as err:
+                    print(err)
+                    await asyncio.sleep(self.WORKER_CHECK_INTERVAL)
+                    continue
 
-        gallery = response['data']['propertyInfo']['propertyGallery']['images']
-        photoes = []
-        for _ in range(min(int(photo), len(gallery))):
-            photoes.append(gallery.pop(random.randint(0, len(gallery) - 1))['image']['url'])
+                for update in updates:
+                    offset = update['update_id'] + 1
+                    shards[self.__update_chat_id(update) % workers][0].put(('update', update))
 
-        return [address, photoes]
+        self.__load_snapshot()
+        for shard in range(workers):
+            spawn(shard)
+        tasks = [asyncio.create_task(watch()), asyncio.create_task(relay()),
+                 asyncio.create_task(self.__save_photos_periodically()),
+                 asyncio.create_task(self.__profile_on_start()),
+                 asyncio.create_task(self.__monitor.run()),
+                 asyncio.create_task(self.__write_metrics_periodically())]
 
-    # Callback: result_error
-    @__callback_func
-    async def __callback_result_error(self, call: CallbackQuery) -> None:
+        try:
+            await _serve(poll())
+        finally:
+            for task in tasks:
+                task.cancel()
+            events.put(None)
+            for queue, process in shards:
+                queue.put(None)
+            for queue, process in shards:
+                await loop.run_in_executor(None, process.join, self.POLLING_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+            await self.__save_photos()
+            self.__save_snapshot()
+
+    async def __work(self, updates: multiprocessing.Queue, events: multiprocessing.Queue, shard: tuple) -> None:
         """
-        Метод, отвечающий кнопке result_error.
+        Метод, выполняющий работу процесса-обработчика: обработку обновлений своих чатов от супервизора.
 
         :param:
-          call (CallbackQuery): вызов.
+          updates (Queue): очередь обновлений и изменений общих кэшей от супервизора.
+          events (Queue): очередь изменений общих кэшей для супервизора.
+          shard (tuple): номер обработчика и количество обработчиков.
         """
-        await self.__main_result(call.message.chat.id)
-
-    # ---------------------------------------------[main]---------------------------------------------<End>
+        loop = asyncio.get_running_loop()
+        self.__events = events
+        self.__shard = shard
+        handlers = set()
+        # Останавливается супервизором; SIGTERM, отправленный всем процессам сразу, завершает обработчик так же.
+        try:
+            loop.add_signal_handler(signal.SIGTERM, updates.put, None)
+        except NotImplementedError:
+            pass
+        self.__load_snapshot()
+        tasks = [asyncio.create_task(self.__compact_history_periodically()),
+                 asyncio.create_task(self.__prewarm_periodically()),
+                 asyncio.create_task(self.__poll_watches_periodically()),
+                 asyncio.create_task(self.__profile_on_start()),
+                 asyncio.create_task(self.__monitor.run()),
+                 asyncio.create_task(self.__write_metrics_periodically())]
 
-    # ---------------------------------------------[/history]---------------------------------------------<Begin>
+        try:
+            while True:
+                item = await loop.run_in_executor(None, updates.get)
+                if item is None:
+                    break
 
-    @__command_func
-    async def __get_history(self, message: Message) -> None:
+                if item[0] == 'update':
+                    handler = asyncio.create_task(
+                        self.__bot.process_new_updates([types.Update.de_json(item[1])]))
+                    handlers.add(handler)
+                    handler.add_done_callback(handlers.discard)
+                elif item[0] == 'shared':
+                    self.__apply_shared(item[1])
+                elif item[0] == 'snapshot':
+                    self.__cities.load(item[1])
+                    for url, file_id in item[2]:
+                        self.__photos.set(url, file_id)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.__save_snapshot()
+            if self.__own_api:
+                await self.__api.close()
+
+    def start_worker(self, updates: multiprocessing.Queue, events: multiprocessing.Queue, shard: tuple) -> None:
         """
-        Метод, отвечающий основной команде history бота.
+        Функция, запускающая бота как процесс-обработчик супервизора (см. start).
 
         :param:
-          message (Message): сообщение.
+          updates (Queue): очередь обновлений и изменений общих кэшей от супервизора.
+          events (Queue): очередь изменений общих кэшей для супервизора.
+          shard (tuple): номер обработчика и количество обработчиков.
         """
-        if self.__history.get(message.chat.id) == None:
-            await self.__bot.send_message(message.chat.id, 'История пуста.')
-            return
-
-        history_keyboard = types.InlineKeyboardMarkup()
-
-        # Button: h_photo_yes
-        history_keyboard.row(types.InlineKeyboardButton(text='Да.', callback_data='h_photo_yes'))
-        # Button: h_photo_no
-        history_keyboard.row(types.InlineKeyboardButton(text='Нет.', callback_data='h_photo_no'))
+        asyncio.run(self.__work(updates, events, shard))
 
-        await self.__bot.send_message(message.chat.id, 'С фотографиями?', reply_markup=history_keyboard)
+    # ---------------------------------------------[workers]---------------------------------------------<End>
 
-    # Callback: h_photo_yes, h_photo_no
-    @__callback_func
-    async def __callback_h_photo(self, call: CallbackQuery) -> None:
+    def start(self, workers: int = 1):
         """
-        Метод, отвечающий кнопкам h_photo_yes, h_photo_no.
+        Функция запускающая бота.
 
         :param:
-          call (CallbackQuery): вызов.
+          workers (int): количество процессов-обработчиков. Если больше 1, бот запускается в режиме супервизора.
         """
-        await self.__history_result(call.message.chat.id, call.data == 'h_photo_yes')
+        asyncio.run(self.__supervise(workers) if workers > 1 else self.__run())
 
-    async def __history_result(self, chat_id, photo):
-        try:
-            for result in self.__history[chat_id]:
-                await self.__bot.send_message(chat_id,
-                                              f"Команда: {result['command']}\nВремя ввода команды: {result['time']}\nОтели:")
-                for hotel in result['hotels']:
-                    await self.__bot.send_message(chat_id,
-                                                  f"Название: {hotel['name']}\nЦена: {hotel['price']}\nДистанция от центра (км): {hotel['dist']}\nАдрес: {hotel['address']}")
+    async def run(self) -> None:
+        """
+        Функция, выполняющая работу бота в уже запущенном цикле событий, например вместе с другими ботами
+        (см. HotelBotHost). Бот останавливается отменой задачи.
+        """
+        await self.__run(serve=False)
 
-                    if photo and len(hotel['photoes']):
-                        await self.__bot.send_media_group(chat_id,
-                                                          list(map(telebot.types.InputMediaPhoto, hotel['photoes'])))
-        except:
-            await self.__bot.send_message(chat_id, '\U00002620 Ошибка.\U00002620 \n')
 
-    # ---------------------------------------------[/history]---------------------------------------------<End>
+class HotelBotHost:
+    """
+    Несколько телеграм-ботов с разными токенами в одном процессе и одном цикле событий. Боты используют общий
+    HotelAPI (соединения, кэш ответов, квота, выполняющиеся запросы), а состояние чатов, история и кэш file_id
+    фотографий у каждого бота свои. Снимок кэша ответов, измерение задержки цикла событий и профилирование
+    при запуске выполняет только первый бот (HotelAPI.owner).
 
-    def start(self):
+    Args:
+      bots (list): боты, пары (telegram_token, options), где options - аргументы HotelBot (photo_cache, history,
+        snapshot, admins, ...). Пути, не указанные в options, получают номер бота: photo_cache.0.json, history.0, ...
+      api_key (str): ключ для HotelAPI или список ключей, которые используются по очереди.
+      daily_quota (int): ограничение количества запросов к API в сутки на один ключ (None - без ограничения).
+      cache (str): адрес кэша ответов API (см. ResponseCache.open).
+    """
+
+    def __init__(self, bots: list, api_key, daily_quota: int = None, cache: str = None) -> None:
+        self.api = HotelAPI(api_key, daily_quota, cache)
+        self.bots = []
+        for i, (telegram_token, options) in enumerate(bots):
+            options = dict({'photo_cache': f'photo_cache.{i}.json', 'history': f'history.{i}',
+                            'snapshot': f'snapshot.bin.{i}'}, **options)
+            self.bots.append(HotelBot(telegram_token, None, api=self.api, **options))
+
+    async def run(self) -> None:
         """
-        Функция запускающая бота.
+        Функция, выполняющая работу всех ботов. Боты останавливаются отменой задачи.
+        """
+        try:
+            await asyncio.gather(*(bot.run() for bot in self.bots))
+        finally:
+            await self.api.close()
+
+    def start(self) -> None:
         """
-        asyncio.run(self.__bot.polling(none_stop=True))
\ No newline at end of file
+        Функция, запускающая ботов до получения SIGTERM.
+        """
+        asyncio.run(_serve(self.run()))
+
+
+async def _serve(main) -> None:
+    """
+    Функция, выполняющая корутину main до ее завершения или получения SIGTERM.
+
+    :param:
+      main (Coroutine): корутина.
+    """
+    task = asyncio.create_task(main)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    except NotImplementedError:
+        pass
+
+    try:
+        await asyncio.wait([task])
+        if not task.cancelled():
+            task.result()
+    finally:
+        task.cancel()
+
+
+def _run_worker(telegram_token: str, api_key: str, options: dict, updates: multiprocessing.Queue,
+                events: multiprocessing.Queue, shard: tuple) -> None:
+    """
+    Функция, выполняющаяся в процессе-обработчике супервизора.
+    """
+    HotelBot(telegram_token, api_key, **options).start_worker(updates, events, shard)
\ No newline at end of file
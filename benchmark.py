@@ -0,0 +1,361 @@
+"""
+Бенчмарки HotelBot без сети: ответы HotelAPI подменяются сгенерированными локально.
+
+  python benchmark.py loop [--searches N] [--rate N] [--properties N]
+    Задержка цикла событий, пока бот разбирает страницы списка отелей поисков, приходящих с частотой rate в секунду,
+    с обработкой больших ответов в пуле потоков и без неё.
+
+  python benchmark.py memory [--chats N] [--searches N] [--budget BYTES]
+    Память (tracemalloc) состояния одного чата по структурам бота. Чаты (по умолчанию 200) проходят /reg с двумя
+    комнатами, searches поисков (по умолчанию 2) по очереди lowprice и highprice и останавливаются посреди настройки
+    bestdeal. Завершается с кодом 1, если чат занимает больше budget байт (по умолчанию 8 КиБ).
+"""
+
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import aiohttp
+from telebot import types, asyncio_helper
+
+import HotelBot
+
+
+def make_page(properties: int) -> str:
+    """
+    Функция, генерирующая ответ https://hotels4.p.rapidapi.com/properties/v2/list с properties отелями.
+
+    :param:
+      properties (int): количество отелей.
+
+    :return:
+      text (str): ответ API.
+    """
+    hotels = []
+    for i in range(properties):
+        hotels.append({
+            'id': str(i),
+            'name': f'Hotel {i}',
+            'price': {'lead': {'amount': random.uniform(20, 900), 'formatted': '$100'},
+                      'options': [{'strikeOut': None, 'disclaimer': {'value': 'x' * 80}}] * 3},
+            'destinationInfo': {'distanceFromDestination': {'value': random.uniform(0, 20), 'unit': 'MILE'}},
+            'mapMarker': {'latLong': {'latitude': random.uniform(-90, 90), 'longitude': random.uniform(-180, 180)}},
+            'propertyImage': {'image': {'url': f'https://images.trvl-media.com/hotels/{i}/_z.jpg'}},
+            'reviews': {'score': random.uniform(1, 10), 'total': random.randint(0, 5000)},
+            'offerSummary': {'messages': [{'message': 'Reserve now, pay later', 'theme': 'SUCCESS'}] * 3},
+            'amenities': [{'name': f'amenity {n}', 'icon': 'icon'} for n in range(15)]
+        })
+    return json.dumps({'data': {'propertySearch': {'properties': hotels}}})
+
+
+def make_detail(images: int) -> str:
+    """
+    Функция, генерирующая ответ https://hotels4.p.rapidapi.com/properties/v2/detail с images фотографиями.
+
+    :param:
+      images (int): количество фотографий.
+
+    :return:
+      text (str): ответ API.
+    """
+    return json.dumps({'data': {'propertyInfo': {
+        'summary': {'location': {'address': {'addressLine': '12 Rue de Rivoli, Paris, 75001'},
+                                 'coordinates': {'latitude': 48.856, 'longitude': 2.352}}},
+        'propertyGallery': {'images': [{'image': {'url': f'https://images.trvl-media.com/hotels/{n}/_z.jpg'}}
+                                       for n in range(images)]}}}})
+
+
+def make_cities(cities: list) -> str:
+    """
+    Функция, генерирующая ответ https://hotels4.p.rapidapi.com/locations/v3/search с городами cities.
+
+    :param:
+      cities (list): пары (gaiaId, название).
+
+    :return:
+      text (str): ответ API.
+    """
+    return json.dumps({'sr': [{'type': 'CITY', 'gaiaId': gaia_id, 'regionNames': {
+        'displayName': name, 'shortName': name.split(',')[0]}} for gaia_id, name in cities]})
+
+
+class FakeSession:
+    """
+    Замена aiohttp.ClientSession, которая сразу отвечает на запрос текстом bodies[url] или body.
+    """
+
+    body = ''
+    bodies = dict()
+
+    def __init__(self, **kwargs) -> None:
+        pass
+
+    def request(self, method: str, url: str, **kwargs):
+        return FakeResponse(FakeSession.bodies.get(url, FakeSession.body))
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeResponse:
+    """
+    Ответ FakeSession.
+    """
+
+    def __init__(self, body: str) -> None:
+        self.__body = body
+
+    async def __aenter__(self):
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def text(self) -> str:
+        return self.__body
+
+
+class FakeTelegram:
+    """
+    Замена Bot API Telegram: запросы бота никуда не отправляются, а на отправку сообщения возвращается новое
+    сообщение. Действия пользователя передаются боту как обновления, полученные от Telegram.
+
+    Args:
+      bot (HotelBot): бот.
+    """
+
+    def __init__(self, bot: HotelBot.HotelBot) -> None:
+        self.__bot = bot._HotelBot__bot
+        self.__ids = itertools.count(1)
+        # Последнее сообщение бота в чате: на его кнопки нажимает пользователь.
+        self.last = dict()
+        asyncio_helper._process_request = self.__process_request
+
+    async def __process_request(self, token: str, url: str, method: str = 'get', params: dict = None,
+                                files=None, **kwargs):
+        if not url.startswith('send') and not url.startswith('edit'):
+            return True
+        chat_id = int(params['chat_id'])
+        message = {'message_id': next(self.__ids), 'date': int(time.time()), 'text': params.get('text', ''),
+                   'chat': {'id': chat_id, 'type': 'private'}}
+        self.last[chat_id] = message
+        return [message] if url == 'sendMediaGroup' else message
+
+    async def send(self, chat_id: int, text: str) -> None:
+        """
+        Метод, отправляющий боту сообщение text от пользователя чата chat_id.
+
+        :param:
+          chat_id (int): id чата.
+          text (str): текст сообщения.
+        """
+        await self.__update('message', {'message_id': next(self.__ids), 'date': int(time.time()), 'text': text,
+                                        'chat': {'id': chat_id, 'type': 'private'},
+                                        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'}})
+
+    async def press(self, chat_id: int, data: str) -> None:
+        """
+        Метод, нажимающий кнопку с callback_data data на последнем сообщении бота в чате chat_id.
+
+        :param:
+          chat_id (int): id чата.
+          data (str): callback_data кнопки.
+        """
+        await self.__update('callback_query', {'id': str(next(self.__ids)), 'data': data,
+                                               'chat_instance': str(chat_id), 'message': self.last[chat_id],
+                                               'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'}})
+
+    async def __update(self, kind: str, obj: dict) -> None:
+        await self.__bot.process_new_updates([types.Update.de_json({'update_id': next(self.__ids), kind: obj})])
+        # Фоновые задачи бота (предварительная загрузка) завершаются до следующего действия пользователя.
+        await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+
+
+async def loop_lag(offload: bool, searches: int, rate: float) -> dict:
+    """
+    Функция, измеряющая задержку цикла событий, пока бот выполняет searches поисков, приходящих с частотой rate.
+
+    :param:
+      offload (bool): разбирать большие ответы в пуле потоков.
+      searches (int): количество поисков.
+      rate (float): количество новых поисков в секунду.
+
+    :return:
+      result (dict): перцентили задержки (мс) и общее время (сек).
+    """
+    with tempfile.TemporaryDirectory() as path:
+        api = HotelBot.HotelAPI('benchmark')
+        # Ответы не кэшируются: иначе задержку определяет сборка мусора в растущем кэше, а не разбор ответов.
+        api.CACHE_TTL = dict()
+        if not offload:
+            api.OFFLOAD_BYTES = float('inf')
+        bot = HotelBot.HotelBot('0:benchmark', None, photo_cache=None, history=path, snapshot=None, api=api)
+        monitor = HotelBot.LoopMonitor(0.001, 3600, 1000000)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+
+        async def search(n: int) -> None:
+            await asyncio.sleep(n / rate)
+            await bot._HotelBot__list_page({'destination': {'regionId': str(n)}, 'resultsStartingIndex': 0,
+                                            'checkInDate': {'day': 1, 'month': 1, 'year': 2030},
+                                            'checkOutDate': {'day': 2, 'month': 1, 'year': 2030},
+                                            'rooms': [{'adults': 1}]}, refresh=True)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(search(n) for n in range(searches)))
+        elapsed = time.perf_counter() - start
+
+        task.cancel()
+        await api.close()
+        return dict({f'p{q * 100:g}': lag * 1000 for q, lag in monitor.percentiles().items()}, time=elapsed)
+
+
+# Структуры бота с состоянием чатов, память которых измеряет chat_memory.
+CHAT_STRUCTURES = ['data', 'history', 'bestdeal_settings', 'main_settings', 'last_keyboard_id',
+                   'steps', 'cursors', 'prefetch']
+# Города, которые находит FakeSession, и минимальное количество чатов, которые проходят сценарий до начала измерения,
+# чтобы общие кэши (города, ответы API) и журнал последних поисков уже были заполнены.
+CITIES = [('2734', 'Paris, Ile-de-France, France'), ('2872', 'Rome, Lazio, Italy'),
+          ('2621', 'Madrid, Community of Madrid, Spain')]
+WARMUP_CHATS = 20
+
+
+async def chat_session(telegram: FakeTelegram, chat_id: int, searches: int) -> None:
+    """
+    Функция, проходящая сценарий пользователя чата chat_id: /reg с двумя комнатами, searches поисков
+    и начало поиска bestdeal с фильтром цены, которое останавливается на вопросе о количестве отелей.
+
+    :param:
+      telegram (FakeTelegram): замена Bot API.
+      chat_id (int): id чата.
+      searches (int): количество поисков.
+    """
+    gaia_id, name = CITIES[chat_id % len(CITIES)]
+    check_in = date.today() + timedelta(days=30 + chat_id % 7)
+
+    await telegram.send(chat_id, '/reg')
+    await telegram.press(chat_id, 'checkIn')
+    await telegram.send(chat_id, f'{check_in:%d.%m.%Y}')
+    await telegram.press(chat_id, 'checkOut')
+    await telegram.send(chat_id, f'{check_in + timedelta(days=3):%d.%m.%Y}')
+    await telegram.press(chat_id, 'add_room')
+    await telegram.press(chat_id, 'room1')
+    await telegram.press(chat_id, 'adult1')
+    await telegram.send(chat_id, '2')
+    await telegram.press(chat_id, 'exit_reg')
+
+    # Команды поисков чередуются: одинаковая команда, повторенная быстрее COMMAND_DEBOUNCE, игнорируется.
+    for command in itertools.islice(itertools.cycle(['/lowprice', '/highprice']), searches):
+        await telegram.send(chat_id, command)
+        await telegram.send(chat_id, name.split(',')[0])
+        await telegram.press(chat_id, f'main_city{gaia_id}')
+        await telegram.send(chat_id, '3')
+        await telegram.press(chat_id, 'photo_no')
+
+    await telegram.send(chat_id, '/bestdeal')
+    await telegram.send(chat_id, name.split(',')[0])
+    await telegram.press(chat_id, f'bestdeal_menu{gaia_id}')
+    await telegram.press(chat_id, 'bestdeal_filtersprice_max')
+    await telegram.send(chat_id, '300')
+    await telegram.press(chat_id, 'bestdeal_exit')
+    telegram.last.pop(chat_id, None)
+
+
+async def chat_memory(chats: int, searches: int) -> dict:
+    """
+    Функция, измеряющая, сколько памяти занимает состояние одного чата, всего и по структурам CHAT_STRUCTURES.
+    Память структуры - сколько освобождается после удаления из нее измеряемых чатов, прочее (other) - остальные
+    объекты чатов, например недавние действия для защиты от повторов. История хранится на диске (history - 0 байт
+    в памяти) и измеряется там.
+
+    :param:
+      chats (int): количество измеряемых чатов.
+      searches (int): количество поисков каждого чата.
+
+    :return:
+      result (dict): байт на чат по структурам, всего (total) и истории на диске (history_disk).
+    """
+    with tempfile.TemporaryDirectory() as path:
+        # Память отслеживается с самого начала: иначе объекты, созданные до измерения и замененные во время него
+        # (например, вытесненные из журнала последних поисков), не вычитаются из результата.
+        tracemalloc.start()
+        bot = HotelBot.HotelBot('0:benchmark', 'benchmark', photo_cache=None, history=path, snapshot=None)
+        telegram = FakeTelegram(bot)
+        warmup = 0
+        while warmup < WARMUP_CHATS or len(bot._HotelBot__recent_searches) < bot.PREWARM_SEARCHES:
+            warmup += 1
+            await chat_session(telegram, warmup, searches)
+        measured = range(warmup + 1, warmup + chats + 1)
+
+        gc.collect()
+        start = tracemalloc.get_traced_memory()[0]
+        for chat_id in measured:
+            await chat_session(telegram, chat_id, searches)
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0]
+
+        result = {'total': (used - start) / chats}
+        for name in CHAT_STRUCTURES:
+            structure = getattr(bot, f'_HotelBot__{name}')
+            if isinstance(structure, dict):
+                for chat_id in measured:
+                    structure.pop(chat_id, None)
+            gc.collect()
+            freed, used = used - tracemalloc.get_traced_memory()[0], tracemalloc.get_traced_memory()[0]
+            result[name] = freed / chats
+        tracemalloc.stop()
+        result['other'] = result['total'] - sum(result[name] for name in CHAT_STRUCTURES)
+        result['history_disk'] = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path)
+                                     if int(file.split('.')[0]) in measured) / chats
+        await bot._HotelBot__api.close()
+        return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=['loop', 'memory'])
+    parser.add_argument('--searches', type=int)
+    parser.add_argument('--rate', type=float, default=50)
+    parser.add_argument('--properties', type=int, default=200)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--budget', type=int, default=8 * 1024)
+    args = parser.parse_args()
+    aiohttp.ClientSession = FakeSession
+
+    if args.benchmark == 'memory':
+        searches = 2 if args.searches is None else args.searches
+        FakeSession.bodies = {
+            "https://hotels4.p.rapidapi.com/locations/v3/search": make_cities(CITIES),
+            "https://hotels4.p.rapidapi.com/properties/v2/list": make_page(HotelBot.HotelBot.CURSOR_HOTELS),
+            "https://hotels4.p.rapidapi.com/properties/v2/detail": make_detail(20)}
+        result = asyncio.run(chat_memory(args.chats, searches))
+        print(f'Чатов: {args.chats}, поисков в каждом: {searches}')
+        for name, value in result.items():
+            print(f'{name:>26}: {value:8.0f} байт на чат')
+        if result['total'] > args.budget:
+            print(f"Память чата {result['total']:.0f} байт больше бюджета {args.budget} байт.")
+            sys.exit(1)
+        return
+
+    searches = 200 if args.searches is None else args.searches
+    FakeSession.body = make_page(args.properties)
+    print(f'Страница: {len(FakeSession.body)} байт, поисков: {searches}, в секунду: {args.rate:g}')
+    for offload in (False, True):
+        result = asyncio.run(loop_lag(offload, searches, args.rate))
+        print(f"{'пул потоков' if offload else 'цикл событий':>12}: задержка цикла (мс) " +
+              ', '.join(f'{name} {value:.1f}' for name, value in result.items() if name != 'time') +
+              f", время {result['time']:.2f} сек")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import HotelBot
 
-tg_token = 'TOKEN HERE'
-key = "4005af239bmsh9de58e0da414237p10e363jsnde2d2f6de034"
-hotel_bot = HotelBot.HotelBot(tg_token, key)
-hotel_bot.start()
+if __name__ == '__main__':
+    tg_token = 'TOKEN HERE'
+    key = "4005af239bmsh9de58e0da414237p10e363jsnde2d2f6de034"
+    hotel_bot = HotelBot.HotelBot(tg_token, key)
+    hotel_bot.start()
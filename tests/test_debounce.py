@@ -0,0 +1,116 @@
+"""
+Тесты защиты от повторов: повторная команда и повторное нажатие кнопки в течение окна игнорируются,
+а вызовы методов команд самим ботом - нет.
+
+  python -m pytest tests
+"""
+
+import itertools
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from telebot import asyncio_helper, types
+
+import HotelBot
+
+
+def make_message(chat_id: int, message_id: int, text: str, edit_date: int = None) -> dict:
+    return {'message_id': message_id, 'date': 1, 'text': text, 'edit_date': edit_date,
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'}}
+
+
+class RepeatedTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.bot = HotelBot.HotelBot('0:token', 'key', photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None)
+        self.now = 1000.0
+        patcher = mock.patch.object(HotelBot.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.path.cleanup()
+
+    def test_command_window(self) -> None:
+        def repeated(message: dict) -> bool:
+            return self.bot._HotelBot__repeated_command(types.Message.de_json(message))
+
+        self.assertFalse(repeated(make_message(1, 1, '/reg')))
+        self.now += self.bot.COMMAND_DEBOUNCE / 2
+        self.assertTrue(repeated(make_message(1, 2, '/reg')))
+        # Другая команда и другой чат - не повтор.
+        self.assertFalse(repeated(make_message(1, 3, '/history')))
+        self.assertFalse(repeated(make_message(2, 4, '/reg')))
+        # Окно считается от первой команды: повтор не продлевает его.
+        self.now += self.bot.COMMAND_DEBOUNCE / 2
+        self.assertFalse(repeated(make_message(1, 5, '/reg')))
+
+    def test_callback_window(self) -> None:
+        def call(message: dict, data: str) -> types.CallbackQuery:
+            return types.CallbackQuery.de_json({'id': '1', 'data': data, 'chat_instance': '1', 'message': message,
+                                                'from': message['from']})
+
+        repeated = self.bot._HotelBot__repeated_call
+        message = make_message(1, 1, 'Меню')
+        self.assertFalse(repeated(call(message, 'add_room')))
+        self.assertTrue(repeated(call(message, 'add_room')))
+        # Та же кнопка на измененном сообщении или другая кнопка - не повтор.
+        self.assertFalse(repeated(call(make_message(1, 1, 'Меню', edit_date=5), 'add_room')))
+        self.assertFalse(repeated(call(message, 'reset')))
+        self.now += self.bot.CALLBACK_DEBOUNCE
+        self.assertFalse(repeated(call(message, 'add_room')))
+
+
+class CommandTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.bot = HotelBot.HotelBot('0:token', 'key', photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None)
+        self.ids = itertools.count(1)
+        self.menus = []
+
+        async def process_request(token: str, url: str, method: str = 'get', params: dict = None, **kwargs):
+            if not url.startswith('send') and not url.startswith('edit'):
+                return True
+            message = {'message_id': next(self.ids), 'date': int(time.time()), 'text': params.get('text', ''),
+                       'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+            self.menus.append(message)
+            return message
+
+        patcher = mock.patch.object(asyncio_helper, '_process_request', process_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        self.path.cleanup()
+
+    async def update(self, kind: str, obj: dict) -> None:
+        await self.bot._HotelBot__bot.process_new_updates([types.Update.de_json({'update_id': next(self.ids),
+                                                                                 kind: obj})])
+
+    async def send(self, text: str) -> None:
+        await self.update('message', make_message(1, next(self.ids), text))
+
+    async def press(self, data: str) -> None:
+        await self.update('callback_query', {'id': str(next(self.ids)), 'data': data, 'chat_instance': '1',
+                                             'message': self.menus[-1],
+                                             'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}})
+
+    async def test_internal_reg_not_debounced(self) -> None:
+        await self.send('/reg')
+        await self.send('/reg')
+        self.assertEqual(len(self.menus), 1)
+        # Кнопки меню снова вызывают __reg сразу после команды: меню выводится каждый раз.
+        await self.press('add_room')
+        await self.press('add_room')
+        self.assertEqual(len(self.menus), 3)
+        self.assertEqual(len(self.bot._HotelBot__data[1]['rooms']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Тесты поиска отелей рядом с отправленной геопозицией: GeoIndex и ответ бота без запроса к API.
+
+  python -m pytest tests
+"""
+
+import datetime
+import tempfile
+import time
+import unittest
+
+from telebot import types
+
+import HotelBot
+
+
+def make_properties(lat: float, lon: float, count: int, spread: float) -> list:
+    """
+    Функция, возвращающая count отелей страницы списка на сетке со стороной 2 * spread градусов вокруг точки.
+    """
+    side = int(count ** 0.5) + 1
+    return [{'id': str(i), 'name': f'Hotel {i}', 'price': {'lead': {'formatted': '$100'}},
+             'mapMarker': {'latLong': {'latitude': lat - spread + 2 * spread * (i // side) / side,
+                                       'longitude': lon - spread + 2 * spread * (i % side) / side}}}
+            for i in range(count)]
+
+
+class GeoIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.index = HotelBot.GeoIndex(60)
+
+    def test_covered_disc(self) -> None:
+        self.assertFalse(self.index.covered(48.85, 2.35, 'key', 0.5))
+        self.index.cover('key', 48.85, 2.35, 1)
+        self.assertTrue(self.index.covered(48.85, 2.35, 'key', 1))
+        # Точка в 220 м от центра: круг 0.5 км вокруг нее внутри покрытого, а круг 0.9 км - нет.
+        self.assertTrue(self.index.covered(48.852, 2.35, 'key', 0.5))
+        self.assertFalse(self.index.covered(48.852, 2.35, 'key', 0.9))
+        self.assertFalse(self.index.covered(48.85, 2.35, 'other', 0.5))
+
+    def test_coverage_expires(self) -> None:
+        index = HotelBot.GeoIndex(0.05)
+        index.cover('key', 48.85, 2.35, 1)
+        time.sleep(0.1)
+        self.assertFalse(index.covered(48.85, 2.35, 'key', 0.5))
+
+    def test_nearest(self) -> None:
+        for hotel in make_properties(48.85, 2.35, 25, 0.01):
+            coordinates = hotel['mapMarker']['latLong']
+            self.index.add(hotel['id'], coordinates['latitude'], coordinates['longitude'])
+        self.index.add_prices('key', {str(i): ('Hotel', '$100') for i in range(0, 25, 2)})
+        hotels = self.index.nearest(48.85, 2.35, 'key', 3, 10)
+        self.assertEqual(len(hotels), 3)
+        self.assertEqual([hotel[0] for hotel in hotels], sorted(hotel[0] for hotel in hotels))
+        self.assertTrue(all(int(hotel[1]) % 2 == 0 for hotel in hotels))
+
+
+class NearTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.api = HotelBot.HotelAPI('key')
+        self.requests = []
+        self.hotels = None
+
+        async def request(method: str, url: str, ttl: float = None, refresh: bool = False, **kwargs) -> dict:
+            self.requests.append(kwargs['json']['destination']['coordinates'])
+            coordinates = kwargs['json']['destination']['coordinates']
+            properties = make_properties(coordinates['latitude'], coordinates['longitude'],
+                                         self.hotels or kwargs['json']['resultsSize'], 0.01)
+            return {'data': {'propertySearch': {'properties': properties}}}
+
+        self.api.request = request
+        self.bot = HotelBot.HotelBot('0:token', None, photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None, api=self.api)
+        self.sent = []
+
+        async def send_message(chat_id: int, text: str, **kwargs) -> None:
+            self.sent.append(text)
+
+        self.bot._HotelBot__bot.send_message = send_message
+        check_in = datetime.date.today() + datetime.timedelta(days=10)
+        self.bot._HotelBot__data[1] = {'in': check_in, 'out': check_in + datetime.timedelta(days=2),
+                                       'rooms': [[2, []]], 'count': 1}
+
+    async def asyncTearDown(self) -> None:
+        await self.api.close()
+        self.path.cleanup()
+
+    async def send_location(self, lat: float, lon: float) -> None:
+        await self.bot._HotelBot__near(types.Message.de_json(
+            {'message_id': len(self.sent) + 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'},
+             'from': {'id': 1, 'is_bot': False, 'first_name': 'User'},
+             'location': {'latitude': lat, 'longitude': lon}}))
+
+    async def test_nearby_location_uses_index(self) -> None:
+        await self.send_location(48.85, 2.35)
+        self.assertEqual(len(self.requests), 1)
+        self.assertIn('Расстояние', self.sent[-1])
+
+        # Соседняя точка (~110 м) внутри круга, покрытого полной страницей ответа: без запроса к API.
+        await self.send_location(48.851, 2.35)
+        self.assertEqual(len(self.requests), 1)
+        self.assertIn('Расстояние', self.sent[-1])
+
+        # Точка в 5 км - вне покрытого круга.
+        await self.send_location(48.895, 2.35)
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_sparse_area_repeated_location(self) -> None:
+        # Неполная страница покрывает весь NEAR_RADIUS: та же геопозиция еще раз отвечается из индекса.
+        self.hotels = 3
+        self.bot.COMMAND_DEBOUNCE = 0
+        await self.send_location(48.85, 2.35)
+        await self.send_location(48.85, 2.35)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.sent[-1].count('Название'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
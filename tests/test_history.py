@@ -0,0 +1,132 @@
+"""
+Тесты истории поисков: журнал HistoryLog и вывод страниц истории с фото.
+
+  python -m pytest tests
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from telebot import types
+
+import HotelBot
+
+
+def make_entry(command: str, photoes: int) -> dict:
+    return {'command': command, 'time': '01.01.2026 12:00:00',
+            'hotels': [{'name': 'Hotel', 'price': '$100', 'dist': 1.0, 'address': 'Address',
+                        'photoes': [f'https://example.com/{command}/{i}.jpg' for i in range(photoes)]}]}
+
+
+class HistoryLogTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self) -> None:
+        self.path.cleanup()
+
+    async def fill(self, history: HotelBot.HistoryLog, count: int) -> None:
+        for i in range(count):
+            await history.append(1, make_entry(f'/lowprice{i}', 1))
+
+    async def test_append_after_truncated_write(self) -> None:
+        history = HotelBot.HistoryLog(self.path.name, None)
+        await self.fill(history, 2)
+        # Бот упал посреди записи: в журнале остаток записи без индекса, в индексе - неполные 8 байт.
+        with open(os.path.join(self.path.name, '1.jsonl'), 'ab') as log:
+            log.write(b'{"command": "/brok')
+        with open(os.path.join(self.path.name, '1.idx'), 'ab') as idx:
+            idx.write(b'\x01\x02\x03')
+        self.assertEqual(await history.count(1), 2)
+
+        await history.append(1, make_entry('/highprice', 1))
+        self.assertEqual(await history.count(1), 3)
+        self.assertEqual([entry['command'] for entry in await history.page(1, 0, 3)],
+                         ['/lowprice0', '/lowprice1', '/highprice'])
+        self.assertEqual(os.path.getsize(os.path.join(self.path.name, '1.idx')), 3 * 8)
+
+        export = os.path.join(self.path.name, 'export.json')
+        self.assertEqual(await history.export(1, export, 'json'), 3)
+        with open(export, encoding='utf-8') as file:
+            self.assertEqual(json.load(file)[-1]['command'], '/highprice')
+
+    async def test_compact_keep_none(self) -> None:
+        history = HotelBot.HistoryLog(self.path.name, None)
+        await self.fill(history, 5)
+        await history.compact()
+        self.assertEqual(await history.count(1), 5)
+
+    async def test_compact_keep(self) -> None:
+        history = HotelBot.HistoryLog(self.path.name, 2)
+        await self.fill(history, 5)
+        await history.append(2, make_entry('/bestdeal', 1))
+        await history.compact()
+        self.assertEqual([entry['command'] for entry in await history.page(1, 0, 5)], ['/lowprice3', '/lowprice4'])
+        self.assertEqual(await history.count(2), 1)
+        # После сжатия журнал продолжается с верными смещениями.
+        await history.append(1, make_entry('/highprice', 1))
+        self.assertEqual([entry['command'] for entry in await history.page(1, 1, 3)], ['/lowprice4', '/highprice'])
+
+    async def test_compact_filter(self) -> None:
+        history = HotelBot.HistoryLog(self.path.name, 1)
+        await self.fill(history, 3)
+        await history.compact(lambda chat_id: chat_id != 1)
+        self.assertEqual(await history.count(1), 3)
+
+
+class HistoryResultTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.bot = HotelBot.HotelBot('0:token', 'key', photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None)
+        self.history = self.bot._HotelBot__history
+        self.groups = []
+        self.sent = []
+        self.fail = False
+        telegram = self.bot._HotelBot__bot
+
+        async def send_message(chat_id: int, text: str, reply_markup=None, **kwargs):
+            self.sent.append((text, reply_markup))
+            return types.Message.de_json({'message_id': len(self.sent), 'date': 0, 'text': text,
+                                          'chat': {'id': chat_id, 'type': 'private'}})
+
+        async def send_media_group(chat_id: int, media: list, **kwargs) -> list:
+            if self.fail:
+                raise RuntimeError('Bad Request: wrong file identifier')
+            self.groups.append([item.caption for item in media])
+            return []
+
+        async def send_photo(chat_id: int, photo: str, caption: str = None, **kwargs):
+            self.groups.append([caption])
+
+        telegram.send_message, telegram.send_media_group, telegram.send_photo = send_message, send_media_group, send_photo
+
+    async def asyncTearDown(self) -> None:
+        self.path.cleanup()
+
+    async def test_no_single_photo_group(self) -> None:
+        await self.history.append(1, make_entry('/lowprice', 11))
+        await self.bot._HotelBot__history_result(1, True, 0)
+        self.assertEqual([len(group) for group in self.groups], [6, 5])
+        self.assertEqual(self.groups[0][0], 'Hotel')
+
+    async def test_single_photo(self) -> None:
+        await self.history.append(1, make_entry('/lowprice', 1))
+        await self.bot._HotelBot__history_result(1, True, 0)
+        self.assertEqual(self.groups, [['Hotel']])
+
+    async def test_keyboard_after_failed_photos(self) -> None:
+        for i in range(self.bot.HISTORY_PAGE + 1):
+            await self.history.append(1, make_entry(f'/lowprice{i}', 3))
+        self.fail = True
+        await self.bot._HotelBot__history_result(1, True, 0)
+        self.assertEqual(self.sent[-1][0], 'Страница 1 из 2.')
+        self.assertIsNotNone(self.sent[-1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Тесты клиента HotelAPI: общие запросы для одинаковых вызовов (отмена одного вызова, общая ошибка).
+
+  python -m pytest tests
+"""
+
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import HotelBot
+
+URL = 'https://hotels4.p.rapidapi.com/locations/v3/search'
+
+
+class FakeSession:
+    """
+    Замена aiohttp.ClientSession: ответ отдается, когда тест откроет release, или вызывает ошибку error.
+    """
+
+    def __init__(self, test: 'HotelAPITest', **kwargs) -> None:
+        self.__test = test
+
+    def request(self, method: str, url: str, **kwargs) -> 'FakeSession':
+        self.__test.requests += 1
+        return self
+
+    async def __aenter__(self) -> 'FakeSession':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def text(self) -> str:
+        await self.__test.release.wait()
+        if self.__test.error:
+            raise self.__test.error
+        return json.dumps({'sr': [{'n': self.__test.requests}]})
+
+    async def close(self) -> None:
+        pass
+
+
+class HotelAPITest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.requests = 0
+        self.error = None
+        self.release = asyncio.Event()
+        patcher = mock.patch.object(HotelBot.aiohttp, 'ClientSession', lambda **kwargs: FakeSession(self, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.api = HotelBot.HotelAPI('key')
+
+    async def asyncTearDown(self) -> None:
+        await self.api.close()
+
+    def call(self, query: str = 'Paris') -> asyncio.Task:
+        return asyncio.create_task(self.api.request('GET', URL, params={'q': query}))
+
+    async def test_one_request_for_same_calls(self) -> None:
+        calls = [self.call(), self.call(), self.call('Rome')]
+        await asyncio.sleep(0)
+        self.release.set()
+        first, second, other = await asyncio.gather(*calls)
+        self.assertIs(first, second)
+        self.assertEqual(self.requests, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_fetch(self) -> None:
+        first, second = self.call(), self.call()
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await second, {'sr': [{'n': 1}]})
+        self.assertTrue(first.cancelled())
+        self.assertEqual(self.requests, 1)
+
+    async def test_last_waiter_cancelled(self) -> None:
+        first = self.call()
+        # Запрос первого вызова уже отправлен и ждет ответа.
+        while not self.requests:
+            await asyncio.sleep(0)
+        first.cancel()
+        # Новый вызов сразу после отмены последнего ожидающего получает новый запрос, а не отмену.
+        second = self.call()
+        self.release.set()
+        self.assertEqual(await second, {'sr': [{'n': 2}]})
+        self.assertTrue(first.cancelled())
+        self.assertEqual(self.requests, 2)
+
+    async def test_error_shared_with_all_waiters(self) -> None:
+        self.error = ConnectionResetError('connection reset')
+        calls = [self.call(), self.call()]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        self.assertEqual(results, [self.error, self.error])
+        self.assertEqual(self.requests, 1)
+
+        # Ошибка не кэшируется: следующий вызов отправляет запрос заново.
+        self.error = None
+        self.assertEqual(await self.call(), {'sr': [{'n': 2}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Тесты inline-подсказок городов: локальный индекс и запросы к API для новых запросов.
+
+  python -m pytest tests
+"""
+
+import tempfile
+import unittest
+
+from telebot import types
+
+import HotelBot
+
+
+def make_city(gaia_id: str, name: str) -> dict:
+    return {'type': 'CITY', 'gaiaId': gaia_id, 'regionNames': {'displayName': f'{name}, Country', 'shortName': name}}
+
+
+class InlineCityTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.api = HotelBot.HotelAPI('key')
+        self.queries = []
+        self.cities = {'paris': [make_city('1', 'Paris')], 'par': [make_city('1', 'Paris'), make_city('2', 'Parma')]}
+
+        async def request(method: str, url: str, ttl: float = None, refresh: bool = False, **kwargs) -> dict:
+            self.queries.append(kwargs['params']['q'])
+            return {'sr': self.cities.get(kwargs['params']['q'].lower(), [])}
+
+        self.api.request = request
+        self.bot = HotelBot.HotelBot('0:token', None, photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None, api=self.api)
+        self.bot.INLINE_DEBOUNCE = 0
+        self.answers = []
+
+        async def answer_inline_query(query_id: str, results: list, **kwargs) -> None:
+            self.answers.append([result.title for result in results])
+
+        self.bot._HotelBot__bot.answer_inline_query = answer_inline_query
+
+    async def asyncTearDown(self) -> None:
+        await self.api.close()
+        self.path.cleanup()
+
+    async def inline(self, text: str) -> list:
+        await self.bot._HotelBot__inline_city(types.InlineQuery.de_json(
+            {'id': str(len(self.answers)), 'query': text, 'offset': '',
+             'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}}))
+        return self.answers[-1]
+
+    async def test_new_prefix_queries_api(self) -> None:
+        self.assertEqual(await self.inline('Paris'), ['Paris, Country'])
+        # "Par" уже находит Paris в индексе, но запрос новый: API дополняет подсказки.
+        self.assertEqual(await self.inline('Par'), ['Paris, Country', 'Parma, Country'])
+        self.assertEqual(self.queries, ['Paris', 'Par'])
+
+    async def test_searched_prefix_uses_index(self) -> None:
+        await self.inline('Par')
+        self.assertEqual(await self.inline('par'), ['Paris, Country', 'Parma, Country'])
+        self.assertEqual(self.queries, ['Par'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+Тесты кэшей ответов API. RedisCache проверяется на локальном заменителе Redis (RespServer).
+
+  python -m pytest tests
+"""
+
+import asyncio
+import pickle
+import time
+import unittest
+
+import HotelBot
+
+
+class RespServer:
+    """
+    Заменитель Redis для тестов: команды PING, SELECT, GET, SET (с PX), MGET по протоколу RESP.
+    """
+
+    def __init__(self) -> None:
+        self.data = dict()
+        self.commands = []
+        self.port = None
+        self.__server = None
+        self.__writers = set()
+
+    async def start(self) -> None:
+        self.__server = await asyncio.start_server(self.__serve, '127.0.0.1', 0)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.drop()
+        self.__server.close()
+        await self.__server.wait_closed()
+
+    def drop(self) -> None:
+        """
+        Метод, закрывающий все соединения клиентов (перезапуск Redis).
+        """
+        for writer in self.__writers:
+            writer.close()
+        self.__writers.clear()
+
+    async def __serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__writers.add(writer)
+        try:
+            while True:
+                command = await self.__read(reader)
+                self.commands.append(command)
+                writer.write(self.__reply(command))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.__writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def __read(reader: asyncio.StreamReader) -> list:
+        count = int((await reader.readuntil(b'\r\n'))[1:-2])
+        command = []
+        for _ in range(count):
+            size = int((await reader.readuntil(b'\r\n'))[1:-2])
+            command.append((await reader.readexactly(size + 2))[:-2])
+        return command
+
+    def __get(self, key: bytes):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    @staticmethod
+    def __bulk(value) -> bytes:
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def __reply(self, command: list) -> bytes:
+        name = command[0].upper()
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name == b'SELECT':
+            return b'+OK\r\n'
+        if name == b'SET':
+            expires = time.time() + int(command[4]) / 1000 if len(command) > 4 else None
+            self.data[command[1]] = (command[2], expires)
+            return b'+OK\r\n'
+        if name == b'GET':
+            return self.__bulk(self.__get(command[1]))
+        if name == b'MGET':
+            return b'*%d\r\n' % (len(command) - 1) + b''.join(self.__bulk(self.__get(key)) for key in command[1:])
+        return b'-ERR unknown command\r\n'
+
+
+class RedisCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.server = RespServer()
+        await self.server.start()
+        self.cache = HotelBot.RedisCache('127.0.0.1', self.server.port)
+
+    async def asyncTearDown(self) -> None:
+        await self.cache.close()
+        await self.server.stop()
+
+    async def test_set_get(self) -> None:
+        value = {'data': {'name': 'Отель', 'price': 10.5, 'tags': [1, None, True]}}
+        await self.cache.set('key', value, 60)
+        self.assertEqual(await self.cache.get('key'), value)
+        self.assertIsNone(await self.cache.get('missing'))
+
+    async def test_large_value_is_compressed(self) -> None:
+        value = {'data': ['x' * 100] * 100}
+        await self.cache.set('key', value, 60)
+        stored = self.server.data[b'hotelbot:key'][0]
+        self.assertEqual(stored[:1], HotelBot.ResponseCache.JSON_ZLIB)
+        self.assertLess(len(stored), 1000)
+        self.assertEqual(await self.cache.get('key'), value)
+
+    async def test_get_many_uses_one_mget(self) -> None:
+        await self.cache.set_many([('a', {'n': 1}), ('c', {'n': 3})], 60)
+        self.server.commands.clear()
+        self.assertEqual(await self.cache.get_many(['a', 'b', 'c']), [{'n': 1}, None, {'n': 3}])
+        self.assertEqual(self.server.commands, [[b'MGET', b'hotelbot:a', b'hotelbot:b', b'hotelbot:c']])
+
+    async def test_ttl(self) -> None:
+        await self.cache.set('key', {'n': 1}, 0.05)
+        self.assertEqual(self.server.commands[-1][3:], [b'PX', b'50'])
+        self.assertEqual(await self.cache.get('key'), {'n': 1})
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await self.cache.get('key'))
+
+    async def test_reconnect(self) -> None:
+        await self.cache.set('key', {'n': 1}, 60)
+        self.server.drop()
+        # Запрос на закрытом соединении - промах кэша, следующий открывает соединение заново.
+        await self.cache.get('key')
+        self.assertEqual(await self.cache.get('key'), {'n': 1})
+
+    async def test_select_db(self) -> None:
+        cache = HotelBot.ResponseCache.open(f'redis://127.0.0.1:{self.server.port}/2', 0)
+        try:
+            await cache.set('key', {'n': 1}, 60)
+            self.assertEqual(self.server.commands[0], [b'SELECT', b'2'])
+            self.assertEqual(await cache.get('key'), {'n': 1})
+        finally:
+            await cache.close()
+
+    async def test_pickle_is_not_loaded(self) -> None:
+        # Запись прежнего формата (pickle) или чужая запись не выполняется, а считается промахом.
+        self.server.data[b'hotelbot:key'] = (b'\x00' + pickle.dumps({'n': 1}), None)
+        self.assertIsNone(await self.cache.get('key'))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_abstract(self) -> None:
+        with self.assertRaises(TypeError):
+            HotelBot.ResponseCache()
+
+    def test_pack_unpack(self) -> None:
+        for value in ({'sr': []}, {'data': {'text': 'ё' * 2000}}):
+            self.assertEqual(HotelBot.ResponseCache.unpack(HotelBot.ResponseCache.pack(value)), value)
+        self.assertIsNone(HotelBot.ResponseCache.unpack(HotelBot.ResponseCache.JSON + b'{broken'))
+
+
+if __name__ == '__main__':
+    unittest.main()
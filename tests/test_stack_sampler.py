@@ -0,0 +1,57 @@
+"""
+Тесты профилировщика: к какому обработчику бота StackSampler относит стек.
+
+  python -m pytest tests
+"""
+
+import sys
+import tempfile
+import time
+import unittest
+
+from telebot import types
+
+import HotelBot
+
+
+class StackSamplerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.bot = HotelBot.HotelBot('0:token', 'key', photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None)
+        self.handlers = []
+
+        async def send_message(chat_id: int, text: str, **kwargs) -> None:
+            frames = []
+            frame = sys._getframe()
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            self.handlers.append(HotelBot.StackSampler.handler(frames))
+            del frames
+            raise RuntimeError('stop')
+
+        self.bot._HotelBot__bot.send_message = send_message
+
+    async def asyncTearDown(self) -> None:
+        self.path.cleanup()
+
+    async def test_step_handler(self) -> None:
+        # Ответ на шаг диалога проходит через __next_step_handler, но относится к обработчику шага.
+        self.bot._HotelBot__data[1] = {'in': None, 'out': None, 'rooms': [[1, []]], 'count': 1}
+        self.bot._HotelBot__transition(1, 'checkIn')
+        message = types.Message.de_json({'message_id': 1, 'date': int(time.time()), 'text': 'не дата',
+                                         'chat': {'id': 1, 'type': 'private'},
+                                         'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}})
+        with self.assertRaises(RuntimeError):
+            await self.bot._HotelBot__next_step_handler(message)
+        self.assertEqual(self.handlers, ['__checkIn'])
+
+    def test_idle_and_other(self) -> None:
+        self.assertEqual(HotelBot.StackSampler.handler([]), 'other')
+
+
+if __name__ == '__main__':
+    unittest.main()
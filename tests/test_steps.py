@@ -0,0 +1,64 @@
+"""
+Тесты шагов диалогов: переходы STEP_TRANSITIONS и обработка ответа на шаг.
+
+  python -m pytest tests
+"""
+
+import tempfile
+import time
+import unittest
+
+from telebot import types
+
+import HotelBot
+
+
+class StepsTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.path = tempfile.TemporaryDirectory()
+        self.bot = HotelBot.HotelBot('0:token', 'key', photo_cache=None, history=self.path.name + '/history',
+                                     snapshot=None)
+        self.steps = self.bot._HotelBot__steps
+        self.transition = self.bot._HotelBot__transition
+
+    async def asyncTearDown(self) -> None:
+        self.path.cleanup()
+
+    def test_transitions(self) -> None:
+        self.transition(1, 'child', 0, 1, 5)
+        self.assertEqual(self.steps[1], ('child', 0, 1, 5))
+        self.transition(1, 'remove_child')
+        self.assertNotIn(1, self.steps)
+
+        # Кнопка удаления ребенка со старого сообщения не прерывает ожидание другого ответа.
+        self.transition(1, 'checkIn')
+        self.transition(1, 'remove_child')
+        self.assertEqual(self.steps[1], ('checkIn',))
+
+        self.transition(1, 'main_command')
+        self.assertEqual(self.steps[1], ('main_city',))
+        self.transition(1, 'main_city', 'main_city123')
+        self.assertEqual(self.steps[1], ('main_hotels', 'main_city123'))
+
+    def test_every_state_has_handler(self) -> None:
+        states = {state for state in HotelBot.HotelBot.STEP_TRANSITIONS.values() if state is not None}
+        self.assertEqual(states, set(self.bot._HotelBot__step_handlers))
+
+    async def test_answer(self) -> None:
+        answers = []
+
+        async def handler(message: types.Message, *args) -> None:
+            answers.append((message.text, args, dict(self.steps)))
+
+        self.bot._HotelBot__step_handlers['bestdeal_filters'] = handler
+        self.transition(1, 'bestdeal_filters', 'price', 'min')
+        await self.bot._HotelBot__next_step_handler(types.Message.de_json(
+            {'message_id': 1, 'date': int(time.time()), 'text': '100', 'chat': {'id': 1, 'type': 'private'},
+             'from': {'id': 1, 'is_bot': False, 'first_name': 'User'}}))
+        # Обработчик получает аргументы шага, а чат к этому времени уже не ждет ответа.
+        self.assertEqual(answers, [('100', ('price', 'min'), {})])
+
+
+if __name__ == '__main__':
+    unittest.main()